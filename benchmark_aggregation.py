@@ -0,0 +1,79 @@
+# benchmark_aggregation.py (отдельный файл для локального замера)
+# Сравнивает бэкенды агрегации отчётов (bot/utils/aggregation.py) на синтетических продажах
+# и показывает, с какого размера набора numpy быстрее чистого Python — это значение для
+# AGGREGATION_NUMPY_MIN_ROWS в .env. Заодно проверяет, что оба бэкенда дают одинаковый результат.
+#
+# Запуск: python benchmark_aggregation.py [размер ...]
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+from bot.utils.aggregation import PythonBackend, NumpyBackend, np
+from bot.utils.sales_dataset import SalesDataset, PRICE_TYPES
+from bot.utils.sales_grouping import group_sales_by_warehouse, group_sales_by_warehouse_name
+
+SIZES = [500, 1000, 2000, 5000, 10000, 50000, 100000, 300000]
+WAREHOUSES = [{"id": i, "name": f"Склад {i}"} for i in range(1, 41)]
+REPEAT = 5
+
+
+def make_dataset(rows: int) -> SalesDataset:
+    rnd = random.Random(rows)
+    start = date(2025, 1, 1)
+    data = []
+    for _ in range(rows):
+        wh = rnd.choice(WAREHOUSES)
+        price = round(rnd.uniform(100, 5000), 2)
+        data.append({
+            "day": start + timedelta(days=rnd.randrange(90)),
+            # Часть строк без ID склада — сопоставляются по названию
+            "warehouseId": wh["id"] if rnd.random() > 0.05 else None,
+            "warehouseName": wh["name"],
+            "supplierArticle": f"ART-{rnd.randrange(2000)}",
+            "qty": rnd.randint(1, 3),
+            **{pt: price * k for pt, k in zip(PRICE_TYPES, (1.0, 0.8, 0.75, 0.6))},
+        })
+    return SalesDataset.from_rows(data)
+
+
+def best_time(func) -> float:
+    best = float("inf")
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    if np is None:
+        print("numpy не установлен — сравнивать не с чем (pip install numpy)")
+        return
+    sizes = [int(s) for s in sys.argv[1:]] or SIZES
+    python, numpy = PythonBackend(), NumpyBackend()
+    crossover = None
+
+    print(f"{'строк':>8} | {'python, мс':>11} | {'numpy, мс':>10} | {'ускорение':>9}")
+    for rows in sizes:
+        dataset = make_dataset(rows)
+        by_python = group_sales_by_warehouse(dataset, WAREHOUSES, backend=python)
+        by_numpy = group_sales_by_warehouse(dataset, WAREHOUSES, backend=numpy)
+        assert by_python == by_numpy, f"результаты бэкендов различаются на {rows} строках"
+        assert (group_sales_by_warehouse_name(dataset, backend=python)
+                == group_sales_by_warehouse_name(dataset, backend=numpy))
+
+        t_python = best_time(lambda: group_sales_by_warehouse(dataset, WAREHOUSES, backend=python))
+        t_numpy = best_time(lambda: group_sales_by_warehouse(dataset, WAREHOUSES, backend=numpy))
+        if crossover is None and t_numpy < t_python:
+            crossover = rows
+        print(f"{rows:>8} | {t_python * 1000:>11.2f} | {t_numpy * 1000:>10.2f} | {t_python / t_numpy:>8.1f}x")
+
+    if crossover is None:
+        print("numpy не обогнал Python на этих размерах")
+    else:
+        print(f"Точка перелома: ~{crossover} строк -> AGGREGATION_NUMPY_MIN_ROWS={crossover}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,7 @@ bot/handlers/admin.py
 Интуитивная админка:
 - Разделы: Пользователи и Общее
 - Пользователи: список пользователей кнопками, действия (баланс, блок, аннулировать триал, удалить, инфо)
-- Общее: принудительное обновление складов, просмотр информации кеша складов
+- Общее: принудительное обновление складов, просмотр информации кеша складов, статистика запросов к WB
 - Все действия на inline-кнопках, доступ только для админов (ADMINS)
 """
 
@@ -20,7 +20,8 @@ from storage.warehouses import cache_warehouses, get_cache_update_info
 from bot.handlers.api_entry import get_warehouses  # твоя функция для запроса WB API
 from sqlalchemy import select, update, delete
 import logging
-from bot.services.wildberries_api import fetch_warehouses_from_api
+from bot.services.wildberries_api import fetch_warehouses_from_api, get_singleflight_stats
+from bot.services.report_cache import get_report_cache
 
 router = Router()
 
@@ -269,6 +270,7 @@ async def admin_common(callback: CallbackQuery):
         inline_keyboard=[
             [InlineKeyboardButton(text="🔄 Обновить склады", callback_data="admin_update_warehouses")],
             [InlineKeyboardButton(text="📋 Просмотреть информацию кеша складов", callback_data="admin_view_warehouses_cache")],
+            [InlineKeyboardButton(text="📈 Статистика запросов к WB", callback_data="admin_wb_stats")],
             [InlineKeyboardButton(text="⬅️ Назад", callback_data="admin_back")]
         ]
     )
@@ -297,6 +299,29 @@ async def admin_view_warehouses_cache(callback: CallbackQuery):
     await callback.answer()
 
 
+# --- Статистика запросов к WB (схлопывание одинаковых запросов) ---
+@router.callback_query(F.data == "admin_wb_stats")
+async def admin_wb_stats(callback: CallbackQuery):
+    if not is_admin(callback.from_user.id):
+        await callback.answer("⛔ Нет доступа.", show_alert=True)
+        return
+
+    lines = ["<b>Запросы к WB API (с момента запуска):</b>"]
+    for name, st in get_singleflight_stats().items():
+        lines.append(
+            f"• <b>{name}</b>: вызовов {st['calls']}, отправлено {st['executed']}, "
+            f"схлопнуто {st['collapsed']}, в полёте {st['in_flight']}"
+        )
+    lines.append("")
+    lines.append("<b>Кэш результатов отчётов:</b>")
+    for name, st in get_report_cache().stats().items():
+        total = st["hits"] + st["misses"]
+        rate = st["hits"] / total * 100 if total else 0.0
+        lines.append(f"• <b>{name}</b>: попаданий {st['hits']}, промахов {st['misses']} ({rate:.0f}%)")
+    await callback.message.edit_text("\n".join(lines), parse_mode="HTML", reply_markup=back_keyboard())
+    await callback.answer()
+
+
 @router.callback_query(F.data == "admin_update_warehouses")
 async def admin_update_warehouses(callback: CallbackQuery):
     if not is_admin(callback.from_user.id):
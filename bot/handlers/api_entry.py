@@ -7,7 +7,8 @@ from aiogram.fsm.state import StatesGroup, State
 from storage.users import (
     set_user_api_key, set_user_profile_info,
     update_user_id_by_seller_name)
-import aiohttp
+from bot.services.wb_client import wb_get
+from bot.services.wildberries_api import fetch_seller_info, SellerInfoUnavailable, SELLER_INFO_UNAVAILABLE_TEXT
 
 router = Router()
 
@@ -28,30 +29,30 @@ async def activate_trial(callback: CallbackQuery, state: FSMContext):
 async def save_api_key(message: Message, state: FSMContext):
     user_id = message.from_user.id
     api_key = message.text.strip()
-    url = 'https://common-api.wildberries.ru/api/v1/seller-info'
-    headers = {'Authorization': api_key}
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, headers=headers) as resp:
-            if resp.status == 200:
-                data = await resp.json()
-                seller_name = data.get('name', '—')
-                trade_mark = data.get('tradeMark', '—')
-                await set_user_api_key(user_id, api_key)
-                await set_user_profile_info(user_id, seller_name, trade_mark)
-                from storage.users import set_trial_access
-                from datetime import datetime, timedelta
-                now = datetime.utcnow()
-                trial_period = timedelta(days=1)
-                await set_trial_access(user_id, now + trial_period)
-                await state.clear()
-                from bot.handlers.main_menu import main_menu
-                await message.answer(
-                    "✅ Новый API-ключ сохранён и активирован пробный доступ.\n\nВы возвращены в главное меню.",
-                    reply_markup=ReplyKeyboardRemove()
-                )
-                await main_menu(message, user_id=user_id)
-            else:
-                await message.answer("❌ Ключ невалиден. Попробуйте ввести другой ключ или нажмите /start.")
+    try:
+        data = await fetch_seller_info(api_key)
+    except SellerInfoUnavailable:
+        await message.answer(SELLER_INFO_UNAVAILABLE_TEXT)
+        return
+    if data is not None:
+        seller_name = data.get('name', '—')
+        trade_mark = data.get('tradeMark', '—')
+        await set_user_api_key(user_id, api_key)
+        await set_user_profile_info(user_id, seller_name, trade_mark)
+        from storage.users import set_trial_access
+        from datetime import datetime, timedelta
+        now = datetime.utcnow()
+        trial_period = timedelta(days=1)
+        await set_trial_access(user_id, now + trial_period)
+        await state.clear()
+        from bot.handlers.main_menu import main_menu
+        await message.answer(
+            "✅ Новый API-ключ сохранён и активирован пробный доступ.\n\nВы возвращены в главное меню.",
+            reply_markup=ReplyKeyboardRemove()
+        )
+        await main_menu(message, user_id=user_id)
+    else:
+        await message.answer("❌ Ключ невалиден. Попробуйте ввести другой ключ или нажмите /start.")
 
 @router.callback_query(F.data == "restore_account")
 async def ask_restore_access(callback: CallbackQuery, state: FSMContext):
@@ -68,18 +69,18 @@ async def process_restore_api(message: Message, state: FSMContext):
     api_key = message.text.strip()
     user_id = message.from_user.id
 
-    url = 'https://common-api.wildberries.ru/api/v1/seller-info'
-    headers = {'Authorization': api_key}
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, headers=headers) as resp:
-            if resp.status != 200:
-                await message.answer("❌ Ключ невалиден. Попробуйте снова или нажмите /start.")
-                return
-            data = await resp.json()
-            seller_name = data.get('name')
-            if not seller_name:
-                await message.answer("Не удалось определить магазин по ключу.")
-                return
+    try:
+        data = await fetch_seller_info(api_key)
+    except SellerInfoUnavailable:
+        await message.answer(SELLER_INFO_UNAVAILABLE_TEXT)
+        return
+    if data is None:
+        await message.answer("❌ Ключ невалиден. Попробуйте снова или нажмите /start.")
+        return
+    seller_name = data.get('name')
+    if not seller_name:
+        await message.answer("Не удалось определить магазин по ключу.")
+        return
 
     from storage.users import find_archived_user_by_seller_name
     archived = await find_archived_user_by_seller_name(seller_name)
@@ -145,21 +146,20 @@ async def get_warehouses(api_key=None):
     print(f"HEADERS: {headers}")
     # -------------------
 
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, headers=headers) as resp:
-            status = resp.status
-            text = await resp.text()
-            # --- И сюда, после запроса ---
-            print(f"[DEBUG] Статус ответа: {status}")
-            print(f"[DEBUG] Ответ WB API:\n{text}\n")
-            # -----------------------------
-
-            if status == 200:
-                try:
-                    return await resp.json()
-                except Exception:
-                    return []
-            elif status == 409:
-                raise Exception("Лимит запросов WB API превышен. Подождите 1-2 минуты и попробуйте снова.")
-            else:
-                raise Exception(f"Ошибка WB API: {status} {text}")
+    async with wb_get(url, headers=headers) as resp:
+        status = resp.status
+        text = await resp.text()
+        # --- И сюда, после запроса ---
+        print(f"[DEBUG] Статус ответа: {status}")
+        print(f"[DEBUG] Ответ WB API:\n{text}\n")
+        # -----------------------------
+
+        if status == 200:
+            try:
+                return await resp.json()
+            except Exception:
+                return []
+        elif status == 409:
+            raise Exception("Лимит запросов WB API превышен. Подождите 1-2 минуты и попробуйте снова.")
+        else:
+            raise Exception(f"Ошибка WB API: {status} {text}")
@@ -13,7 +13,7 @@ from storage.users import (
     remove_user_account
 
 )
-import aiohttp
+from bot.services.wildberries_api import fetch_seller_info, SellerInfoUnavailable, SELLER_INFO_UNAVAILABLE_TEXT
 from datetime import datetime
 
 router = Router()
@@ -103,28 +103,28 @@ async def replace_api(callback: CallbackQuery, state: FSMContext):
 @router.message(ProfileStates.waiting_for_new_api_key)
 async def input_new_api_key(message: Message, state: FSMContext):
     new_api_key = message.text.strip()
-    url = 'https://common-api.wildberries.ru/api/v1/seller-info'
-    headers = {'Authorization': new_api_key}
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, headers=headers) as resp:
-            if resp.status != 200:
-                await message.answer("❌ Ключ невалиден, попробуйте другой ключ.")
-                return
-            data = await resp.json()
-            seller_name = data.get('name', '—')
-            user_id = message.from_user.id
-            profile = await get_user_profile_info(user_id)
-            if seller_name != getattr(profile, "seller_name", None):
-                await message.answer("❌ Ключ не соответствует вашему магазину. Добавьте ключ от текущего магазина.")
-                return
-            await state.update_data(new_api_key=new_api_key)
-            await message.answer(" ", reply_markup=ReplyKeyboardRemove())
-            await message.answer(
-                f"✅ Новый ключ для магазина <b>{seller_name}</b>.\n\nПодтвердить замену?",
-                parse_mode="HTML",
-                reply_markup=api_change_keyboard()
-            )
-            await state.set_state(ProfileStates.waiting_for_api_key_confirm)
+    try:
+        data = await fetch_seller_info(new_api_key)
+    except SellerInfoUnavailable:
+        await message.answer(SELLER_INFO_UNAVAILABLE_TEXT)
+        return
+    if data is None:
+        await message.answer("❌ Ключ невалиден, попробуйте другой ключ.")
+        return
+    seller_name = data.get('name', '—')
+    user_id = message.from_user.id
+    profile = await get_user_profile_info(user_id)
+    if seller_name != getattr(profile, "seller_name", None):
+        await message.answer("❌ Ключ не соответствует вашему магазину. Добавьте ключ от текущего магазина.")
+        return
+    await state.update_data(new_api_key=new_api_key)
+    await message.answer(" ", reply_markup=ReplyKeyboardRemove())
+    await message.answer(
+        f"✅ Новый ключ для магазина <b>{seller_name}</b>.\n\nПодтвердить замену?",
+        parse_mode="HTML",
+        reply_markup=api_change_keyboard()
+    )
+    await state.set_state(ProfileStates.waiting_for_api_key_confirm)
 
 # --- Кнопка "ОК" (подтверждение смены ключа) ---
 @router.callback_query(ProfileStates.waiting_for_api_key_confirm, F.data == "confirm_api_change")
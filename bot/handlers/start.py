@@ -20,7 +20,7 @@ from storage.users import (
     find_user_by_seller_name, find_archived_user_by_seller_name, update_user_id_by_seller_name,
     update_balance_on_access, has_active_access
 )
-from bot.services.wildberries_api import get_all_articles_from_stocks
+from bot.services.stock_sync import get_articles_from_stocks
 from storage.articles import cache_articles
 from storage.warehouses import need_update_warehouses_cache, cache_warehouses
 from bot.services.wildberries_api import fetch_warehouses_from_api
@@ -59,7 +59,7 @@ async def cmd_start(message: Message, state: FSMContext):
     api_key = await get_user_api_key(user_id)
     if api_key:
         try:
-            articles = await get_all_articles_from_stocks(api_key)
+            articles = await get_articles_from_stocks(user_id, api_key)
             if articles:
                 await cache_articles(user_id, articles)
                 logging.info(f"[ARTICLES] ✅ Артикулы обновлены для user_id={user_id}, всего: {len(articles)}")
@@ -4,7 +4,6 @@ from os import getenv
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types.bot_command import BotCommand
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
@@ -17,7 +16,20 @@ from bot.reports import remains
 from bot.reports.sales_by_articles import router as sales_by_articles_router
 from bot.reports import sales_by_warehouses
 
+from bot.services.wb_client import start_wb_client, close_wb_client
+from bot.services.rate_limiter import close_rate_limiter
+from bot.services.report_store import close_report_store
+from bot.services.report_cache import close_report_cache
+from bot.services.stocks_cache import close_stocks_cache
+from bot.services.export_cache import close_export_cache
+from bot.services.fsm_storage import create_fsm_storage
+from bot.services.process_pool import start_process_pool, close_process_pool
+from bot.services.prefetch import prefetch_all_users  # ночная предзагрузка продаж/остатков
+
+from config import PREFETCH_ENABLED, PREFETCH_HOUR
+
 from storage.db import engine, Base
+from storage.sales import migrate_sales_rollup
 from storage.users import daily_balance_update  # массовая актуализация баланса
 
 logging.basicConfig(level=logging.INFO)
@@ -27,6 +39,7 @@ logger = logging.getLogger(__name__)
 async def async_db_init():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    await migrate_sales_rollup()
 
 
 async def on_startup(bot: Bot):
@@ -42,12 +55,18 @@ async def main():
     # Инициализация БД (async)
     await async_db_init()
 
+    # Общий пул HTTP-соединений к WB API
+    await start_wb_client()
+
+    # Пул процессов для тяжёлых группировок и сборки XLSX (PROCESS_POOL_SIZE)
+    start_process_pool()
+
     # Инициализация бота и диспетчера
     bot = Bot(
         token=BOT_TOKEN,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML),
     )
-    dp = Dispatcher(storage=MemoryStorage())
+    dp = Dispatcher(storage=create_fsm_storage())  # FSM_STORAGE: memory | redis
 
     # Регистрация роутеров (важно: api_entry — первым)
     dp.include_router(api_entry.router)
@@ -75,6 +94,9 @@ async def main():
     # Если нужна именно UTC-полночь — поменять timezone на "UTC".
     scheduler = AsyncIOScheduler(timezone="Europe/Berlin")
     scheduler.add_job(daily_balance_update, "cron", hour=0, minute=0)  # ежедневно в 00:00
+    # Предзагрузка данных WB; при отдельных воркерах (python -m bot.services.prefetch) — PREFETCH_ENABLED=0
+    if PREFETCH_ENABLED:
+        scheduler.add_job(prefetch_all_users, "cron", hour=PREFETCH_HOUR, minute=0)
     scheduler.start()
 
     try:
@@ -82,9 +104,17 @@ async def main():
         # но если у тебя уже работает такой вызов — оставим.
         await dp.start_polling(bot, on_startup=on_startup)
     finally:
-        # Сначала гасим планировщик, потом закрываем сессию бота
+        # Сначала гасим планировщик, потом закрываем сессию бота и пул WB API
         scheduler.shutdown(wait=False)
         await bot.session.close()
+        await dp.storage.close()
+        await close_wb_client()
+        await close_rate_limiter()
+        await close_report_store()
+        await close_report_cache()
+        await close_stocks_cache()
+        await close_export_cache()
+        await close_process_pool()
 
 
 if __name__ == "__main__":
@@ -5,16 +5,24 @@ from aiogram.fsm.state import StatesGroup, State
 from aiogram_calendar import SimpleCalendar, SimpleCalendarCallback
 import math
 from storage.users import get_user_api_key
-from bot.services.wildberries_api import get_sales_report_for_period, get_stocks
+from bot.services.sales_sync import get_sales_dataset_for_period
+from bot.services.wildberries_api import wait_for_sales_quota
+from bot.utils.sales_grouping import group_sales_by_warehouse_name
+from bot.services.report_store import get_report_store, REPORT_EXPIRED_TEXT
+from bot.services.report_cache import get_report_cache, get_cached_page, remember_page, report_version
 from bot.utils.pagination import build_pagination_keyboard
 from bot.utils.calendar import ( remove_builtin_calendar_buttons )
 import logging
 from storage.articles import get_all_articles  # добавь, если ещё нет
 from storage.articles import get_in_stock_articles
 from keyboards.keyboards import sales_price_type_keyboard
-from storage.users import get_user_price_type, set_user_price_type
+from storage.users import get_user_price_type, set_user_price_type, get_user_warehouse_filter
 from bot.keyboards.keyboards import price_type_human
 from bot.utils.calendar import get_simple_calendar
+from bot.utils.xlsx_export import bold
+from bot.utils.exporters import send_export
+from bot.utils.progress import ProgressReporter
+from bot.services.process_pool import run_heavy
 
 router = Router()
 PAGE_SIZE_ARTICLES = 10
@@ -32,6 +40,17 @@ class ArticleDayCalendarFSM(StatesGroup):
 # --- Форматирование Telegram-отчёта ---
    # ← вот это обязательно!
 
+def stat_for_price(stat, price_type):
+    """Строки отчёта {склад: [{"qty", "sums"}]} в виде для выбранного типа цены: {"qty", "price", "sum"}."""
+    return {
+        wh: [
+            {"qty": s["qty"], "price": s["first"][price_type], "sum": s["sums"][price_type]}
+            for s in sales
+        ]
+        for wh, sales in stat.items()
+    }
+
+
 def format_sales_report(art, date_from, date_to, stat, price_type_name, page=1, page_size=PAGE_SIZE_REPORT):
     wh_list = list(stat.items())
     total_pages = max(1, math.ceil(len(wh_list) / page_size))
@@ -211,7 +230,7 @@ async def article_period_end(callback: CallbackQuery, callback_data: SimpleCalen
             parse_mode="HTML"
         )
         # --- ОДИН ЗАПРОС к WB, сохраняем в state ---
-        await show_sales_article_report(callback, state, start_date, end_date, page=1)
+        await show_sales_article_report(callback, state, start_date, end_date, page=1, data=data)
         # Не очищаем state здесь!
 
 @router.callback_query(F.data == "article_choose_day")
@@ -251,47 +270,66 @@ async def start_article_day_calendar(callback, state):
     await callback.message.edit_text("🗓 <b>Выберите дату</b>", reply_markup=kb, parse_mode="HTML")
 
 # --- Основная функция формирования и показа отчёта ---
-async def show_sales_article_report(callback, state, date_from, date_to, page: int = 1):
-    data = await state.get_data()
+async def show_sales_article_report(callback, state, date_from, date_to, page: int = 1, data: dict = None):
+    if data is None:  # вызывающий обработчик мог уже прочитать состояние — не читаем второй раз
+        data = await state.get_data()
     art = data.get("article")
-    if page == 1 or not data.get("article_report"):
-        user_id = callback.from_user.id
+    user_id = callback.from_user.id
+    store = get_report_store()
+    report = None if page == 1 else await store.get(user_id, data.get("article_report_id"))
+    price_type = await get_user_price_type(user_id)
+    price_type_name = price_type_human(price_type)
+    if report is None:
         api_key = await get_user_api_key(user_id)
-        sales = await get_sales_report_for_period(api_key, date_from, date_to)
-        price_type = await get_user_price_type(user_id)
-        price_type_name = price_type_human(price_type)
-        # ВАЖНО! Получаем выбранный пользователем тип цены
-        price_type = await get_user_price_type(user_id)
-
-        stat = {}
-        for item in sales:
-            if str(item.get("supplierArticle")) != str(art):
-                continue
-            wh_name = item.get("warehouseName", "—")
-            price_val = float(item.get(price_type, 0))
-            qty_val = int(item.get("quantity", 1))
-            stat.setdefault(wh_name, [])
-            stat[wh_name].append({
-                "qty": qty_val,
-                "price": price_val,
-                "sum": price_val * qty_val,
-            })
-        await state.update_data(article_report={
-            "stat": stat,
-            "art": art,
-            "date_from": date_from,
-            "date_to": date_to,
-        })
+
+        # Тот же отчёт недавно уже строился — берём готовый результат без WB и БД
+        cache = get_report_cache()
+        warehouse_filter = await get_user_warehouse_filter(user_id)
+        cache_key = cache.make_key(user_id, "article", date_from, date_to, warehouse_filter, art)
+        report = await cache.get(cache_key, "article")
+
+        async with ProgressReporter(callback.message) as progress:
+            while report is None:
+                # Набор за период общий с отчётом по складам; строки артикула — по индексу, без перебора всех продаж
+                result = await get_sales_dataset_for_period(user_id, api_key, date_from, date_to)
+                if isinstance(result, dict) and result.get("error") == "ratelimit":
+                    await wait_for_sales_quota(api_key, result["retry"], lambda eta: progress.update(
+                        f"⏳ Отчет будет загружен не ранее чем через: <b>{eta} сек.</b>"
+                    ))
+                    continue
+                elif isinstance(result, dict) and result.get("error"):
+                    await callback.message.answer("❌ Ошибка при запросе отчёта.")
+                    return
+
+                # Суммы сразу по всем типам цен — смена типа цены не требует нового запроса
+                article_rows = result.rows_for_article(art)
+                by_warehouse = await run_heavy(group_sales_by_warehouse_name, article_rows, size=len(article_rows))
+                stat = {wh_name: [group] for wh_name, group in by_warehouse.items()}
+                report = {
+                    "stat": stat,
+                    "art": art,
+                    "date_from": date_from,
+                    "date_to": date_to,
+                }
+                await cache.set(cache_key, report)
+
+        # В FSM — только handle, данные отчёта — в хранилище отчётов
+        await store.drop(user_id, data.get("article_report_id"))
+        handle = await store.put(user_id, report)
+        await state.update_data(article_report_id=handle)
     else:
-        # Берём сохранённые в FSM данные (без нового запроса!)
-        stat = data["article_report"]["stat"]
-        art = data["article_report"]["art"]
-        date_from = data["article_report"]["date_from"]
-        date_to = data["article_report"]["date_to"]
-
-    text, total_pages = format_sales_report(
-        art, date_from, date_to, stat, price_type_name, page=page, page_size=PAGE_SIZE_REPORT
-    )
+        handle = data.get("article_report_id")
+
+    # Берём сохранённый отчёт (без нового запроса!)
+    stat = report["stat"]
+    page_key = f"show:{price_type}:{page}"
+    text = await get_cached_page(report, page_key)
+    if text is None:
+        text, total_pages = format_sales_report(
+            report["art"], report["date_from"], report["date_to"], stat_for_price(stat, price_type), price_type_name,
+            page=page, page_size=PAGE_SIZE_REPORT
+        )
+        await remember_page(user_id, handle, report, page_key, text)
     kb = build_pagination_keyboard(
         total=len(stat),
         page=page,
@@ -309,25 +347,33 @@ async def show_sales_article_report(callback, state, date_from, date_to, page: i
 async def article_report_pagination(callback: CallbackQuery, state: FSMContext):
     page = int(callback.data.split(":")[1])
     data = await state.get_data()
-    report = data.get("article_report")
-    if not report or not report.get("stat"):
+    user_id = callback.from_user.id
+    handle = data.get("article_report_id")
+    report = await get_report_store().get(user_id, handle)
+    if report is None:
+        await callback.answer(REPORT_EXPIRED_TEXT, show_alert=True)
+        return
+    if not report.get("stat"):
         await callback.message.answer("Нет данных для отчёта.")
         return
 
-    # Получаем user_id, price_type и его текстовое описание
-    user_id = callback.from_user.id
+    # Получаем price_type и его текстовое описание
     price_type = await get_user_price_type(user_id)
     price_type_name = price_type_human(price_type)
 
-    text, total_pages = format_sales_report(
-        report["art"],
-        report["date_from"],
-        report["date_to"],
-        report["stat"],
-        price_type_name,           # ← теперь передаём сюда!
-        page=page,
-        page_size=PAGE_SIZE_REPORT
-    )
+    page_key = f"page:{price_type}:{page}"
+    text = await get_cached_page(report, page_key)
+    if text is None:
+        text, total_pages = format_sales_report(
+            report["art"],
+            report["date_from"],
+            report["date_to"],
+            stat_for_price(report["stat"], price_type),
+            price_type_name,           # ← теперь передаём сюда!
+            page=page,
+            page_size=PAGE_SIZE_REPORT
+        )
+        await remember_page(user_id, handle, report, page_key, text)
 
     kb = build_pagination_keyboard(
         total=len(report["stat"]),
@@ -364,76 +410,45 @@ async def article_day_cancel(callback: CallbackQuery, state: FSMContext):
     else:
         await open_sales_by_articles_menu(callback, state)
     # И здесь не нужно await state.clear()
+def _article_xlsx_rows(price_type_name, art, period, stat):
+    """Строки XLSX отчёта по артикулу (собирается в пуле процессов)."""
+    # Вид цены в отчёте и шапка таблицы
+    yield [f"Цена: {price_type_name}"]
+    yield []
+    yield bold(["Артикул", "Период", "Склад", "Кол-во", "Цена", "Сумма"], center=True)
+    grand_qty = 0
+    grand_sum = 0.0
+    for wh, sales in stat.items():
+        for sale in sales:
+            yield [art, period, wh, sale["qty"], sale["price"], sale["sum"]]
+            grand_qty += sale["qty"]
+            grand_sum += sale["sum"]
+    yield []
+    yield bold(["", "", "ИТОГО", grand_qty, "", grand_sum])
+
+
 # --- Экспорт в CSV ---
 @router.callback_query(F.data == "export_article_csv")
 async def export_article_xlsx(callback: CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    report = data.get("article_report")
-    if not report or not report.get("stat"):
+    user_id = callback.from_user.id
+    report = await get_report_store().get(user_id, data.get("article_report_id"))
+    if report is None:
+        await callback.answer(REPORT_EXPIRED_TEXT, show_alert=True)
+        return
+    if not report.get("stat"):
         await callback.message.answer("Нет данных для экспорта.")
         return
 
-    user_id = callback.from_user.id
     price_type = await get_user_price_type(user_id)
     from bot.keyboards.keyboards import price_type_human
     price_type_name = price_type_human(price_type)
 
-    from openpyxl import Workbook
-    from openpyxl.utils import get_column_letter
-    from openpyxl.styles import Font, Alignment
-    import io
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Sales"
-
-    # Вид цены в отчёте
-    ws.append([f"Цена: {price_type_name}"])
-    ws.append([])
-
-    # Шапка таблицы
-    ws.append(["Артикул", "Период", "Склад", "Кол-во", "Цена", "Сумма"])
-    for cell in ws[3]:
-        cell.font = Font(bold=True)
-        cell.alignment = Alignment(horizontal="center", vertical="center")
-
     art = report["art"]
-    date_from = report["date_from"].strftime("%d.%m.%Y")
-    date_to = report["date_to"].strftime("%d.%m.%Y")
-    stat = report["stat"]
-
-    # Данные
-    for wh, sales in stat.items():
-        for sale in sales:
-            ws.append([
-                art,
-                f"{date_from} — {date_to}",
-                wh,
-                sale["qty"],
-                sale["price"],
-                sale["sum"]
-            ])
-
-    # Итоги
-    grand_qty = sum(sum(s['qty'] for s in sales) for sales in stat.values())
-    grand_sum = sum(sum(s['sum'] for s in sales) for sales in stat.values())
+    period = f"{report['date_from'].strftime('%d.%m.%Y')} — {report['date_to'].strftime('%d.%m.%Y')}"
+    stat = stat_for_price(report["stat"], price_type)
 
-    ws.append([])
-    ws.append(["", "", "ИТОГО", grand_qty, "", grand_sum])
-    for i, cell in enumerate(ws[ws.max_row], 1):
-        if cell.value == "ИТОГО":
-            cell.font = Font(bold=True)
-
-    # Красиво растянуть колонки
-    for i, col in enumerate(ws.columns, 1):
-        max_length = max(len(str(cell.value) if cell.value else "") for cell in col)
-        ws.column_dimensions[get_column_letter(i)].width = max(10, max_length + 2)
-
-    # Сохраняем в память
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
-
-    from aiogram.types.input_file import BufferedInputFile
-    file = BufferedInputFile(output.read(), "sales_article_report.xlsx")
-    await callback.message.answer_document(file, caption="Отчёт по продажам (XLSX)")
+    await send_export(callback.message, "sales_article_report", "xlsx", _article_xlsx_rows,
+                      (price_type_name, art, period, stat), title="Sales",
+                      caption="Отчёт по продажам (XLSX)", min_width=10,
+                      version=report_version(report, price_type))
@@ -6,18 +6,18 @@ from aiogram_calendar import SimpleCalendar, SimpleCalendarCallback
 from datetime import datetime
 from storage.warehouses import get_cached_warehouses_dicts
 from storage.users import get_user_api_key
-from bot.services.wildberries_api import get_sales_report_for_period
 from bot.utils.pagination import build_pagination_keyboard
 from bot.utils.calendar import remove_builtin_calendar_buttons
-from utils.text_utils import normalize_warehouse_name
-from bot.services.wildberries_api import get_sales_report_with_eta
-import io
-from aiogram.types.input_file import BufferedInputFile
-import openpyxl
-from openpyxl.utils import get_column_letter
-from openpyxl.styles import Font
+from bot.services.sales_sync import get_sales_dataset_for_period
+from bot.services.wildberries_api import wait_for_sales_quota
+from bot.utils.sales_grouping import group_sales_by_warehouse, select_price
+from bot.services.report_store import get_report_store, REPORT_EXPIRED_TEXT
+from bot.services.report_cache import get_report_cache, get_cached_page, remember_page, report_version
+from bot.utils.xlsx_export import bold
+from bot.utils.exporters import send_export
+from bot.utils.progress import ProgressReporter
+from bot.services.process_pool import run_heavy
 from storage.users import get_user_warehouse_filter
-import asyncio
 from storage.users import get_user_price_type
 from bot.keyboards.keyboards import price_type_human
 from bot.utils.calendar import get_simple_calendar
@@ -169,7 +169,7 @@ async def period_calendar_end_wh(callback: CallbackQuery, callback_data: SimpleC
             await callback.message.answer("⚠️ Конец должен быть позже начала.")
             return await start_warehouse_period_calendar(callback, state)
 
-        await show_sales_report(callback, data.get("sales_wh_id"), start_date, end_date, all_warehouses=False, state=state, page=1)
+        await show_sales_report(callback, data.get("sales_wh_id"), start_date, end_date, all_warehouses=False, state=state, page=1, data=data)
 
 @router.callback_query(SimpleCalendarCallback.filter(), WarehouseDayCalendarFSM.choosing_day)
 async def day_selected_wh(callback: CallbackQuery, callback_data: SimpleCalendarCallback, state: FSMContext):
@@ -180,7 +180,7 @@ async def day_selected_wh(callback: CallbackQuery, callback_data: SimpleCalendar
        # await callback.message.edit_text(
         #    f"✅ <b>Дата:</b> <code>{date.strftime('%d.%m.%Y')}</code>\n⏳ Готовим...", parse_mode="HTML"
         #)
-        await show_sales_report(callback, data.get("sales_wh_id"), date, date, all_warehouses=False, state=state, page=1)
+        await show_sales_report(callback, data.get("sales_wh_id"), date, date, all_warehouses=False, state=state, page=1, data=data)
 
 # --- Обработчики отмены календаря ---
 @router.callback_query(F.data == "period_calendar_cancel", WarehousePeriodCalendarFSM.waiting_for_start)
@@ -202,6 +202,19 @@ async def warehouse_day_cancel(callback: CallbackQuery, state: FSMContext):
     else:
         await open_sales_by_warehouses_menu(callback, state)
 
+async def _warehouse_stat(report: dict, warehouse_id, price_type: str):
+    """Название склада и агрегаты по его артикулам: группировка — одна на отчёт, тип цены — только вид."""
+    if "grouped" not in report:
+        warehouses = await get_cached_warehouses_dicts()
+        wh = next((w for w in warehouses if str(w["id"]) == str(warehouse_id)), None)
+        report["wh_name"] = wh.get("name", f"ID {warehouse_id}") if wh else f"ID {warehouse_id}"
+        report["grouped"] = await run_heavy(
+            group_sales_by_warehouse, report["dataset"], [wh] if wh else [], size=len(report["dataset"]),
+        )
+    wh_name = report["wh_name"]
+    group = select_price(report["grouped"], price_type)["warehouses"].get(wh_name)
+    return wh_name, group["articles"] if group else {}
+
 # --- Пагинация по артикулам внутри склада ---
 @router.callback_query(F.data.startswith("sales_wh_page:"))
 async def sales_wh_page(callback: CallbackQuery, state: FSMContext):
@@ -212,31 +225,31 @@ async def sales_wh_page(callback: CallbackQuery, state: FSMContext):
         await callback.message.answer("Ошибка пагинации: некорректный номер страницы!")
         return
     data = await state.get_data()
+    user_id = callback.from_user.id
     warehouse_id = data.get("warehouse_id")
     date_from = data.get("date_from")
     date_to = data.get("date_to")
-    sales = data.get("sales_report", [])
-    warehouses = await get_cached_warehouses_dicts()
-    wh = next((w for w in warehouses if str(w["id"]) == str(warehouse_id)), None)
-    wh_name = wh.get("name", f"ID {warehouse_id}") if wh else f"ID {warehouse_id}"
-    wh_name_norm = normalize_warehouse_name(wh_name)
-
-    # Фильтрация и разбиение на страницы
-    stat = {}
-    for item in sales:
-        sale_warehouse = normalize_warehouse_name(item.get("warehouseName", ""))
-        if sale_warehouse != wh_name_norm:
-            continue
-        art = item.get("supplierArticle", "—")
-        price = float(item.get("priceWithDisc", 0))
-        if art not in stat:
-            stat[art] = {"qty": 0, "sum": 0.0, "price": price}
-        stat[art]["qty"] += 1
-        stat[art]["sum"] += price
+    handle = data.get("sales_report_id")
+    report = await get_report_store().get(user_id, handle)
+    if report is None:
+        await callback.answer(REPORT_EXPIRED_TEXT, show_alert=True)
+        return
+    price_type = await get_user_price_type(user_id)
+    wh_name, stat = await _warehouse_stat(report, warehouse_id, price_type)
 
+    # Разбиение на страницы
     arts = list(stat.items())
     total_pages = max(1, (len(arts) + PAGE_SIZE_REPORT - 1) // PAGE_SIZE_REPORT)
     page = max(1, min(page, total_pages))
+    kb = build_pagination_keyboard(len(arts), page, PAGE_SIZE_REPORT, "sales_wh_page:", f"sales_wh_menu:{warehouse_id}")
+    kb.inline_keyboard.append([InlineKeyboardButton(text="📥 Экспорт в Excel", callback_data="sales_wh_export_xlsx")])
+
+    page_key = f"page:{price_type}:{page}"
+    text = await get_cached_page(report, page_key)
+    if text is not None:
+        await callback.message.edit_text(text, parse_mode="HTML", reply_markup=kb)
+        return
+
     start = (page - 1) * PAGE_SIZE_REPORT
     end = start + PAGE_SIZE_REPORT
     arts_page = arts[start:end]
@@ -258,8 +271,7 @@ async def sales_wh_page(callback: CallbackQuery, state: FSMContext):
         f"\nСтраница {page}/{total_pages}"
     )
 
-    kb = build_pagination_keyboard(len(arts), page, PAGE_SIZE_REPORT, "sales_wh_page:", f"sales_wh_menu:{warehouse_id}")
-    kb.inline_keyboard.append([InlineKeyboardButton(text="📥 Экспорт в Excel", callback_data="sales_wh_export_xlsx")])
+    await remember_page(user_id, handle, report, page_key, text)
     await callback.message.edit_text(text, parse_mode="HTML", reply_markup=kb)
 from math import ceil
 
@@ -323,7 +335,7 @@ async def all_period_calendar_end(callback: CallbackQuery, callback_data: Simple
         if end_date < start_date:
             await callback.message.answer("⚠️ Конец должен быть позже начала.")
             return await sales_all_wh_period(callback, state)
-        await show_sales_report_all_warehouses(callback, start_date, end_date, state=state, page=1)
+        await show_sales_report_all_warehouses(callback, start_date, end_date, state=state, page=1, data=data)
 
 @router.callback_query(SimpleCalendarCallback.filter(), AllWarehousesDayCalendarFSM.choosing_day)
 async def all_day_selected(callback: CallbackQuery, callback_data: SimpleCalendarCallback, state: FSMContext):
@@ -354,7 +366,8 @@ async def show_sales_report(
         date_to,
         all_warehouses=False,
         state: FSMContext = None,
-        page: int = 1
+        page: int = 1,
+        data: dict = None
 ):
     page_size = 30
     user_id = callback.from_user.id
@@ -363,8 +376,11 @@ async def show_sales_report(
     price_type = await get_user_price_type(user_id)
     price_type_name = price_type_human(price_type)
 
-    data = await state.get_data()
-    if page == 1 or not data.get("sales_report"):
+    if data is None:  # вызывающий обработчик мог уже прочитать состояние — не читаем второй раз
+        data = await state.get_data()
+    store = get_report_store()
+    report = None if page == 1 else await store.get(user_id, data.get("sales_report_id"))
+    if report is None:
         if date_from == date_to:
             period_text = f"<b>{date_from.strftime('%d.%m.%Y')}</b>"
         else:
@@ -379,55 +395,62 @@ async def show_sales_report(
 
         api_key = await get_user_api_key(user_id)
 
-        while True:
-            result = await get_sales_report_with_eta(api_key, date_from, date_to)
-            if isinstance(result, dict) and result.get("error") == "ratelimit":
-                retry = result["retry"]
-                await progress_message.edit_text(
-                    f"✅ Формируем отчёт за период {period_text}.\n"
-                    f"💶 <b>Цена:</b> {price_type_name}\n"
-                    f"   Отчет будет загружен не ранее чем через: <b>{retry} сек.</b> ⏳",
-                    parse_mode="HTML"
-                )
-                await asyncio.sleep(retry)
-                continue
-            elif isinstance(result, dict) and result.get("error"):
-                await progress_message.edit_text("❌ Ошибка при запросе отчёта.", parse_mode="HTML")
-                return
-            else:
-                sales = result
-                break
-
+        # Тот же отчёт недавно уже строился — берём готовый результат без WB и БД
+        cache = get_report_cache()
+        warehouse_filter = await get_user_warehouse_filter(user_id)
+        cache_key = cache.make_key(user_id, "warehouse", date_from, date_to, warehouse_filter, warehouse_id)
+        report = await cache.get(cache_key, "warehouse")
+
+        async with ProgressReporter(progress_message) as progress:
+            while report is None:
+                result = await get_sales_dataset_for_period(user_id, api_key, date_from, date_to)
+                if isinstance(result, dict) and result.get("error") == "ratelimit":
+                    await wait_for_sales_quota(api_key, result["retry"], lambda eta: progress.update(
+                        f"✅ Формируем отчёт за период {period_text}.\n"
+                        f"💶 <b>Цена:</b> {price_type_name}\n"
+                        f"   Отчет будет загружен не ранее чем через: <b>{eta} сек.</b> ⏳"
+                    ))
+                    continue
+                elif isinstance(result, dict) and result.get("error"):
+                    await progress.finish("❌ Ошибка при запросе отчёта.")
+                    return
+                else:
+                    # Только строки этого склада — по индексу набора, без перебора всех продаж
+                    warehouses = await get_cached_warehouses_dicts()
+                    wh = next((w for w in warehouses if str(w["id"]) == str(warehouse_id)), None)
+                    dataset = result.rows_for_warehouse(wh["id"]) if wh else result.take(())
+                    report = {"dataset": dataset, "date_from": date_from, "date_to": date_to}
+                    await cache.set(cache_key, report)
+
+        # В FSM — только handle, данные отчёта — в хранилище отчётов
+        await store.drop(user_id, data.get("sales_report_id"))
+        handle = await store.put(user_id, report)
         await state.update_data(
-            sales_report=sales,
+            sales_report_id=handle,
             date_from=date_from,
             date_to=date_to,
             warehouse_id=warehouse_id
         )
     else:
-        sales = data["sales_report"]
+        handle = data.get("sales_report_id")
 
-    warehouses = await get_cached_warehouses_dicts()
-    wh = next((w for w in warehouses if str(w["id"]) == str(warehouse_id)), None)
-    wh_name = wh.get("name", f"ID {warehouse_id}") if wh else f"ID {warehouse_id}"
-    wh_name_norm = normalize_warehouse_name(wh_name)
-
-    # --- Группируем по артикулам: qty, price, sum
-    stat = {}
-    for item in sales:
-        sale_warehouse = normalize_warehouse_name(item.get("warehouseName", ""))
-        if sale_warehouse != wh_name_norm:
-            continue
-        art = item.get("supplierArticle", "—")
-        price = float(item.get(price_type, 0))
-        if art not in stat:
-            stat[art] = {"qty": 0, "sum": 0.0, "price": price}
-        stat[art]["qty"] += 1
-        stat[art]["sum"] += price
+    # --- Группируем по артикулам: qty, price (средняя), sum — из агрегатов склад × артикул
+    wh_name, stat = await _warehouse_stat(report, warehouse_id, price_type)
 
     arts = list(stat.items())
     total_pages = max(1, (len(arts) + page_size - 1) // page_size)
     page = max(1, min(page, total_pages))
+    kb = build_pagination_keyboard(len(arts), page, page_size, "sales_wh_page:", f"sales_wh_menu:{warehouse_id}")
+    kb.inline_keyboard.append([
+        InlineKeyboardButton(text="📊 Экспорт в Excel", callback_data="sales_wh_export_xlsx")
+    ])
+
+    page_key = f"show:{price_type}:{page}"
+    text = await get_cached_page(report, page_key)
+    if text is not None:
+        await callback.message.answer(text, reply_markup=kb, parse_mode="HTML")
+        return
+
     start = (page - 1) * page_size
     end = start + page_size
     arts_page = arts[start:end]
@@ -464,94 +487,85 @@ async def show_sales_report(
         all_sum_txt = f"{all_sum:,.2f}".replace(",", " ")
         text += f"\n<b>🧾 ИТОГО за период по складу: {all_qty} шт / {all_sum_txt} ₽</b>"
 
-    kb = build_pagination_keyboard(len(arts), page, page_size, "sales_wh_page:", f"sales_wh_menu:{warehouse_id}")
-    kb.inline_keyboard.append([
-        InlineKeyboardButton(text="📊 Экспорт в Excel", callback_data="sales_wh_export_xlsx")
-    ])
-
+    await remember_page(user_id, handle, report, page_key, text)
     await callback.message.answer(text, reply_markup=kb, parse_mode="HTML")
 
 
-    await progress_message.answer(text, reply_markup=kb, parse_mode="HTML")
+def _warehouse_xlsx_rows(price_type_name, period, wh_name, stat):
+    """Строки XLSX отчёта по складу (собирается в пуле процессов)."""
+    # Шапка с видом цены и периодом
+    yield [f"Цена: {price_type_name}"]
+    yield [f"Период отчёта: {period}"]
+    yield []
+    yield bold(["Склад", "Артикул", "Кол-во", "Цена", "Сумма"])
+    if stat:
+        total_qty = 0
+        total_sum = 0.0
+        for art, d in stat.items():
+            yield [wh_name, art, d["qty"], d["price"], d["sum"]]
+            total_qty += d["qty"]
+            total_sum += d["sum"]
+        yield [f"Итого по складу: {wh_name}", "", total_qty, "", total_sum]
+    else:
+        yield [wh_name, "Нет продаж", "", "", ""]
+
+
+def _all_warehouses_xlsx_rows(price_type_name, period, filtered_warehouses, grouping):
+    """Строки XLSX отчёта по всем складам (собирается в пуле процессов)."""
+    # Тип цены и период, затем заголовки (сумма и цена)
+    yield [f"Цена: {price_type_name}"]
+    yield [f"Период отчёта: {period}"]
+    yield []
+    yield bold(["Склад", "Артикул", "Кол-во продаж", "Цена", "Сумма"])
+    for wh in filtered_warehouses:
+        wh_name = wh["name"]
+        group = grouping["warehouses"].get(wh_name)
+        stat = group["articles"] if group else {}
+        if stat:
+            for art, d in stat.items():
+                yield [wh_name, art, d["qty"], d["price"], d["sum"]]
+            yield [f"Итого по складу: {wh_name}", "", group["qty"], "", group["sum"]]
+        else:
+            yield [wh_name, "Нет продаж", "", "", ""]
+        yield []  # Пустая строка между складами
+
 @router.callback_query(F.data == "sales_wh_export_xlsx")
 async def sales_wh_export_xlsx(callback: CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    sales = data.get("sales_report", [])
+    report = await get_report_store().get(callback.from_user.id, data.get("sales_report_id"))
+    if report is None:
+        await callback.answer(REPORT_EXPIRED_TEXT, show_alert=True)
+        return
     warehouse_id = data.get("warehouse_id")
     date_from = data.get("date_from")
     date_to = data.get("date_to")
-    warehouses = await get_cached_warehouses_dicts()
-    wh = next((w for w in warehouses if str(w["id"]) == str(warehouse_id)), None)
-    wh_name = wh.get("name", f"ID {warehouse_id}") if wh else f"ID {warehouse_id}"
-    wh_name_norm = normalize_warehouse_name(wh_name)
 
     user_id = callback.from_user.id
     price_type = await get_user_price_type(user_id)
     price_type_name = price_type_human(price_type)
 
-    # Собираем по артикулам: qty, price, sum
-    stat = {}
-    for item in sales:
-        sale_warehouse = normalize_warehouse_name(item.get("warehouseName", ""))
-        if sale_warehouse != wh_name_norm:
-            continue
-        art = item.get("supplierArticle", "—")
-        price_val = float(item.get(price_type, 0))
-        if art not in stat:
-            stat[art] = {"qty": 0, "sum": 0.0, "price": price_val}
-        stat[art]["qty"] += 1
-        stat[art]["sum"] += price_val
-
-    # Создаем Excel-файл
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Продажи по складу"
-
-    # Шапка с видом цены и периодом
-    ws.append([f"Цена: {price_type_name}"])
-    ws.append([f"Период отчёта: {date_from.strftime('%d.%m.%Y')} — {date_to.strftime('%d.%m.%Y')}"])
-    ws.append([])
+    # По артикулам: qty, price, sum — уже посчитаны для отчёта
+    wh_name, stat = await _warehouse_stat(report, warehouse_id, price_type)
 
-    # Заголовки
-    ws.append(["Склад", "Артикул", "Кол-во", "Цена", "Сумма"])
-    for cell in ws[4]:
-        cell.font = Font(bold=True)
-
-    total_qty = 0
-    total_sum = 0.0
-    if stat:
-        for art, d in stat.items():
-            ws.append([wh_name, art, d["qty"], d["price"], d["sum"]])
-            total_qty += d["qty"]
-            total_sum += d["sum"]
-        ws.append([f"Итого по складу: {wh_name}", "", total_qty, "", total_sum])
-    else:
-        ws.append([wh_name, "Нет продаж", "", "", ""])
-
-    # Автоподбор ширины столбцов
-    for col in ws.columns:
-        max_length = 0
-        col_letter = get_column_letter(col[0].column)
-        for cell in col:
-            if cell.value:
-                max_length = max(max_length, len(str(cell.value)))
-        ws.column_dimensions[col_letter].width = max_length + 2
-
-    buffer = io.BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-    file = BufferedInputFile(buffer.read(), filename="sales_warehouse_report.xlsx")
-    await callback.message.answer_document(file)
+    period = f"{date_from.strftime('%d.%m.%Y')} — {date_to.strftime('%d.%m.%Y')}"
+    await send_export(callback.message, "sales_warehouse_report", "xlsx",
+                      _warehouse_xlsx_rows, (price_type_name, period, wh_name, stat), title="Продажи по складу",
+                      version=report_version(report, price_type, warehouse_id, period))
 
 from storage.users import get_user_price_type
 from bot.keyboards.keyboards import price_type_human
 
+def _get_all_wh_grouping(report: dict, price_type: str) -> dict:
+    """Группировка отчёта по всем складам (строится один раз при загрузке) в виде для выбранного типа цены."""
+    return select_price(report["grouped"], price_type)
+
 async def show_sales_report_all_warehouses(
         callback,
         date_from,
         date_to,
         state: FSMContext = None,
-        page: int = 1
+        page: int = 1,
+        data: dict = None
 ):
     user_id = callback.from_user.id
     price_type = await get_user_price_type(user_id)
@@ -570,10 +584,12 @@ async def show_sales_report_all_warehouses(
         parse_mode="HTML"
     )
 
-    data = await state.get_data()
+    if data is None:  # вызывающий обработчик мог уже прочитать состояние — не читаем второй раз
+        data = await state.get_data()
+    store = get_report_store()
+    report = await store.get(user_id, data.get("all_sales_report_id"))
     need_api = (
-            'all_sales_report' not in data or
-            'all_warehouses' not in data or
+            report is None or
             'date_from' not in data or
             'date_to' not in data or
             data.get("date_from") != date_from or
@@ -581,45 +597,54 @@ async def show_sales_report_all_warehouses(
     )
 
     if need_api:
+        # Тот же отчёт недавно уже строился — берём готовый результат без WB и БД
+        cache = get_report_cache()
+        warehouse_filter = await get_user_warehouse_filter(user_id)
+        cache_key = cache.make_key(user_id, "all_warehouses", date_from, date_to, warehouse_filter)
+        report = await cache.get(cache_key, "all_warehouses")
+
         warehouses = await get_cached_warehouses_dicts()
         api_key = await get_user_api_key(callback.from_user.id)
-        while True:
-            result = await get_sales_report_with_eta(api_key, date_from, date_to)
-            if isinstance(result, dict) and result.get("error") == "ratelimit":
-                retry = result["retry"]
-                await progress_message.edit_text(
-                    f"⏳ Формируем отчёт по всем складам за период {period_text}.\n"
-                    f"💶 <b>Цена:</b> {price_type_name}\n"
-                    f"   Отчет будет загружен не ранее чем через: <b>{retry} сек.</b> ⏳",
-                    parse_mode="HTML"
-                )
-                await asyncio.sleep(retry)
-                continue
-            elif isinstance(result, dict) and result.get("error"):
-                await progress_message.edit_text("❌ Ошибка при получении данных по всем складам.", parse_mode="HTML")
-                return
-            else:
-                sales = result
-                break
-
-        # Фильтруем склады с продажами
-        filtered_warehouses = []
-        for wh in warehouses:
-            wh_name_norm = normalize_warehouse_name(wh["name"])
-            if any(normalize_warehouse_name(item.get("warehouseName", "")) == wh_name_norm for item in sales):
-                filtered_warehouses.append(wh)
-
-        await state.update_data(
-            all_sales_report=sales,
-            all_warehouses=filtered_warehouses,
+        async with ProgressReporter(progress_message) as progress:
+            while report is None:
+                result = await get_sales_dataset_for_period(user_id, api_key, date_from, date_to)
+                if isinstance(result, dict) and result.get("error") == "ratelimit":
+                    await wait_for_sales_quota(api_key, result["retry"], lambda eta: progress.update(
+                        f"⏳ Формируем отчёт по всем складам за период {period_text}.\n"
+                        f"💶 <b>Цена:</b> {price_type_name}\n"
+                        f"   Отчет будет загружен не ранее чем через: <b>{eta} сек.</b> ⏳"
+                    ))
+                    continue
+                elif isinstance(result, dict) and result.get("error"):
+                    await progress.finish("❌ Ошибка при получении данных по всем складам.")
+                    return
+                else:
+                    # Один проход группировки: склад -> артикул; склады без продаж отпадают сами
+                    grouping = await run_heavy(group_sales_by_warehouse, result, warehouses, size=len(result))
+                    report = {
+                        "dataset": result,
+                        "grouped": grouping,
+                        "warehouses": [
+                            {"id": group["id"], "name": wh_name} for wh_name, group in grouping["warehouses"].items()
+                        ],
+                        "date_from": date_from,
+                        "date_to": date_to,
+                    }
+                    await cache.set(cache_key, report)
+
+        # В FSM — только handle, данные отчёта — в хранилище отчётов
+        await store.drop(user_id, data.get("all_sales_report_id"))
+        handle = await store.put(user_id, report)
+        data = await state.update_data(
+            all_sales_report_id=handle,
             date_from=date_from,
             date_to=date_to
         )
-        data = await state.get_data()
 
-    # --- Используем данные из FSM ---
-    sales = data.get("all_sales_report", [])
-    filtered_warehouses = data.get("all_warehouses", [])
+    # --- Используем данные отчёта из хранилища ---
+    handle = data.get("all_sales_report_id")
+    grouping = _get_all_wh_grouping(report, price_type)
+    filtered_warehouses = report["warehouses"]
     date_from = data.get("date_from")
     date_to = data.get("date_to")
 
@@ -627,29 +652,22 @@ async def show_sales_report_all_warehouses(
     total_wh = len(filtered_warehouses)
     total_pages = max(1, (total_wh + PAGE_SIZE - 1) // PAGE_SIZE)
     page = max(1, min(page, total_pages))
+    kb = build_pagination_keyboard(total_wh, page, PAGE_SIZE, "sales_all_wh_page:", "main_sales_by_warehouses")
+    kb.inline_keyboard.append([InlineKeyboardButton(text="📥 Экспорт в Excel", callback_data="sales_all_wh_export_xlsx")])
+
+    page_key = f"page:{price_type}:{page}"
+    text = await get_cached_page(report, page_key)
+    if text is not None:
+        await progress_message.edit_text(text, reply_markup=kb, parse_mode="HTML")
+        return
+
     start = (page - 1) * PAGE_SIZE
     end = start + PAGE_SIZE
     wh_page = filtered_warehouses[start:end]
 
     # --- Итоги по всем складам ---
-    global_qty = 0
-    global_sum = 0.0
-    for wh in filtered_warehouses:
-        wh_name = wh["name"]
-        stat = {}
-        wh_name_norm = normalize_warehouse_name(wh_name)
-        for item in sales:
-            sale_warehouse = normalize_warehouse_name(item.get("warehouseName", ""))
-            if sale_warehouse != wh_name_norm:
-                continue
-            art = item.get("supplierArticle", "—")
-            price_val = float(item.get(price_type, 0))
-            if art not in stat:
-                stat[art] = {"qty": 0, "sum": 0.0, "price": price_val}
-            stat[art]["qty"] += 1
-            stat[art]["sum"] += price_val
-        global_qty += sum(v["qty"] for v in stat.values())
-        global_sum += sum(v["sum"] for v in stat.values())
+    global_qty = grouping["qty"]
+    global_sum = grouping["sum"]
 
     # --- Форматирование Telegram-отчёта ---
     text = (
@@ -661,20 +679,10 @@ async def show_sales_report_all_warehouses(
 
     for wh in wh_page:
         wh_name = wh["name"]
-        stat = {}
-        wh_name_norm = normalize_warehouse_name(wh_name)
-        for item in sales:
-            sale_warehouse = normalize_warehouse_name(item.get("warehouseName", ""))
-            if sale_warehouse != wh_name_norm:
-                continue
-            art = item.get("supplierArticle", "—")
-            price_val = float(item.get(price_type, 0))
-            if art not in stat:
-                stat[art] = {"qty": 0, "sum": 0.0, "price": price_val}
-            stat[art]["qty"] += 1
-            stat[art]["sum"] += price_val
-        total_qty = sum(d["qty"] for d in stat.values())
-        total_sum = sum(d["sum"] for d in stat.values())
+        group = grouping["warehouses"].get(wh_name)
+        stat = group["articles"] if group else {}
+        total_qty = group["qty"] if group else 0
+        total_sum = group["sum"] if group else 0.0
         text += f"🏬 <b>{wh_name}</b>\n"
         if stat:
             for art, d in stat.items():
@@ -698,8 +706,7 @@ async def show_sales_report_all_warehouses(
             f"{global_qty} шт / {sum_text} ₽"
         )
 
-    kb = build_pagination_keyboard(total_wh, page, PAGE_SIZE, "sales_all_wh_page:", "main_sales_by_warehouses")
-    kb.inline_keyboard.append([InlineKeyboardButton(text="📥 Экспорт в Excel", callback_data="sales_all_wh_export_xlsx")])
+    await remember_page(user_id, handle, report, page_key, text)
     await progress_message.edit_text(text, reply_markup=kb, parse_mode="HTML")
 
 @router.callback_query(F.data.startswith("sales_all_wh_page:"))
@@ -708,75 +715,26 @@ async def all_wh_page(callback: CallbackQuery, state: FSMContext):
     data = await state.get_data()
     date_from = data.get("date_from")
     date_to = data.get("date_to")
-    await show_sales_report_all_warehouses(callback, date_from, date_to, state=state, page=page)
+    await show_sales_report_all_warehouses(callback, date_from, date_to, state=state, page=page, data=data)
 
 @router.callback_query(F.data == "sales_all_wh_export_xlsx")
 async def sales_all_wh_export_xlsx(callback: CallbackQuery, state: FSMContext):
     data = await state.get_data()
-    sales = data.get("all_sales_report", [])
-    filtered_warehouses = data.get("all_warehouses", [])
+    user_id = callback.from_user.id
+    handle = data.get("all_sales_report_id")
+    report = await get_report_store().get(user_id, handle)
+    if report is None:
+        await callback.answer(REPORT_EXPIRED_TEXT, show_alert=True)
+        return
+    filtered_warehouses = report["warehouses"]
     date_from = data.get("date_from")
     date_to = data.get("date_to")
 
-    user_id = callback.from_user.id
     price_type = await get_user_price_type(user_id)
     price_type_name = price_type_human(price_type)
+    grouping = _get_all_wh_grouping(report, price_type)
 
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Продажи по складам"
-
-    # Первая строка — тип цены и период жирным шрифтом
-    ws.append([f"Цена: {price_type_name}"])
-    ws.append([f"Период отчёта: {date_from.strftime('%d.%m.%Y')} — {date_to.strftime('%d.%m.%Y')}"])
-    ws.append([])
-
-    # Вторая строка — заголовки (сумма и цена)
-    ws.append(["Склад", "Артикул", "Кол-во продаж", "Цена", "Сумма"])
-    for cell in ws[4]:
-        cell.font = Font(bold=True)
-
-    row = 5
-    for wh in filtered_warehouses:
-        wh_name = wh["name"]
-        stat = {}
-        wh_name_norm = normalize_warehouse_name(wh_name)
-        for item in sales:
-            sale_warehouse = normalize_warehouse_name(item.get("warehouseName", ""))
-            if sale_warehouse != wh_name_norm:
-                continue
-            art = item.get("supplierArticle", "—")
-            price_val = float(item.get(price_type, 0))
-            if art not in stat:
-                stat[art] = {"qty": 0, "sum": 0.0, "price": price_val}
-            stat[art]["qty"] += 1
-            stat[art]["sum"] += price_val
-        total_qty = sum(d["qty"] for d in stat.values())
-        total_sum = sum(d["sum"] for d in stat.values())
-        if stat:
-            for art, d in stat.items():
-                ws.append([wh_name, art, d["qty"], d["price"], d["sum"]])
-                row += 1
-            ws.append([f"Итого по складу: {wh_name}", "", total_qty, "", total_sum])
-            row += 1
-        else:
-            ws.append([wh_name, "Нет продаж", "", "", ""])
-            row += 1
-        ws.append([])  # Пустая строка между складами
-        row += 1
-
-    # Автоподбор ширины столбцов по содержимому
-    for col in ws.columns:
-        max_length = 0
-        col_letter = get_column_letter(col[0].column)
-        for cell in col:
-            if cell.value:
-                max_length = max(max_length, len(str(cell.value)))
-        ws.column_dimensions[col_letter].width = max_length + 2
-
-    # Сохраняем файл в память
-    buffer = io.BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-    file = BufferedInputFile(buffer.read(), filename="sales_all_warehouses_report.xlsx")
-    await callback.message.answer_document(file)
+    period = f"{date_from.strftime('%d.%m.%Y')} — {date_to.strftime('%d.%m.%Y')}"
+    await send_export(callback.message, "sales_all_warehouses_report", "xlsx",
+                      _all_warehouses_xlsx_rows, (price_type_name, period, filtered_warehouses, grouping),
+                      title="Продажи по складам", version=report_version(report, price_type, period))
@@ -0,0 +1,224 @@
+"""
+bot/services/export_cache.py
+
+Дисковый кэш готовых файлов выгрузки (bot/utils/exporters.py).
+- Ключ — хэш параметров выгрузки: функция строк, имя, формат, колонки и версия данных отчёта —
+  компактный признак от вызывающего (ключ и срок кэша результатов, время снимка остатков), а без него —
+  сами данные (args). Новая версия данных даёт новый ключ, а повторная выгрузка того же отчёта — тот же:
+  файл отдаётся с диска без пересборки.
+- Файлы лежат в EXPORT_CACHE_DIR как <ключ>-<имя файла>; суммарный размер ограничен EXPORT_CACHE_MAX_BYTES,
+  при превышении удаляются давно не использованные (LRU). EXPORT_CACHE_MAX_BYTES=0 — кэш выключен.
+  Файл, который сейчас отправляется (pinned), не вытесняется — FSInputFile читает его уже во время загрузки.
+- При старте каталог перечитывается — кэш переживает перезапуск бота.
+- file_id Telegram отправленных файлов (тот же ключ): повторная отправка такого же файла — ссылкой
+  на file_id, без повторной загрузки. Хранятся в file_ids.json в том же каталоге, не больше
+  EXPORT_FILE_ID_MAX_ITEMS (LRU); работают и при выключенном кэше файлов. Запись на диск — в потоке
+  и не чаще раза в FILE_IDS_SAVE_DELAY секунд (изменения за это время склеиваются), последняя —
+  при остановке бота (close_export_cache).
+
+Использование:
+    cache = get_export_cache()
+    key = cache.make_key(name, fmt, rows, version, columns, title, min_width)
+    with cache.pinned(key):
+        hit = cache.get(key)                 # (путь, имя файла) или None
+        path, filename = cache.put(key, built_path, filename)
+        ...                                  # отправка файла
+    file_id = cache.get_file_id(key)         # отправлялся ли такой файл раньше
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional
+
+from config import EXPORT_CACHE_DIR, EXPORT_CACHE_MAX_BYTES, EXPORT_FILE_ID_MAX_ITEMS
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд копить изменения file_id перед записью file_ids.json
+FILE_IDS_SAVE_DELAY = 5
+
+
+class ExportFileCache:
+    def __init__(self, directory: str, max_bytes: int, max_file_ids: int = EXPORT_FILE_ID_MAX_ITEMS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_file_ids = max_file_ids
+        # ключ -> (путь, имя файла, размер); порядок — от давно использованных к недавним
+        self._files: OrderedDict[str, tuple[str, str, int]] = OrderedDict()
+        self._size = 0
+        self._pins: dict[str, int] = {}
+        self._file_ids: OrderedDict[str, str] = OrderedDict()
+        self._file_ids_path = os.path.join(directory, "file_ids.json")
+        self._save_task: Optional[asyncio.Task] = None
+        self._write_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load_file_ids()
+        if self.enabled:
+            self._load()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def make_key(name, fmt, rows, data, columns, title, min_width) -> str:
+        """data — версия данных отчёта (компактный кортеж) или сами args, если версии нет."""
+        payload = pickle.dumps(
+            (rows.__module__, rows.__qualname__, name, fmt, data, columns, title, min_width),
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+        return hashlib.sha256(payload).hexdigest()[:32]
+
+    def _load(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            key, sep, filename = entry.name.partition("-")
+            if not sep or not entry.is_file():
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, key, entry.path, filename, stat.st_size))
+        for _, key, path, filename, size in sorted(entries):
+            self._files[key] = (path, filename, size)
+            self._size += size
+        self._evict()
+        if self._files:
+            logger.info(f"[EXPORT CACHE] Загружено файлов: {len(self._files)}, {self._size // 1024} КБ")
+
+    def _load_file_ids(self):
+        try:
+            with open(self._file_ids_path, encoding="utf-8") as f:
+                self._file_ids.update(json.load(f))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"[EXPORT CACHE] Не удалось прочитать {self._file_ids_path}: {e}")
+
+    def _write_file_ids(self, file_ids: dict):
+        tmp_path = self._file_ids_path + ".tmp"
+        with self._write_lock:
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(file_ids, f)
+                os.replace(tmp_path, self._file_ids_path)
+            except OSError as e:
+                logger.warning(f"[EXPORT CACHE] Не удалось сохранить {self._file_ids_path}: {e}")
+
+    def _save_file_ids(self):
+        """Откладывает запись: изменения за FILE_IDS_SAVE_DELAY секунд уходят на диск одной записью."""
+        if self._save_task is None or self._save_task.done():
+            self._save_task = asyncio.get_running_loop().create_task(self._save_file_ids_later())
+
+    async def _save_file_ids_later(self):
+        await asyncio.sleep(FILE_IDS_SAVE_DELAY)
+        await self.flush()
+
+    async def flush(self):
+        # Снимок — на loop (копия словаря), сериализация и запись — в потоке
+        await asyncio.to_thread(self._write_file_ids, dict(self._file_ids))
+
+    async def close(self):
+        """Дописывает отложенные изменения file_id на диск."""
+        if self._save_task is not None and not self._save_task.done():
+            self._save_task.cancel()
+            await self.flush()
+
+    def get_file_id(self, key: str) -> Optional[str]:
+        file_id = self._file_ids.get(key)
+        if file_id is not None:
+            self._file_ids.move_to_end(key)
+        return file_id
+
+    def remember_file_id(self, key: str, file_id: str):
+        if self._file_ids.get(key) == file_id:
+            return
+        self._file_ids[key] = file_id
+        self._file_ids.move_to_end(key)
+        while len(self._file_ids) > self.max_file_ids:
+            self._file_ids.popitem(last=False)
+        self._save_file_ids()
+
+    def forget_file_id(self, key: str):
+        """file_id больше не принимается Telegram — следующая отправка загрузит файл заново."""
+        if self._file_ids.pop(key, None) is not None:
+            self._save_file_ids()
+
+    def get(self, key: str) -> Optional[tuple[str, str]]:
+        item = self._files.get(key)
+        if item is None:
+            return None
+        path, filename, size = item
+        if not os.path.exists(path):
+            self._drop(key)
+            return None
+        self._files.move_to_end(key)
+        os.utime(path)  # порядок LRU после перезапуска — по времени изменения
+        return path, filename
+
+    def put(self, key: str, built_path: str, filename: str) -> tuple[str, str]:
+        """Переносит собранный файл в кэш. Возвращает (путь в кэше, имя файла)."""
+        path = os.path.join(self.directory, f"{key}-{filename}")
+        shutil.move(built_path, path)
+        if key in self._files:
+            self._size -= self._files[key][2]
+        size = os.path.getsize(path)
+        self._files[key] = (path, filename, size)
+        self._files.move_to_end(key)
+        self._size += size
+        self._evict()
+        return path, filename
+
+    @contextmanager
+    def pinned(self, key: str):
+        """Пока файл отправляется, он не вытесняется; отложенное вытеснение — после отправки."""
+        self._pins[key] = self._pins.get(key, 0) + 1
+        try:
+            yield
+        finally:
+            self._pins[key] -= 1
+            if not self._pins[key]:
+                del self._pins[key]
+            self._evict()
+
+    def _drop(self, key: str):
+        path, _, size = self._files.pop(key)
+        self._size -= size
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"[EXPORT CACHE] Не удалось удалить {path}: {e}")
+
+    def _evict(self):
+        for key in list(self._files):
+            if self._size <= self.max_bytes:
+                break
+            if key in self._pins:
+                continue
+            self._drop(key)
+            logger.debug(f"[EXPORT CACHE] Вытеснен: {key}")
+
+
+_cache: Optional[ExportFileCache] = None
+
+
+def get_export_cache() -> ExportFileCache:
+    global _cache
+    if _cache is None:
+        _cache = ExportFileCache(EXPORT_CACHE_DIR, EXPORT_CACHE_MAX_BYTES)
+    return _cache
+
+
+async def close_export_cache():
+    global _cache
+    if _cache is not None:
+        await _cache.close()
+        _cache = None
@@ -0,0 +1,84 @@
+"""
+bot/services/fsm_redis_storage.py
+
+CompactRedisStorage — RedisStorage aiogram с бинарной сериализацией данных пользователя:
+msgpack (+ zstd для крупных значений) вместо JSON, у ключей — TTL.
+Модуль импортируется только при FSM_STORAGE=redis (bot/services/fsm_storage.py):
+redis, msgpack и zstandard — опциональные зависимости.
+"""
+
+from datetime import date, datetime
+from typing import Any, Dict, Mapping
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.redis import RedisStorage
+
+from config import FSM_COMPRESS_MIN_SIZE
+
+# Типы msgpack-расширений для значений, которых нет в msgpack (календарь кладёт в FSM date/datetime)
+_EXT_DATETIME = 1
+_EXT_DATE = 2
+
+# Первый байт значения: как упакованы данные
+_RAW = b"\x00"
+_ZSTD = b"\x01"
+
+
+def _default(obj):
+    import msgpack
+
+    if isinstance(obj, datetime):
+        return msgpack.ExtType(_EXT_DATETIME, obj.isoformat().encode("utf-8"))
+    if isinstance(obj, date):
+        return msgpack.ExtType(_EXT_DATE, obj.isoformat().encode("utf-8"))
+    raise TypeError(f"Значение типа {type(obj).__name__} нельзя сохранить в FSM")
+
+
+def _ext_hook(code, payload):
+    import msgpack
+
+    if code == _EXT_DATETIME:
+        return datetime.fromisoformat(payload.decode("utf-8"))
+    if code == _EXT_DATE:
+        return date.fromisoformat(payload.decode("utf-8"))
+    return msgpack.ExtType(code, payload)
+
+
+class CompactRedisStorage(RedisStorage):
+    """RedisStorage aiogram с бинарной сериализацией данных (msgpack + zstd) вместо JSON."""
+
+    def __init__(self, *args, compress_min_size: int = FSM_COMPRESS_MIN_SIZE, **kwargs):
+        super().__init__(*args, **kwargs)
+        import msgpack  # опциональные зависимости, нужны только для этого хранилища
+        import zstandard
+
+        self._msgpack = msgpack
+        self._compressor = zstandard.ZstdCompressor(level=3)
+        self._decompressor = zstandard.ZstdDecompressor()
+        self.compress_min_size = compress_min_size
+
+    def pack(self, data: Mapping[str, Any]) -> bytes:
+        raw = self._msgpack.packb(data, default=_default, use_bin_type=True, datetime=False)
+        if len(raw) >= self.compress_min_size:
+            return _ZSTD + self._compressor.compress(raw)
+        return _RAW + raw
+
+    def unpack(self, value: bytes) -> Dict[str, Any]:
+        header, body = value[:1], value[1:]
+        if header == _ZSTD:
+            body = self._decompressor.decompress(body)
+        return self._msgpack.unpackb(body, ext_hook=_ext_hook, raw=False, strict_map_key=False)
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        redis_key = self.key_builder.build(key, "data")
+        if not data:
+            await self.redis.delete(redis_key)
+            return
+        await self.redis.set(redis_key, self.pack(dict(data)), ex=self.data_ttl)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        redis_key = self.key_builder.build(key, "data")
+        value = await self.redis.get(redis_key)
+        if value is None:
+            return {}
+        return self.unpack(value)
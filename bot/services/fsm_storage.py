@@ -0,0 +1,32 @@
+"""
+bot/services/fsm_storage.py
+
+Хранилище FSM для Dispatcher.
+- "memory" — MemoryStorage aiogram (один процесс, состояние теряется при перезапуске).
+- "redis" — CompactRedisStorage (bot/services/fsm_redis_storage.py): состояние в Redis, общее для
+  нескольких процессов бота, данные пользователя сериализуются msgpack (+ zstd для крупных),
+  у ключей есть TTL — данные неактивных пользователей удаляются сами.
+  Импортируется только в этом режиме — без redis бот запускается с хранилищем в памяти.
+Выбор — FSM_STORAGE в config.py; создание — create_fsm_storage() в bot/main.py.
+"""
+
+import logging
+
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from config import FSM_STORAGE, FSM_STATE_TTL, FSM_DATA_TTL, REDIS_DSN
+
+logger = logging.getLogger(__name__)
+
+
+def create_fsm_storage() -> BaseStorage:
+    if FSM_STORAGE == "redis":
+        # опциональные зависимости (redis, msgpack, zstandard), нужны только для этого хранилища
+        from bot.services.fsm_redis_storage import CompactRedisStorage
+
+        storage = CompactRedisStorage.from_url(REDIS_DSN, state_ttl=FSM_STATE_TTL, data_ttl=FSM_DATA_TTL)
+        logger.info(f"[FSM] Хранилище: Redis (msgpack/zstd), TTL данных {FSM_DATA_TTL} сек.")
+        return storage
+    logger.info("[FSM] Хранилище: память процесса")
+    return MemoryStorage()
@@ -0,0 +1,120 @@
+"""
+bot/services/prefetch.py
+
+Фоновая предзагрузка данных WB для всех пользователей с активным доступом.
+- Продажи: дельта-синхронизация в локальную базу (sales_sync.sync_sales).
+- Остатки: дельта-синхронизация в локальную базу (stock_sync) и обновление кэша артикулов (как при /start).
+- Каждый запрос идёт через общий лимитер (rate_limiter.py): бюджет ключа не превышается,
+  при лимите WB ждём своей очереди, а не отказываемся.
+- Пользователи делятся между воркерами по стабильному хэшу user_id: shard_of(user_id, N) == индекс воркера.
+
+Запуск:
+- в процессе бота — задача APScheduler рядом с daily_balance_update (bot/main.py, PREFETCH_ENABLED);
+- отдельными воркерами: python -m bot.services.prefetch --shard 0 --shards 4 [--once]
+"""
+
+import argparse
+import asyncio
+import logging
+import zlib
+
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+from bot.services.sales_sync import sync_sales
+from bot.services.stock_sync import get_articles_from_stocks
+from bot.services.wb_client import start_wb_client, close_wb_client
+from bot.services.rate_limiter import close_rate_limiter
+from config import (
+    PREFETCH_HOUR,
+    PREFETCH_SHARD_COUNT,
+    PREFETCH_SHARD_INDEX,
+    PREFETCH_CONCURRENCY,
+    PREFETCH_MAX_ATTEMPTS,
+)
+from storage.articles import cache_articles
+from storage.users import get_active_users_with_api_key
+
+logger = logging.getLogger(__name__)
+
+
+def shard_of(user_id: int, shard_count: int) -> int:
+    """Стабильный (не зависит от PYTHONHASHSEED и процесса) номер шарда пользователя."""
+    return zlib.crc32(str(user_id).encode("utf-8")) % max(1, shard_count)
+
+
+async def _prefetch_sales(user_id: int, api_key: str):
+    for attempt in range(1, PREFETCH_MAX_ATTEMPTS + 1):
+        error = await sync_sales(user_id, api_key, force=True)
+        if not error:
+            return True
+        if error.get("error") != "ratelimit" or attempt == PREFETCH_MAX_ATTEMPTS:
+            logger.warning(f"[PREFETCH] user_id={user_id}: продажи не обновлены: {error}")
+            return False
+        await asyncio.sleep(error["retry"])
+    return False
+
+
+async def _prefetch_stocks(user_id: int, api_key: str):
+    articles = await get_articles_from_stocks(user_id, api_key, force=True)
+    if articles:
+        await cache_articles(user_id, articles)
+    return bool(articles)
+
+
+async def prefetch_user(user_id: int, api_key: str):
+    try:
+        sales_ok = await _prefetch_sales(user_id, api_key)
+        stocks_ok = await _prefetch_stocks(user_id, api_key)
+        logger.info(f"[PREFETCH] user_id={user_id}: продажи={'ok' if sales_ok else 'нет'}, "
+                    f"остатки={'ok' if stocks_ok else 'нет'}")
+    except Exception as e:
+        logger.exception(f"[PREFETCH] user_id={user_id}: ошибка предзагрузки: {e}")
+
+
+async def prefetch_all_users(shard_index: int = PREFETCH_SHARD_INDEX, shard_count: int = PREFETCH_SHARD_COUNT):
+    """Предзагрузка по всем активным пользователям своего шарда."""
+    users = [
+        (user_id, api_key)
+        for user_id, api_key in await get_active_users_with_api_key()
+        if shard_of(user_id, shard_count) == shard_index
+    ]
+    logger.info(f"[PREFETCH] Шард {shard_index}/{shard_count}: пользователей {len(users)}")
+
+    # У каждого ключа свой бюджет WB — параллелим по пользователям, но ограниченно
+    semaphore = asyncio.Semaphore(PREFETCH_CONCURRENCY)
+
+    async def run(user_id, api_key):
+        async with semaphore:
+            await prefetch_user(user_id, api_key)
+
+    await asyncio.gather(*(run(user_id, api_key) for user_id, api_key in users))
+    logger.info(f"[PREFETCH] Шард {shard_index}/{shard_count}: готово")
+
+
+async def run_worker(shard_index: int, shard_count: int, once: bool = False):
+    await start_wb_client()
+    try:
+        if once:
+            await prefetch_all_users(shard_index, shard_count)
+            return
+        scheduler = AsyncIOScheduler(timezone="Europe/Berlin")
+        scheduler.add_job(prefetch_all_users, "cron", hour=PREFETCH_HOUR, minute=0,
+                          args=[shard_index, shard_count])
+        scheduler.start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            scheduler.shutdown(wait=False)
+    finally:
+        await close_wb_client()
+        await close_rate_limiter()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Воркер предзагрузки данных WB")
+    parser.add_argument("--shard", type=int, default=PREFETCH_SHARD_INDEX, help="номер шарда (0..shards-1)")
+    parser.add_argument("--shards", type=int, default=PREFETCH_SHARD_COUNT, help="всего шардов")
+    parser.add_argument("--once", action="store_true", help="один проход без планировщика")
+    args = parser.parse_args()
+    asyncio.run(run_worker(args.shard, args.shards, once=args.once))
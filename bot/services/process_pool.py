@@ -0,0 +1,104 @@
+"""
+bot/services/process_pool.py
+
+Пул процессов для тяжёлых по CPU задач отчётов (группировки крупных наборов, сборка XLSX),
+чтобы они не останавливали event loop и кнопки других пользователей.
+- Запуск и остановка — start_process_pool()/close_process_pool() в bot/main.py; размер — PROCESS_POOL_SIZE.
+- run_in_pool(func, *args) — func и аргументы должны сериализоваться pickle: функция уровня модуля
+  и компактные данные (агрегаты, SalesDataset), результат — байты/путь к файлу/агрегаты.
+- Таймаут (PROCESS_POOL_TIMEOUT) и отмена: ожидающая задача снимается из очереди; уже запущенная
+  доработает в процессе пула, но её результат никто не ждёт — его получает discard(result), если задан
+  (например, удалить собранный временный файл).
+- Пул не запущен (PROCESS_POOL_SIZE=0, воркер предзагрузки) — задача выполняется в потоке.
+- run_heavy(func, *args, size=N) — в пул только наборы от PROCESS_POOL_MIN_ROWS строк, мелкие — сразу
+  (пересылка данных в процесс дороже самой работы).
+"""
+
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional
+
+from config import PROCESS_POOL_SIZE, PROCESS_POOL_TIMEOUT, PROCESS_POOL_MIN_ROWS
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ProcessPoolExecutor] = None
+_pool_size = 0
+
+
+def _create_executor(size: int) -> ProcessPoolExecutor:
+    # spawn: дочерние процессы не наследуют event loop, сокеты и потоки бота
+    return ProcessPoolExecutor(max_workers=size, mp_context=multiprocessing.get_context("spawn"))
+
+
+def start_process_pool(size: int = PROCESS_POOL_SIZE):
+    global _executor, _pool_size
+    if _executor is None and size > 0:
+        _executor = _create_executor(size)
+        _pool_size = size
+        logger.info(f"[POOL] Пул процессов запущен: {size}")
+
+
+async def close_process_pool():
+    global _executor
+    if _executor is not None:
+        executor, _executor = _executor, None
+        await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+        logger.info("[POOL] Пул процессов остановлен")
+
+
+def _discard_when_done(future, discard: Callable):
+    """Результат брошенной задачи (таймаут/отмена ожидания) — в discard, когда задача всё же завершится."""
+    def callback(f):
+        if f.cancelled() or f.exception() is not None:
+            return
+        try:
+            discard(f.result())
+        except Exception as e:
+            logger.warning(f"[POOL] Не удалось освободить результат брошенной задачи: {e}")
+
+    future.add_done_callback(callback)
+
+
+async def run_in_pool(func, *args, timeout: float = PROCESS_POOL_TIMEOUT, discard: Optional[Callable] = None):
+    """
+    Выполняет func(*args) в пуле процессов. asyncio.TimeoutError — задача не уложилась в timeout.
+    discard(result) — что сделать с результатом, если его перестали ждать (таймаут, отмена обработчика).
+    """
+    global _executor
+    name = getattr(func, '__name__', func)
+    if _executor is None:
+        # Поток не прервать: ждём через shield, чтобы результат дошёл до discard
+        future = asyncio.get_running_loop().run_in_executor(None, func, *args)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            if discard is not None:
+                _discard_when_done(future, discard)
+            raise
+    future = _executor.submit(func, *args)
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+    except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+        if isinstance(e, asyncio.TimeoutError):
+            logger.warning(f"[POOL] {name}: превышено время ожидания {timeout} сек.")
+        # Ещё в очереди — снимается; уже выполняется — результат отдаём discard
+        if not future.cancel() and discard is not None:
+            _discard_when_done(future, discard)
+        raise
+    except BrokenProcessPool:
+        # Процесс пула упал (например, OOM) — пересоздаём пул, чтобы следующие задачи работали
+        logger.error(f"[POOL] {name}: пул процессов сломан, перезапуск")
+        broken, _executor = _executor, _create_executor(_pool_size)
+        broken.shutdown(wait=False, cancel_futures=True)
+        raise
+
+
+async def run_heavy(func, *args, size: int, timeout: float = PROCESS_POOL_TIMEOUT):
+    """Как run_in_pool, но наборы меньше PROCESS_POOL_MIN_ROWS строк обрабатываются сразу."""
+    if size < PROCESS_POOL_MIN_ROWS:
+        return func(*args)
+    return await run_in_pool(func, *args, timeout=timeout)
@@ -0,0 +1,169 @@
+"""
+bot/services/rate_limiter.py
+
+Лимитер запросов к API Wildberries (token bucket) по паре «API-ключ + семейство методов».
+- Семейства и квоты — WB_RATE_LIMITS в config.py: sales, stocks (statistics-api), supplies, common.
+- Запрос допускается ДО отправки: токен резервируется заранее, при нехватке — известно точное время ожидания.
+- Бэкенды: в памяти процесса (по умолчанию) и Redis (общий бюджет для нескольких процессов бота).
+- 429 от WB (Retry-After) учитывается через penalize(): следующий запрос не раньше указанного времени.
+
+Использование:
+    limiter = get_rate_limiter()
+    await limiter.acquire(api_key, "stocks")            # дождаться своей очереди и занять токен
+    wait = await limiter.expected_wait(api_key, "sales")  # ETA для сообщения пользователю
+"""
+
+import asyncio
+import hashlib
+import logging
+import time
+from typing import Optional
+
+from config import WB_RATE_LIMITS, RATE_LIMIT_BACKEND, REDIS_DSN
+
+logger = logging.getLogger(__name__)
+
+
+class InMemoryBucketBackend:
+    """Корзины в памяти процесса. Операции атомарны в рамках одного event loop."""
+
+    def __init__(self):
+        self._buckets: dict[str, tuple[float, float]] = {}
+
+    async def update(self, key, rate, capacity, cost, max_wait, penalty):
+        now = time.monotonic()
+        tokens, ts = self._buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + max(0.0, now - ts) * rate)
+        if penalty > 0:
+            tokens = min(tokens, 1 - penalty * rate)
+        after = tokens - cost
+        wait = -after / rate if after < 0 else 0.0
+        granted = max_wait is None or wait <= max_wait
+        self._buckets[key] = (after if granted else tokens, now)
+        return granted, wait
+
+    async def close(self):
+        self._buckets.clear()
+
+
+# Та же логика, что и в InMemoryBucketBackend.update, но атомарно на стороне Redis
+_REDIS_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local max_wait = tonumber(ARGV[4])
+local penalty = tonumber(ARGV[5])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil or ts == nil then
+    tokens = capacity
+    ts = now
+end
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+if penalty > 0 then
+    tokens = math.min(tokens, 1 - penalty * rate)
+end
+local after = tokens - cost
+local wait = 0
+if after < 0 then
+    wait = -after / rate
+end
+local granted = 1
+if wait > max_wait then
+    granted = 0
+    after = tokens
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(after), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate + wait) + 60)
+return {granted, tostring(wait)}
+"""
+
+
+_UNLIMITED_WAIT = 10 ** 9
+
+
+class RedisBucketBackend:
+    """Корзины в Redis: один бюджет на ключ для всех процессов бота."""
+
+    def __init__(self, dsn: str):
+        from redis.asyncio import Redis  # опциональная зависимость, нужна только для этого бэкенда
+
+        self._redis = Redis.from_url(dsn)
+        self._script = self._redis.register_script(_REDIS_BUCKET_SCRIPT)
+
+    async def update(self, key, rate, capacity, cost, max_wait, penalty):
+        granted, wait = await self._script(
+            keys=[key],
+            args=[rate, capacity, cost, _UNLIMITED_WAIT if max_wait is None else max_wait, penalty],
+        )
+        return bool(int(granted)), float(wait)
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+class WBRateLimiter:
+    def __init__(self, backend, limits: dict = WB_RATE_LIMITS):
+        self.backend = backend
+        self.limits = limits
+
+    def _bucket(self, api_key: str, family: str):
+        capacity, period = self.limits[family]
+        key_hash = hashlib.sha256(str(api_key).encode("utf-8")).hexdigest()[:16]
+        return f"wb:ratelimit:{family}:{key_hash}", capacity / period, capacity
+
+    async def reserve(self, api_key: str, family: str, max_wait: Optional[float] = None):
+        """
+        Резервирует токен. Возвращает (granted, wait): если granted — запрос можно слать через wait секунд.
+        Если ожидание больше max_wait — токен не занимается, granted=False.
+        """
+        key, rate, capacity = self._bucket(api_key, family)
+        return await self.backend.update(key, rate, capacity, 1, max_wait, 0)
+
+    async def acquire(self, api_key: str, family: str) -> float:
+        """Занимает токен и спит до своей очереди. Возвращает время ожидания."""
+        _, wait = await self.reserve(api_key, family)
+        if wait > 0:
+            logger.info(f"[RATE LIMIT] {family}: ожидание {wait:.1f} сек. перед запросом к WB")
+            await asyncio.sleep(wait)
+        return wait
+
+    async def expected_wait(self, api_key: str, family: str) -> float:
+        """Сколько секунд осталось до свободного токена (без резервирования)."""
+        key, rate, capacity = self._bucket(api_key, family)
+        # max_wait=-1: токен никогда не выдаётся, только считаем ожидание
+        _, wait = await self.backend.update(key, rate, capacity, 1, -1, 0)
+        return wait
+
+    async def penalize(self, api_key: str, family: str, retry_after: float):
+        """WB ответил 429: следующий запрос по ключу — не раньше чем через retry_after секунд."""
+        key, rate, capacity = self._bucket(api_key, family)
+        await self.backend.update(key, rate, capacity, 0, None, retry_after)
+
+    async def close(self):
+        await self.backend.close()
+
+
+_limiter: Optional[WBRateLimiter] = None
+
+
+def get_rate_limiter() -> WBRateLimiter:
+    global _limiter
+    if _limiter is None:
+        if RATE_LIMIT_BACKEND == "redis":
+            backend = RedisBucketBackend(REDIS_DSN)
+        else:
+            backend = InMemoryBucketBackend()
+        _limiter = WBRateLimiter(backend)
+        logger.info(f"[RATE LIMIT] Бэкенд лимитера: {RATE_LIMIT_BACKEND}")
+    return _limiter
+
+
+async def close_rate_limiter():
+    global _limiter
+    if _limiter is not None:
+        await _limiter.close()
+        _limiter = None
@@ -0,0 +1,188 @@
+"""
+bot/services/report_cache.py
+
+Кэш результатов отчётов по параметрам запроса.
+- Ключ: (user_id, вид отчёта, date_from, date_to, фильтр складов, склад/артикул).
+  Тип цены в ключ не входит: агрегаты содержат суммы по всем типам цен сразу.
+- Значение: готовые агрегаты отчёта и уже отрисованные страницы (report["pages"], ключ страницы — с типом цены).
+- TTL зависит от периода: если он включает сегодня — короткий (данные ещё меняются),
+  для закрытого периода — длинный. Срок отсчитывается от построения отчёта (report["expires_at"])
+  и не продлевается листанием.
+- Страницы в Redis лежат отдельными ключами рядом с отчётом и живут до того же срока:
+  листание записывает только текст страницы, а не весь отчёт.
+- Повторное открытие того же отчёта не ходит ни в WB, ни в БД; листание не пересчитывает страницы.
+- Счётчики попаданий/промахов по видам отчётов — в админке («Статистика запросов к WB»).
+- Наборы продаж за период (SalesDataset, bot/services/sales_sync.py) — в отдельном экземпляре кэша
+  (get_dataset_cache): свой LRU и свои счётчики, они не вытесняют готовые отчёты и не искажают их статистику.
+
+Хранение — те же уровни, что у хранилища отчётов (report_store.py): LRU в памяти и опционально Redis.
+"""
+
+import hashlib
+import logging
+import time
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Optional
+
+from bot.services.report_store import InMemoryReportTier, RedisReportTier, get_report_store, REPORT_FORMAT_VERSION
+from config import (
+    REPORT_CACHE_MAX_ITEMS,
+    REPORT_CACHE_DATASET_MAX_ITEMS,
+    REPORT_CACHE_TTL_TODAY,
+    REPORT_CACHE_TTL_PAST,
+    REPORT_STORE_REDIS,
+    REDIS_DSN,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _as_date(value) -> date:
+    return value.date() if isinstance(value, datetime) else value
+
+
+class ReportResultCache:
+    def __init__(self, memory: InMemoryReportTier, redis: Optional[RedisReportTier] = None):
+        self.memory = memory
+        self.redis = redis
+        self._stats = defaultdict(lambda: {"hits": 0, "misses": 0})
+
+    @staticmethod
+    def make_key(user_id, report_type, date_from, date_to, warehouse_filter, target_id=None) -> str:
+        params = "|".join(str(p) for p in (
+            report_type, _as_date(date_from), _as_date(date_to), warehouse_filter, target_id,
+        ))
+        digest = hashlib.sha256(params.encode("utf-8")).hexdigest()[:16]
+        return f"wb:report_cache:v{REPORT_FORMAT_VERSION}:{user_id}:{report_type}:{digest}"
+
+    @staticmethod
+    def ttl_for(date_to) -> int:
+        """Период, включающий сегодня, ещё дополняется продажами — храним недолго."""
+        if _as_date(date_to) >= date.today():
+            return REPORT_CACHE_TTL_TODAY
+        return REPORT_CACHE_TTL_PAST
+
+    async def get(self, key: str, report_type: str):
+        report = self.memory.get(key)
+        if report is None and self.redis is not None:
+            try:
+                report = await self.redis.get(key)
+            except Exception as e:
+                logger.warning(f"[REPORT CACHE] Ошибка чтения из Redis: {e}")
+            if report is not None:
+                ttl_left = self.ttl_left(report)
+                if ttl_left <= 0:
+                    report = None
+                else:
+                    self.memory.set(key, report, ttl_left)
+        self._stats[report_type]["hits" if report is not None else "misses"] += 1
+        return report
+
+    @staticmethod
+    def ttl_left(report: dict) -> int:
+        return int(report.get("expires_at", 0) - time.time())
+
+    async def set(self, key: str, report: dict):
+        """report должен содержать date_to — от него зависит TTL."""
+        ttl = self.ttl_for(report["date_to"])
+        report["cache_key"] = key
+        report["expires_at"] = time.time() + ttl
+        report.setdefault("pages", {})
+        self.memory.set(key, report, ttl)
+        if self.redis is not None:
+            try:
+                await self.redis.set(key, report, ttl)
+            except Exception as e:
+                logger.warning(f"[REPORT CACHE] Redis недоступен, кэш только в памяти: {e}")
+
+    async def get_page(self, report: dict, page_key: str) -> Optional[str]:
+        text = report.get("pages", {}).get(page_key)
+        if text is None and self.redis is not None and report.get("cache_key"):
+            try:
+                text = await self.redis.get(f"{report['cache_key']}:page:{page_key}")
+            except Exception as e:
+                logger.warning(f"[REPORT CACHE] Ошибка чтения страницы из Redis: {e}")
+            if text is not None:
+                report.setdefault("pages", {})[page_key] = text
+        return text
+
+    async def set_page(self, report: dict, page_key: str, text: str):
+        """Страница в отчёте (в памяти — тот же объект) и отдельным ключом в Redis до срока отчёта."""
+        report.setdefault("pages", {})[page_key] = text
+        ttl_left = self.ttl_left(report)
+        if self.redis is not None and ttl_left > 0:
+            try:
+                await self.redis.set(f"{report['cache_key']}:page:{page_key}", text, ttl_left)
+            except Exception as e:
+                logger.warning(f"[REPORT CACHE] Redis недоступен, страница только в памяти: {e}")
+
+    def stats(self) -> dict:
+        return {name: dict(st) for name, st in self._stats.items()}
+
+    async def close(self):
+        self.memory.clear()
+        if self.redis is not None:
+            await self.redis.close()
+
+
+_cache: Optional[ReportResultCache] = None
+_dataset_cache: Optional[ReportResultCache] = None
+
+
+def _create_cache(max_items: int) -> ReportResultCache:
+    redis_tier = RedisReportTier(REDIS_DSN, REPORT_CACHE_TTL_PAST) if REPORT_STORE_REDIS else None
+    return ReportResultCache(InMemoryReportTier(max_items, REPORT_CACHE_TTL_PAST), redis_tier)
+
+
+def get_report_cache() -> ReportResultCache:
+    global _cache
+    if _cache is None:
+        _cache = _create_cache(REPORT_CACHE_MAX_ITEMS)
+    return _cache
+
+
+def get_dataset_cache() -> ReportResultCache:
+    """Кэш наборов продаж за период — отдельно от готовых отчётов (своё место в LRU, свои счётчики)."""
+    global _dataset_cache
+    if _dataset_cache is None:
+        _dataset_cache = _create_cache(REPORT_CACHE_DATASET_MAX_ITEMS)
+    return _dataset_cache
+
+
+async def close_report_cache():
+    global _cache, _dataset_cache
+    for cache in (_cache, _dataset_cache):
+        if cache is not None:
+            await cache.close()
+    _cache = None
+    _dataset_cache = None
+
+
+def report_version(report: dict, *extra) -> Optional[tuple]:
+    """
+    Компактная версия данных отчёта для ключа дискового кэша выгрузок (bot/utils/exporters.py):
+    ключ кэша результатов и срок, до которого эти агрегаты актуальны. None — отчёт не из кэша результатов.
+    """
+    if not report.get("cache_key"):
+        return None
+    return (report["cache_key"], report.get("expires_at"), *extra)
+
+
+async def get_cached_page(report: dict, page_key: str) -> Optional[str]:
+    if report.get("cache_key"):
+        return await get_report_cache().get_page(report, page_key)
+    return report.get("pages", {}).get(page_key)
+
+
+async def remember_page(user_id: int, handle: str, report: dict, page_key: str, text: str):
+    """
+    Сохраняет отрисованную страницу. Отчёт из кэша результатов — только текст страницы рядом с ним
+    (срок кэша не продлевается); отчёт вне кэша — целиком в сессии пользователя, как раньше.
+    """
+    if report.get("cache_key"):
+        await get_report_cache().set_page(report, page_key, text)
+    else:
+        report.setdefault("pages", {})[page_key] = text
+        if handle:
+            await get_report_store().update(user_id, handle, report)
@@ -0,0 +1,171 @@
+"""
+bot/services/report_store.py
+
+Серверное хранилище данных отчётов (вместо наборов продаж в FSM).
+- В FSM хранится только короткий handle отчёта; сами данные (агрегаты, группировки) — здесь.
+- Уровень 1: память процесса, LRU с ограничением числа отчётов и TTL — старые отчёты вытесняются.
+- Уровень 2 (опционально, REPORT_STORE_REDIS): Redis с тем же TTL — отчёт переживает вытеснение
+  из памяти и перезапуск бота, доступен другим процессам.
+- Отчёт привязан к пользователю: чужой handle ничего не вернёт.
+
+Использование:
+    store = get_report_store()
+    handle = await store.put(user_id, {"sales": rows})
+    report = await store.get(user_id, handle)   # None — отчёт устарел, нужно сформировать заново
+"""
+
+import logging
+import pickle
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from typing import Optional
+
+from config import REPORT_STORE_MAX_ITEMS, REPORT_STORE_TTL, REPORT_STORE_REDIS, REDIS_DSN
+
+logger = logging.getLogger(__name__)
+
+REPORT_EXPIRED_TEXT = "Отчёт устарел — сформируйте его заново."
+
+# Версия формата данных отчётов в ключах Redis: после её смены записи старого формата
+# не читаются — отчёт просто «устаревает» и строится заново
+REPORT_FORMAT_VERSION = 2
+
+
+class InMemoryReportTier:
+    """LRU + TTL в памяти процесса."""
+
+    def __init__(self, max_items: int, ttl: int):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._items: OrderedDict[str, tuple[float, object]] = OrderedDict()
+
+    def get(self, key: str):
+        item = self._items.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return value
+
+    def set(self, key: str, value, ttl: Optional[int] = None):
+        self._items[key] = (time.monotonic() + (ttl or self.ttl), value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            evicted, _ = self._items.popitem(last=False)
+            logger.debug(f"[REPORT STORE] Вытеснен из памяти: {evicted}")
+
+    def delete(self, key: str):
+        self._items.pop(key, None)
+
+    def clear(self):
+        self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class RedisReportTier:
+    """Отчёты в Redis: pickle + zlib, ключ живёт TTL секунд."""
+
+    def __init__(self, dsn: str, ttl: int):
+        from redis.asyncio import Redis  # опциональная зависимость
+
+        self._redis = Redis.from_url(dsn)
+        self.ttl = ttl
+
+    async def get(self, key: str):
+        raw = await self._redis.get(key)
+        if raw is None:
+            return None
+        return pickle.loads(zlib.decompress(raw))
+
+    async def set(self, key: str, value, ttl: Optional[int] = None):
+        raw = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        await self._redis.set(key, raw, ex=ttl or self.ttl)
+
+    async def delete(self, key: str):
+        await self._redis.delete(key)
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+class ReportStore:
+    def __init__(self, memory: InMemoryReportTier, redis: Optional[RedisReportTier] = None):
+        self.memory = memory
+        self.redis = redis
+
+    @staticmethod
+    def _key(user_id: int, handle: str) -> str:
+        return f"wb:report:v{REPORT_FORMAT_VERSION}:{user_id}:{handle}"
+
+    async def put(self, user_id: int, report: dict) -> str:
+        """Сохраняет отчёт, возвращает handle для FSM."""
+        handle = uuid.uuid4().hex[:12]
+        await self.update(user_id, handle, report)
+        return handle
+
+    async def update(self, user_id: int, handle: str, report: dict):
+        key = self._key(user_id, handle)
+        self.memory.set(key, report)
+        if self.redis is not None:
+            try:
+                await self.redis.set(key, report)
+            except Exception as e:
+                logger.warning(f"[REPORT STORE] Redis недоступен, отчёт только в памяти: {e}")
+
+    async def get(self, user_id: int, handle: Optional[str]):
+        if not handle:
+            return None
+        key = self._key(user_id, handle)
+        report = self.memory.get(key)
+        if report is None and self.redis is not None:
+            try:
+                report = await self.redis.get(key)
+            except Exception as e:
+                logger.warning(f"[REPORT STORE] Ошибка чтения из Redis: {e}")
+                report = None
+            if report is not None:
+                self.memory.set(key, report)
+        return report
+
+    async def drop(self, user_id: int, handle: Optional[str]):
+        if not handle:
+            return
+        key = self._key(user_id, handle)
+        self.memory.delete(key)
+        if self.redis is not None:
+            try:
+                await self.redis.delete(key)
+            except Exception as e:
+                logger.warning(f"[REPORT STORE] Ошибка удаления из Redis: {e}")
+
+    async def close(self):
+        self.memory.clear()
+        if self.redis is not None:
+            await self.redis.close()
+
+
+_store: Optional[ReportStore] = None
+
+
+def get_report_store() -> ReportStore:
+    global _store
+    if _store is None:
+        redis_tier = RedisReportTier(REDIS_DSN, REPORT_STORE_TTL) if REPORT_STORE_REDIS else None
+        _store = ReportStore(InMemoryReportTier(REPORT_STORE_MAX_ITEMS, REPORT_STORE_TTL), redis_tier)
+        logger.info(f"[REPORT STORE] Память: до {REPORT_STORE_MAX_ITEMS} отчётов, TTL {REPORT_STORE_TTL} сек., "
+                    f"Redis: {'да' if redis_tier else 'нет'}")
+    return _store
+
+
+async def close_report_store():
+    global _store
+    if _store is not None:
+        await _store.close()
+        _store = None
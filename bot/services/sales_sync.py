@@ -0,0 +1,161 @@
+"""
+bot/services/sales_sync.py
+
+Инкрементальная синхронизация продаж WB в локальную базу (storage/sales.py).
+- У каждого пользователя хранится high-water mark — максимальный lastChangeDate загруженных строк.
+- Дельта-синхронизация запрашивает у WB только строки, изменённые после него (flag=0, dateFrom=hwm).
+- synced_from — с какой даты продаж локальные данные полные; для более раннего периода делается догрузка.
+- Многостраничная выгрузка (больше WB_SALES_PAGE_LIMIT строк): лимит WB — ETA вызывающему только на первой
+  странице, токен для следующих ждём внутри синхронизации — иначе повтор начинал бы снова с первой страницы.
+- Отчёты за период читаются из базы: get_sales_for_period() вместо полной выгрузки и фильтрации в Python.
+- get_sales_summary_for_period() — готовые агрегаты (GROUP BY по дневным агрегатам в PostgreSQL).
+- get_sales_dataset_for_period() — дневные агрегаты день × склад × артикул в колоночном SalesDataset,
+  один на период: его переиспользуют отчёты по складам и по артикулам, а период внутри уже
+  загруженного берётся из него фильтром по дням, без запроса к базе.
+"""
+
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from bot.services.wildberries_api import fetch_sales
+from bot.services.report_cache import get_dataset_cache
+from bot.utils.sales_dataset import SalesDataset
+from config import SALES_SYNC_MIN_INTERVAL, SALES_SYNC_INITIAL_DAYS
+from storage.sales import (
+    upsert_sales, load_sales, query_sales_rollup, get_sales_sync_state, set_sales_sync_state,
+    parse_wb_datetime, as_datetime,
+)
+
+logger = logging.getLogger(__name__)
+
+# WB отдаёт по /supplier/sales (flag=0) не больше ~80 000 строк за запрос,
+# следующая страница — с lastChangeDate последней строки
+WB_SALES_PAGE_LIMIT = 80000
+
+_user_locks: dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+
+def _covers(state, date_from) -> bool:
+    return bool(state and state.synced_from and state.last_change_date
+                and state.synced_from <= as_datetime(date_from))
+
+
+async def sync_sales(user_id: int, api_key: str, date_from=None, force: bool = False):
+    """
+    Догружает продажи пользователя в локальную базу.
+    date_from — с какой даты продаж нужны полные данные (None — только дельта / первичная загрузка).
+    Возвращает None при успехе или dict с ошибкой WB ({"error": "ratelimit", "retry": N}, ...).
+    """
+    async with _user_locks[user_id]:
+        state = await get_sales_sync_state(user_id)
+        now = datetime.utcnow()
+
+        if date_from is not None and not _covers(state, date_from):
+            # Догрузка: всё, что изменилось с date_from (включает все продажи с датой >= date_from)
+            synced_from = as_datetime(date_from)
+            cursor = synced_from.strftime("%Y-%m-%d")
+        elif state and state.last_change_date:
+            if not force and state.synced_at and (now - state.synced_at).total_seconds() < SALES_SYNC_MIN_INTERVAL:
+                return None
+            synced_from = state.synced_from
+            cursor = state.last_change_date.isoformat()
+        else:
+            synced_from = as_datetime(now - timedelta(days=SALES_SYNC_INITIAL_DAYS))
+            cursor = synced_from.strftime("%Y-%m-%d")
+
+        hwm = state.last_change_date if state else None
+        total = 0
+        first_page = True
+        while True:
+            # Квота /supplier/sales — 1 запрос в минуту: страницу 2+ ждём, а не отдаём ETA —
+            # состояние сохраняется только после последней страницы, повтор начал бы всё заново
+            batch = await fetch_sales(api_key, cursor, 0, wait_for_token=not first_page)
+            first_page = False
+            if isinstance(batch, dict):
+                logger.warning(f"[SALES SYNC] user_id={user_id}: ошибка WB {batch}, состояние не изменено")
+                return batch
+            total += await upsert_sales(user_id, batch)
+            for item in batch:
+                changed = parse_wb_datetime(item["lastChangeDate"])
+                if hwm is None or changed > hwm:
+                    hwm = changed
+            if len(batch) < WB_SALES_PAGE_LIMIT:
+                break
+            cursor = batch[-1]["lastChangeDate"]
+
+        await set_sales_sync_state(user_id, synced_from=synced_from, last_change_date=hwm or synced_from)
+        logger.info(f"[SALES SYNC] user_id={user_id}: загружено {total} строк (с {cursor}), hwm={hwm}")
+        return None
+
+
+async def _sync_for_period(user_id: int, api_key: str, date_from):
+    """Синхронизация перед чтением периода. Возвращает None, если данные можно читать, иначе dict с ошибкой."""
+    error = await sync_sales(user_id, api_key, date_from)
+    if error:
+        state = await get_sales_sync_state(user_id)
+        if not (error.get("error") == "ratelimit" and _covers(state, date_from)):
+            return error
+        # Период уже есть в базе — не держим пользователя ради свежей дельты
+        logger.info(f"[SALES SYNC] user_id={user_id}: лимит WB, отдаём локальные данные от {state.synced_at}")
+    return None
+
+
+async def get_sales_for_period(user_id: int, api_key: str, date_from, date_to):
+    """
+    Продажи за период из локальной базы (перед чтением — дельта-синхронизация с WB).
+    Возвращает список строк в формате WB API или dict с ошибкой — как get_sales_report_with_eta.
+    """
+    error = await _sync_for_period(user_id, api_key, date_from)
+    if error:
+        return error
+    return await load_sales(user_id, date_from, date_to)
+
+
+async def get_sales_summary_for_period(
+        user_id: int,
+        api_key: str,
+        date_from,
+        date_to,
+        group_by=("warehouseId", "warehouseName", "supplierArticle"),
+        supplier_article=None,
+):
+    """
+    Агрегаты продаж за период: строки {group_by..., "qty", "totalPrice", "priceWithDisc", ...} (суммы).
+    Ошибки WB — как у get_sales_for_period.
+    """
+    error = await _sync_for_period(user_id, api_key, date_from)
+    if error:
+        return error
+    return await query_sales_rollup(user_id, date_from, date_to, group_by, supplier_article)
+
+
+async def get_sales_dataset_for_period(user_id: int, api_key: str, date_from, date_to):
+    """
+    SalesDataset за период (день × склад × артикул). Берётся из кэша наборов, если этот период
+    уже загружали для любого отчёта, или вырезается по дням из последнего загруженного периода, если
+    попадает в него. Ошибки WB — как у get_sales_for_period.
+    """
+    cache = get_dataset_cache()
+    cache_key = cache.make_key(user_id, "dataset", date_from, date_to, None)
+    cached = await cache.get(cache_key, "dataset")
+    if cached is not None:
+        return cached["dataset"]
+
+    latest_key = cache.make_key(user_id, "dataset_latest", None, None, None)
+    latest = await cache.get(latest_key, "dataset_latest")
+    if latest is not None and latest["date_from"] <= date_from and date_to <= latest["date_to"]:
+        return latest["dataset"].between(date_from, date_to)
+
+    result = await get_sales_summary_for_period(
+        user_id, api_key, date_from, date_to,
+        group_by=("day", "warehouseId", "warehouseName", "supplierArticle"),
+    )
+    if isinstance(result, dict):
+        return result
+    dataset = SalesDataset.from_rows(result)
+    entry = {"dataset": dataset, "date_from": date_from, "date_to": date_to}
+    await cache.set(cache_key, entry)
+    await cache.set(latest_key, dict(entry))
+    return dataset
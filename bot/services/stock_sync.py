@@ -0,0 +1,124 @@
+"""
+bot/services/stock_sync.py
+
+Инкрементальная синхронизация остатков WB в локальную базу (storage/stocks.py).
+- У каждого пользователя хранится high-water mark — максимальный lastChangeDate загруженных строк.
+- Дельта-синхронизация запрашивает /supplier/stocks только с dateFrom=hwm (первый раз — со 2019-06-20)
+  и применяет изменённые строки как upsert по (nmId, баркод, склад).
+- Не чаще раза в STOCK_SYNC_MIN_INTERVAL секунд на пользователя (у WB остатки обновляются раз в ~30 минут).
+- Отчёт «Остатки» и кэш артикулов читают локальное состояние: get_local_stocks(), get_articles_from_stocks().
+- История (storage/stock_history.py): каждая синхронизация записывает изменения остатков по (артикул, склад)
+  за сегодня; раз в STOCK_HISTORY_CHECKPOINT_DAYS дней перед первой дельтой дня — полный снимок.
+  get_stock_history_snapshot(user_id, day) — что было на складах на конец любого прошедшего дня.
+"""
+
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import date, datetime
+
+from bot.services.wildberries_api import get_stocks, articles_from_stocks
+from config import STOCK_SYNC_MIN_INTERVAL, STOCK_HISTORY_CHECKPOINT_DAYS
+from storage.sales import parse_wb_datetime
+from storage.stocks import (
+    upsert_stocks, load_stocks, current_stock_quantities, get_stock_sync_state, set_stock_sync_state,
+)
+from storage.stock_history import (
+    record_stock_deltas, save_stock_checkpoint, get_last_checkpoint_day, load_stock_snapshot, checkpoint_due,
+)
+
+logger = logging.getLogger(__name__)
+
+# Самая ранняя дата, с которой WB отдаёт остатки: первая загрузка — полный снимок
+WB_STOCKS_EPOCH = "2019-06-20"
+# WB отдаёт по /supplier/stocks не больше ~60 000 строк за запрос,
+# следующая страница — с lastChangeDate последней строки
+WB_STOCKS_PAGE_LIMIT = 60000
+
+_user_locks: dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+
+async def sync_stocks(user_id: int, api_key: str, force: bool = False):
+    """
+    Догружает изменённые остатки пользователя в локальную базу.
+    Возвращает None при успехе или dict с ошибкой WB ({"error": ...}); состояние при ошибке не меняется.
+    """
+    async with _user_locks[user_id]:
+        state = await get_stock_sync_state(user_id)
+        now = datetime.utcnow()
+        if state and state.last_change_date:
+            if not force and state.synced_at and (now - state.synced_at).total_seconds() < STOCK_SYNC_MIN_INTERVAL:
+                return None
+            cursor = state.last_change_date.isoformat()
+        else:
+            cursor = WB_STOCKS_EPOCH
+
+        # Первая загрузка — это не изменения, а исходный снимок: дельты не пишем, после неё — контрольная точка
+        initial = cursor == WB_STOCKS_EPOCH
+        today = date.today()
+        if not initial and checkpoint_due(await get_last_checkpoint_day(user_id), today,
+                                          STOCK_HISTORY_CHECKPOINT_DAYS):
+            await save_stock_checkpoint(user_id, today, await current_stock_quantities(user_id))
+
+        hwm = state.last_change_date if state else None
+        total = 0
+        while True:
+            batch = await get_stocks(api_key, date_from=cursor)
+            if isinstance(batch, dict):
+                logger.warning(f"[STOCK SYNC] user_id={user_id}: ошибка WB {batch}, состояние не изменено")
+                return batch
+            deltas = await upsert_stocks(user_id, batch)
+            if not initial:
+                await record_stock_deltas(user_id, today, deltas)
+            total += len(batch)
+            for item in batch:
+                changed = parse_wb_datetime(item["lastChangeDate"])
+                if hwm is None or changed > hwm:
+                    hwm = changed
+            if len(batch) < WB_STOCKS_PAGE_LIMIT:
+                break
+            cursor = batch[-1]["lastChangeDate"]
+
+        if initial:
+            await save_stock_checkpoint(user_id, today, await current_stock_quantities(user_id))
+        await set_stock_sync_state(user_id, last_change_date=hwm or parse_wb_datetime(WB_STOCKS_EPOCH))
+        logger.info(f"[STOCK SYNC] user_id={user_id}: применено {total} строк (с {cursor}), hwm={hwm}")
+        return None
+
+
+async def get_local_stocks(user_id: int, api_key: str, force: bool = False):
+    """
+    Текущие остатки в формате /supplier/stocks после дельта-синхронизации (одна попытка запроса к WB).
+    Ошибка WB при уже загруженных остатках — отдаём локальные; без них — dict с ошибкой.
+    force — синхронизировать, даже если с прошлой не прошёл STOCK_SYNC_MIN_INTERVAL (предзагрузка).
+    """
+    error = await sync_stocks(user_id, api_key, force=force)
+    if error:
+        state = await get_stock_sync_state(user_id)
+        if not (state and state.synced_at):
+            return error
+        logger.info(f"[STOCK SYNC] user_id={user_id}: WB недоступен, отдаём остатки от {state.synced_at}")
+    return await load_stocks(user_id)
+
+
+async def get_articles_from_stocks(user_id: int, api_key: str, force: bool = False) -> list[dict]:
+    """Артикулы для кэша (storage/articles.py) по локальным остаткам; при ошибке без локальных данных — []."""
+    stocks = await get_local_stocks(user_id, api_key, force=force)
+    if isinstance(stocks, dict):
+        logger.error(f"[STOCK SYNC] user_id={user_id}: остатки не получены: {stocks['error']}")
+        return []
+    return articles_from_stocks(stocks)
+
+
+async def get_stock_history_snapshot(user_id: int, day: date):
+    """
+    Остатки на конец дня day по истории (в формате строк /supplier/stocks: supplierArticle, warehouseName,
+    quantity). None — история на эту дату ещё не велась.
+    """
+    quantities = await load_stock_snapshot(user_id, day)
+    if quantities is None:
+        return None
+    return [
+        {"supplierArticle": art, "warehouseName": wh, "quantity": qty}
+        for (art, wh), qty in sorted(quantities.items(), key=lambda x: (x[0][1], x[0][0]))
+    ]
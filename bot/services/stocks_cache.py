@@ -0,0 +1,113 @@
+"""
+bot/services/stocks_cache.py
+
+Снимок остатков пользователя для отчёта «Остатки» и его CSV-выгрузки.
+- Снимок строится из локальных остатков (bot/services/stock_sync.py: дельта-синхронизация с WB)
+  не чаще раза в STOCKS_CACHE_TTL секунд на пользователя; листание страниц и экспорт берут готовый снимок.
+- В снимке данные уже сгруппированы по складам (по алфавиту), внутри склада
+  товары отсортированы по убыванию остатка, нулевые остатки отброшены.
+- Хранение — те же уровни, что у хранилища отчётов (report_store.py): LRU в памяти и опционально Redis.
+
+Использование:
+    snapshot = await get_remains_snapshot(user_id, api_key)
+    if "error" in snapshot: ...
+    for wh, products in snapshot["warehouses"]:    # products: [(артикул, наименование, остаток)]
+        ...
+"""
+
+import logging
+import time
+from typing import Optional
+
+from bot.services.report_store import InMemoryReportTier, RedisReportTier
+from bot.services.stock_sync import get_local_stocks
+from config import STOCKS_CACHE_TTL, STOCKS_CACHE_MAX_ITEMS, REPORT_STORE_REDIS, REDIS_DSN
+
+logger = logging.getLogger(__name__)
+
+
+def build_remains_snapshot(items: list) -> dict:
+    """Группирует строки /supplier/stocks по складам: [(склад, [(артикул, наименование, остаток)])]."""
+    warehouse_data: dict[str, list] = {}
+    for item in items:
+        qty = item.get("quantity", 0)
+        if not qty:
+            continue
+        wh = item.get("warehouseName") or "Неизвестно"
+        art = item.get("supplierArticle") or "Без артикула"
+        name = item.get("subject") or "Без предмета"
+        warehouse_data.setdefault(wh, []).append((art, name, qty))
+    warehouses = [
+        (wh, sorted(products, key=lambda x: (-x[2], x[0])))
+        for wh, products in warehouse_data.items()
+    ]
+    return {"warehouses": warehouses, "fetched_at": time.time()}
+
+
+class StocksCache:
+    def __init__(self, memory: InMemoryReportTier, redis: Optional[RedisReportTier] = None):
+        self.memory = memory
+        self.redis = redis
+
+    @staticmethod
+    def _key(user_id: int) -> str:
+        return f"wb:stocks:{user_id}"
+
+    async def get(self, user_id: int) -> Optional[dict]:
+        key = self._key(user_id)
+        snapshot = self.memory.get(key)
+        if snapshot is None and self.redis is not None:
+            try:
+                snapshot = await self.redis.get(key)
+            except Exception as e:
+                logger.warning(f"[STOCKS CACHE] Ошибка чтения из Redis: {e}")
+            if snapshot is not None:
+                ttl_left = STOCKS_CACHE_TTL - (time.time() - snapshot["fetched_at"])
+                self.memory.set(key, snapshot, max(1, int(ttl_left)))
+        return snapshot
+
+    async def set(self, user_id: int, snapshot: dict):
+        key = self._key(user_id)
+        self.memory.set(key, snapshot)
+        if self.redis is not None:
+            try:
+                await self.redis.set(key, snapshot)
+            except Exception as e:
+                logger.warning(f"[STOCKS CACHE] Redis недоступен, снимок только в памяти: {e}")
+
+    async def close(self):
+        self.memory.clear()
+        if self.redis is not None:
+            await self.redis.close()
+
+
+_cache: Optional[StocksCache] = None
+
+
+def get_stocks_cache() -> StocksCache:
+    global _cache
+    if _cache is None:
+        redis_tier = RedisReportTier(REDIS_DSN, STOCKS_CACHE_TTL) if REPORT_STORE_REDIS else None
+        _cache = StocksCache(InMemoryReportTier(STOCKS_CACHE_MAX_ITEMS, STOCKS_CACHE_TTL), redis_tier)
+    return _cache
+
+
+async def close_stocks_cache():
+    global _cache
+    if _cache is not None:
+        await _cache.close()
+        _cache = None
+
+
+async def get_remains_snapshot(user_id: int, api_key: str) -> dict:
+    """Снимок остатков из кэша или из локальных остатков. Ошибка WB — {"error": ...}, в кэш не попадает."""
+    cache = get_stocks_cache()
+    snapshot = await cache.get(user_id)
+    if snapshot is not None:
+        return snapshot
+    items = await get_local_stocks(user_id, api_key)
+    if isinstance(items, dict):
+        return items
+    snapshot = build_remains_snapshot(items or [])
+    await cache.set(user_id, snapshot)
+    return snapshot
@@ -0,0 +1,122 @@
+"""
+bot/services/wb_client.py
+
+Общий (на весь процесс) HTTP-клиент для запросов к API Wildberries.
+- На каждый хост WB (statistics-api, supplies-api, common-api, ...) — один долгоживущий
+  aiohttp.ClientSession со своим keep-alive пулом соединений.
+- DNS кэшируется коннектором, лимиты пула и таймауты берутся из config.py.
+- Запуск и корректное закрытие — start_wb_client()/close_wb_client() в bot/main.py.
+
+Использование:
+    async with wb_get(url, headers=headers, params=params) as resp:
+        ...
+"""
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from config import (
+    WB_POOL_LIMIT,
+    WB_POOL_LIMIT_PER_HOST,
+    WB_DNS_CACHE_TTL,
+    WB_KEEPALIVE_TIMEOUT,
+    WB_REQUEST_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class WBClient:
+    """Набор keep-alive сессий aiohttp — по одной на хост WB."""
+
+    def __init__(
+            self,
+            limit: int = WB_POOL_LIMIT,
+            limit_per_host: int = WB_POOL_LIMIT_PER_HOST,
+            dns_cache_ttl: int = WB_DNS_CACHE_TTL,
+            keepalive_timeout: float = WB_KEEPALIVE_TIMEOUT,
+            request_timeout: float = WB_REQUEST_TIMEOUT,
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.request_timeout = request_timeout
+        self._sessions: dict[str, aiohttp.ClientSession] = {}
+        self._lock = asyncio.Lock()
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            use_dns_cache=True,
+            ttl_dns_cache=self.dns_cache_ttl,
+            keepalive_timeout=self.keepalive_timeout,
+            enable_cleanup_closed=True,
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+        )
+
+    async def get_session(self, url: str) -> aiohttp.ClientSession:
+        host = urlsplit(url).netloc
+        session = self._sessions.get(host)
+        if session is not None and not session.closed:
+            return session
+        async with self._lock:
+            session = self._sessions.get(host)
+            if session is None or session.closed:
+                session = self._create_session()
+                self._sessions[host] = session
+                logger.info(f"[WB CLIENT] Открыт пул соединений для {host}")
+        return session
+
+    @asynccontextmanager
+    async def request(self, method: str, url: str, **kwargs):
+        session = await self.get_session(url)
+        async with session.request(method, url, **kwargs) as resp:
+            yield resp
+
+    async def close(self):
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        for session in sessions:
+            if not session.closed:
+                await session.close()
+        if sessions:
+            # Даём SSL-соединениям корректно закрыться (рекомендация aiohttp)
+            await asyncio.sleep(0.25)
+        logger.info("[WB CLIENT] Пулы соединений закрыты")
+
+
+_client: Optional[WBClient] = None
+
+
+def get_wb_client() -> WBClient:
+    """Возвращает общий клиент; создаёт его лениво (удобно для скриптов вне бота)."""
+    global _client
+    if _client is None:
+        _client = WBClient()
+    return _client
+
+
+async def start_wb_client() -> WBClient:
+    return get_wb_client()
+
+
+async def close_wb_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+def wb_get(url: str, **kwargs):
+    """GET через общий пул: `async with wb_get(url, headers=..., params=...) as resp`."""
+    return get_wb_client().request("GET", url, **kwargs)
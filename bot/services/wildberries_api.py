@@ -1,13 +1,22 @@
 import aiohttp
 import asyncio
+import math
 from datetime import timedelta, datetime
-import httpx
 import logging
 
+from bot.services.wb_client import wb_get
+from bot.services.rate_limiter import get_rate_limiter
+
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Ожидание токена лимитера, которое get_sales_report_with_eta «проглатывает» сама;
+# если ждать дольше — возвращаем хендлеру {"error": "ratelimit", "retry": N} для показа ETA
+ETA_INLINE_WAIT = 3
+# Как часто пересчитывать ETA в сообщении пользователю, пока ждём квоту WB
+ETA_REFRESH_INTERVAL = 10
+
 async def send_report_eta(callback, date_from, date_to):
     if date_from == date_to:
         period_text = f"<b>{date_from.strftime('%d.%m.%Y')}</b>"
@@ -19,43 +28,102 @@ async def send_report_eta(callback, date_from, date_to):
         parse_mode="HTML"
     )
 
-async def get_sales_report_with_eta(api_key, date_from, date_to, max_retries=3):
-    url = "https://statistics-api.wildberries.ru/api/v1/supplier/sales"
+SALES_URL = "https://statistics-api.wildberries.ru/api/v1/supplier/sales"
+
+
+class SingleFlight:
+    """
+    Схлопывание одинаковых одновременных запросов: первый вызов выполняет запрос,
+    остальные с тем же ключом ждут тот же future и получают тот же результат.
+    Запрос выполняется отдельной задачей — отмена одного из ожидающих его не прерывает.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: dict = {}
+        self.calls = 0       # всего вызовов
+        self.executed = 0    # реально отправлено запросов
+        self.collapsed = 0   # вызовов, получивших результат чужого запроса
+
+    async def do(self, key, factory):
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            self.executed += 1
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            self.collapsed += 1
+            logger.info(f"[SINGLEFLIGHT] {self.name}: запрос присоединён к уже выполняющемуся "
+                        f"(схлопнуто {self.collapsed} из {self.calls})")
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # помечаем исключение как полученное, даже если все ожидающие отменены
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "executed": self.executed,
+            "collapsed": self.collapsed,
+            "in_flight": len(self._inflight),
+        }
+
+
+_sales_flight = SingleFlight("sales")
+_stocks_flight = SingleFlight("stocks")
+
+
+def get_singleflight_stats() -> dict:
+    """Метрики схлопывания запросов к WB: {"sales": {...}, "stocks": {...}}."""
+    return {flight.name: flight.stats() for flight in (_sales_flight, _stocks_flight)}
+
+
+async def _fetch_sales(api_key, date_from_str, flag, max_retries=3, wait_for_token=False):
+    """
+    Один запрос /supplier/sales с учётом лимитера.
+    Возвращает список продаж или dict с ошибкой; {"error": "ratelimit", "retry": N} — нужно подождать N сек.
+    wait_for_token=True — токен лимитера ждём здесь же, без ETA (следующие страницы многостраничной выгрузки).
+    """
     headers = {"Authorization": str(api_key)}
-    params = {
-        "dateFrom": date_from.strftime("%Y-%m-%d"),
-        "flag": 1 if date_from == date_to else 0
-    }
+    params = {"dateFrom": date_from_str, "flag": flag}
+    limiter = get_rate_limiter()
+    # Токен лимитера занимаем один раз до отправки; если ждать долго — отдаём ETA вызывающему.
+    # Повторы после сетевой ошибки идут на том же токене: запрос до WB не дошёл, а новый токен
+    # при квоте 1 в минуту превратил бы короткий сбой сети в ETA на минуту
+    if wait_for_token:
+        await limiter.acquire(api_key, "sales")
+    else:
+        granted, wait = await limiter.reserve(api_key, "sales", max_wait=ETA_INLINE_WAIT)
+        if not granted:
+            return {"error": "ratelimit", "retry": math.ceil(wait)}
+        if wait > 0:
+            await asyncio.sleep(wait)
     for attempt in range(max_retries):
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, headers=headers, params=params, timeout=30) as resp:
-                    logger.info(f"API request attempt {attempt + 1}/{max_retries}, status: {resp.status}")
-                    if resp.status == 200:
-                        sales = await resp.json()
-                        if date_from != date_to:
-                            return [
-                                item for item in sales
-                                if date_from <= datetime.fromisoformat(item["date"][:10]) <= date_to
-                            ]
-                        return sales
-                    elif resp.status == 401:
-                        logger.error("Unauthorized: Invalid API key")
-                        return {"error": "unauthorized"}
-                    elif resp.status == 429:
-                        retry_after = int(resp.headers.get("Retry-After", 60))
-                        logger.warning(f"Rate limit exceeded. Retrying after {retry_after} seconds...")
-                        if attempt < max_retries - 1:
-                            await asyncio.sleep(retry_after)
-                            continue
-                        return {"error": "rate_limit_exceeded"}
-                    elif resp.status == 500:
-                        logger.error("Server error on Wildberries side")
-                        return {"error": "server_error"}
-                    else:
-                        logger.error(f"Unexpected API error: {resp.status} - {await resp.text()}")
-                        return {"error": "unknown", "status": resp.status}
-        except aiohttp.ClientError as e:
+            async with wb_get(SALES_URL, headers=headers, params=params) as resp:
+                logger.info(f"API request attempt {attempt + 1}/{max_retries}, status: {resp.status}")
+                if resp.status == 200:
+                    return await resp.json()
+                elif resp.status == 401:
+                    logger.error("Unauthorized: Invalid API key")
+                    return {"error": "unauthorized"}
+                elif resp.status == 429:
+                    retry_after = int(resp.headers.get("Retry-After", 60))
+                    logger.warning(f"Rate limit exceeded. Retry after {retry_after} seconds")
+                    await limiter.penalize(api_key, "sales", retry_after)
+                    return {"error": "ratelimit", "retry": retry_after}
+                elif resp.status == 500:
+                    logger.error("Server error on Wildberries side")
+                    return {"error": "server_error"}
+                else:
+                    logger.error(f"Unexpected API error: {resp.status} - {await resp.text()}")
+                    return {"error": "unknown", "status": resp.status}
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             logger.error(f"Network error: {str(e)}")
             if attempt < max_retries - 1:
                 await asyncio.sleep(2 ** attempt)
@@ -63,149 +131,142 @@ async def get_sales_report_with_eta(api_key, date_from, date_to, max_retries=3):
             return {"error": "network"}
     return {"error": "max_retries_exceeded"}
 
-async def get_sales_report_for_period(api_key, date_from, date_to, max_retries=3):
-    url = "https://statistics-api.wildberries.ru/api/v1/supplier/sales"
-    headers = {"Authorization": str(api_key)}
-    params = {
-        "dateFrom": date_from.strftime("%Y-%m-%d"),
-        "flag": 0
-    }
+
+async def fetch_sales(api_key, date_from_str, flag, max_retries=3, wait_for_token=False):
+    """_fetch_sales через single-flight: одинаковые (api_key, dateFrom, flag) выполняются один раз."""
+    return await _sales_flight.do(
+        (str(api_key), date_from_str, flag, wait_for_token),
+        lambda: _fetch_sales(api_key, date_from_str, flag, max_retries, wait_for_token),
+    )
+
+
+async def wait_for_sales_quota(api_key, retry: int, on_eta):
+    """
+    Ждёт свободный токен /supplier/sales, показывая ETA через on_eta(секунд).
+    ETA пересчитывается по лимитеру (expected_wait): квоту ключа параллельно могут расходовать
+    предзагрузка или другой процесс бота, и первоначальная оценка устаревает.
+    """
+    limiter = get_rate_limiter()
+    while retry > 0:
+        on_eta(retry)
+        await asyncio.sleep(min(retry, ETA_REFRESH_INTERVAL))
+        retry = math.ceil(await limiter.expected_wait(api_key, "sales"))
+
+
+async def _fetch_sales_waiting(api_key, date_from_str, flag, max_retries=3):
+    """Как fetch_sales, но ожидание лимита — здесь же. При ошибке — пустой список."""
+    sales = []
     for attempt in range(max_retries):
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, headers=headers, params=params, timeout=30) as resp:
-                    logger.info(f"API request attempt {attempt + 1}/{max_retries}, status: {resp.status}")
-                    if resp.status == 200:
-                        sales = await resp.json()
-                        return [
-                            item for item in sales
-                            if date_from <= datetime.fromisoformat(item["date"][:10]) <= date_to
-                        ]
-                    elif resp.status == 401:
-                        logger.error("Unauthorized: Invalid API key")
-                        return []
-                    elif resp.status == 429:
-                        retry_after = int(resp.headers.get("Retry-After", 60))
-                        logger.warning(f"Rate limit exceeded. Retrying after {retry_after} seconds...")
-                        if attempt < max_retries - 1:
-                            await asyncio.sleep(retry_after)
-                            continue
-                        return []
-                    elif resp.status == 500:
-                        logger.error("Server error on Wildberries side")
-                        return []
-                    else:
-                        logger.error(f"Unexpected API error: {resp.status} - {await resp.text()}")
-                        return []
-        except aiohttp.ClientError as e:
-            logger.error(f"Network error: {str(e)}")
-            if attempt < max_retries - 1:
-                await asyncio.sleep(2 ** attempt)
-                continue
-            return []
-    return []
+        sales = await fetch_sales(api_key, date_from_str, flag, max_retries)
+        if isinstance(sales, dict) and sales.get("error") == "ratelimit" and attempt < max_retries - 1:
+            await asyncio.sleep(sales["retry"])
+            continue
+        break
+    return sales if isinstance(sales, list) else []
+
+
+def _filter_sales_by_date(sales, date_from, date_to):
+    return [
+        item for item in sales
+        if date_from <= datetime.fromisoformat(item["date"][:10]) <= date_to
+    ]
+
+
+async def get_sales_report_with_eta(api_key, date_from, date_to, max_retries=3):
+    flag = 1 if date_from == date_to else 0
+    sales = await fetch_sales(api_key, date_from.strftime("%Y-%m-%d"), flag, max_retries)
+    if isinstance(sales, dict) or date_from == date_to:
+        return sales
+    return _filter_sales_by_date(sales, date_from, date_to)
+
+async def get_sales_report_for_period(api_key, date_from, date_to, max_retries=3):
+    sales = await _fetch_sales_waiting(api_key, date_from.strftime("%Y-%m-%d"), 0, max_retries)
+    return _filter_sales_by_date(sales, date_from, date_to)
 
 async def get_sales_report_for_day(api_key, date, max_retries=3):
-    url = "https://statistics-api.wildberries.ru/api/v1/supplier/sales"
-    headers = {"Authorization": str(api_key)}
-    params = {
-        "dateFrom": date.strftime("%Y-%m-%d"),
-        "flag": 1
-    }
-    for attempt in range(max_retries):
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, headers=headers, params=params, timeout=30) as resp:
-                    logger.info(f"API request attempt {attempt + 1}/{max_retries}, status: {resp.status}")
-                    if resp.status == 200:
-                        return await resp.json()
-                    elif resp.status == 401:
-                        logger.error("Unauthorized: Invalid API key")
-                        return []
-                    elif resp.status == 429:
-                        retry_after = int(resp.headers.get("Retry-After", 60))
-                        logger.warning(f"Rate limit exceeded. Retrying after {retry_after} seconds...")
-                        if attempt < max_retries - 1:
-                            await asyncio.sleep(retry_after)
-                            continue
-                        return []
-                    elif resp.status == 500:
-                        logger.error("Server error on Wildberries side")
-                        return []
-                    else:
-                        logger.error(f"Unexpected API error: {resp.status} - {await resp.text()}")
-                        return []
-        except aiohttp.ClientError as e:
-            logger.error(f"Network error: {str(e)}")
-            if attempt < max_retries - 1:
-                await asyncio.sleep(2 ** attempt)
-                continue
-            return []
-    return []
+    return await _fetch_sales_waiting(api_key, date.strftime("%Y-%m-%d"), 1, max_retries)
 
 async def get_stocks(api_key, date_from="2019-06-20", max_retries=3):
+    """Остатки через single-flight: одновременные одинаковые запросы выполняются один раз."""
+    return await _stocks_flight.do(
+        (str(api_key), date_from),
+        lambda: _fetch_stocks(api_key, date_from, max_retries),
+    )
+
+async def _fetch_stocks(api_key, date_from, max_retries=3):
     url = "https://statistics-api.wildberries.ru/api/v1/supplier/stocks"
     headers = {"Authorization": f"Bearer {api_key}"}  # Добавляем префикс Bearer
     params = {"dateFrom": date_from}
+    limiter = get_rate_limiter()
     for attempt in range(max_retries):
+        await limiter.acquire(api_key, "stocks")
         try:
-            async with httpx.AsyncClient(trust_env=False, timeout=30.0) as client:
-                resp = await client.get(url, headers=headers, params=params)
-                logger.info(f"API request attempt {attempt + 1}/{max_retries}, status: {resp.status_code}")
-                if resp.status_code == 200:
-                    data = resp.json()
+            async with wb_get(url, headers=headers, params=params) as resp:
+                logger.info(f"API request attempt {attempt + 1}/{max_retries}, status: {resp.status}")
+                if resp.status == 200:
+                    data = await resp.json()
                     logger.debug(f"Raw response sample: {data[:5]}...")  # Первые 5 элементов
                     return data
-                elif resp.status_code == 401:
-                    logger.error(f"Unauthorized: {resp.json().get('detail', 'No detail')}")
-                    return {"error": "unauthorized", "detail": resp.json().get("detail", "empty Authorization header")}
-                elif resp.status_code == 429:
+                elif resp.status == 401:
+                    detail = await _error_detail(resp, "empty Authorization header")
+                    logger.error(f"Unauthorized: {detail}")
+                    return {"error": "unauthorized", "detail": detail}
+                elif resp.status == 429:
                     retry_after = int(resp.headers.get("Retry-After", 60))
                     logger.warning(f"Rate limit exceeded. Retrying after {retry_after} seconds...")
+                    await limiter.penalize(api_key, "stocks", retry_after)
                     if attempt < max_retries - 1:
-                        await asyncio.sleep(retry_after)
                         continue
                     return {"error": "rate_limit_exceeded"}
-                elif resp.status_code == 500:
+                elif resp.status == 500:
                     logger.error("Server error on Wildberries side")
                     return {"error": "server_error"}
                 else:
-                    logger.error(f"Unexpected API error: {resp.status_code} - {resp.text}")
-                    return {"error": "unknown", "status": resp.status_code}
-        except httpx.RequestError as e:
+                    logger.error(f"Unexpected API error: {resp.status} - {await resp.text()}")
+                    return {"error": "unknown", "status": resp.status}
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             logger.error(f"Network error: {str(e)}")
             if attempt < max_retries - 1:
                 await asyncio.sleep(2 ** attempt)
                 continue
             return {"error": "network"}
     return {"error": "max_retries_exceeded"}
+
+async def _error_detail(resp, default):
+    try:
+        body = await resp.json(content_type=None)
+    except (aiohttp.ClientError, ValueError):
+        return default
+    return body.get("detail", default) if isinstance(body, dict) else default
+
 async def fetch_warehouses_from_api(api_key: str, max_retries=3):
     url = "https://supplies-api.wildberries.ru/api/v1/warehouses"
     headers = {"Authorization": api_key}
+    limiter = get_rate_limiter()
     for attempt in range(max_retries):
+        await limiter.acquire(api_key, "supplies")
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, headers=headers, timeout=30) as resp:
-                    logger.info(f"API request attempt {attempt + 1}/{max_retries}, status: {resp.status}")
-                    if resp.status == 200:
-                        return await resp.json()
-                    elif resp.status == 401:
-                        logger.error("Unauthorized: Invalid API key")
-                        return []
-                    elif resp.status == 429:
-                        retry_after = int(resp.headers.get("Retry-After", 60))
-                        logger.warning(f"Rate limit exceeded. Retrying after {retry_after} seconds...")
-                        if attempt < max_retries - 1:
-                            await asyncio.sleep(retry_after)
-                            continue
-                        return []
-                    elif resp.status == 500:
-                        logger.error("Server error on Wildberries side")
-                        return []
-                    else:
-                        logger.error(f"Unexpected API error: {resp.status} - {await resp.text()}")
-                        return []
-        except aiohttp.ClientError as e:
+            async with wb_get(url, headers=headers) as resp:
+                logger.info(f"API request attempt {attempt + 1}/{max_retries}, status: {resp.status}")
+                if resp.status == 200:
+                    return await resp.json()
+                elif resp.status == 401:
+                    logger.error("Unauthorized: Invalid API key")
+                    return []
+                elif resp.status == 429:
+                    retry_after = int(resp.headers.get("Retry-After", 60))
+                    logger.warning(f"Rate limit exceeded. Retrying after {retry_after} seconds...")
+                    await limiter.penalize(api_key, "supplies", retry_after)
+                    if attempt < max_retries - 1:
+                        continue
+                    return []
+                elif resp.status == 500:
+                    logger.error("Server error on Wildberries side")
+                    return []
+                else:
+                    logger.error(f"Unexpected API error: {resp.status} - {await resp.text()}")
+                    return []
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             logger.error(f"Network error: {str(e)}")
             if attempt < max_retries - 1:
                 await asyncio.sleep(2 ** attempt)
@@ -213,12 +274,44 @@ async def fetch_warehouses_from_api(api_key: str, max_retries=3):
             return []
     return []
 
+class SellerInfoUnavailable(Exception):
+    """WB не ответил на проверку ключа (сеть, 429, 5xx) — о валидности ключа ничего не известно."""
+
+
+SELLER_INFO_UNAVAILABLE_TEXT = "⚠️ Не удалось проверить ключ: Wildberries сейчас недоступен. Попробуйте позже."
+
+
+async def fetch_seller_info(api_key: str):
+    """
+    Проверка API-ключа через seller-info (общий пул соединений).
+    Возвращает dict с данными продавца (name, tradeMark, ...) или None, если WB отклонил ключ.
+    SellerInfoUnavailable — сбой сети или WB, ключ мог быть и валидным.
+    """
+    url = "https://common-api.wildberries.ru/api/v1/seller-info"
+    headers = {"Authorization": api_key}
+    await get_rate_limiter().acquire(api_key, "common")
+    try:
+        async with wb_get(url, headers=headers) as resp:
+            logger.info(f"seller-info request, status: {resp.status}")
+            if resp.status == 200:
+                return await resp.json()
+            if resp.status == 429 or resp.status >= 500:
+                raise SellerInfoUnavailable(f"seller-info: HTTP {resp.status}")
+            return None
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error(f"Network error: {str(e)}")
+        raise SellerInfoUnavailable(str(e)) from e
+
 # Восстановление оригинальной функции
 async def get_all_articles_from_stocks(api_key, max_retries=3):
     stocks = await get_stocks(api_key, max_retries=max_retries)
     if isinstance(stocks, dict) and "error" in stocks:
         logger.error(f"Failed to get stocks: {stocks['error']}")
         return []
+    return articles_from_stocks(stocks)
+
+def articles_from_stocks(stocks):
+    """Строки остатков -> [{"article", "in_stock"}] для кэша артикулов (storage/articles.py)."""
     if not stocks or not isinstance(stocks, list):
         logger.warning(f"Invalid or empty stocks data received: {stocks[:100] if isinstance(stocks, list) else stocks}")
         return []
@@ -0,0 +1,130 @@
+"""
+bot/utils/aggregation.py
+
+Бэкенды агрегации для колоночных данных отчётов (SalesDataset).
+- PythonBackend — чистый Python, без зависимостей; быстрее на небольших наборах.
+- NumpyBackend — векторно: np.unique + np.bincount по закодированным ключам групп; выигрывает на крупных
+  наборах (сотни тысяч строк). Опционален: без numpy используется PythonBackend.
+Оба бэкенда дают одинаковый результат: ключи по возрастанию, суммы копятся в порядке строк;
+group_first — значения строки с наименьшим order в группе (при равенстве — более ранней строки).
+
+Выбор — get_aggregation_backend(rows): AGGREGATION_BACKEND в config.py ("auto" | "numpy" | "python");
+в режиме "auto" numpy включается с AGGREGATION_NUMPY_MIN_ROWS строк (точка перелома — benchmark_aggregation.py).
+"""
+
+from array import array
+
+from config import AGGREGATION_BACKEND, AGGREGATION_NUMPY_MIN_ROWS
+
+try:
+    import numpy as np  # опциональная зависимость
+except ImportError:
+    np = None
+
+# Значение warehouse_id, когда склад не определён при загрузке (см. SalesDataset)
+NO_WAREHOUSE = -1
+
+
+class PythonBackend:
+    name = "python"
+
+    def take(self, column: array, row_ids) -> array:
+        return array(column.typecode, [column[i] for i in row_ids])
+
+    def filter_range(self, column: array, lo, hi) -> list[int]:
+        return [i for i, value in enumerate(column) if lo <= value <= hi]
+
+    def encode_warehouse_keys(self, warehouse_id, warehouse_name, article, id_to_index: dict,
+                              name_to_index: list, n_articles: int):
+        """
+        Ключ группы склад × артикул: индекс склада * n_articles + код артикула; -1 — склад не найден.
+        Склад — по ID через id_to_index, для строк без ID — по коду названия через name_to_index.
+        """
+        keys = array("q")
+        for wh_id, name_code, art_code in zip(warehouse_id, warehouse_name, article):
+            index = id_to_index.get(wh_id, -1) if wh_id != NO_WAREHOUSE else name_to_index[name_code]
+            keys.append(index * n_articles + art_code if index >= 0 else -1)
+        return keys
+
+    def group_sum(self, keys, columns: list) -> tuple[list[int], list[list[float]]]:
+        """Суммы колонок по ключам (ключи < 0 отбрасываются): (ключи по возрастанию, [суммы по каждой колонке])."""
+        acc = {}
+        width = len(columns)
+        for key, *values in zip(keys, *columns):
+            if key < 0:
+                continue
+            sums = acc.get(key)
+            if sums is None:
+                sums = acc[key] = [0.0] * width
+            for j in range(width):
+                sums[j] += values[j]
+        ordered = sorted(acc)
+        return ordered, [[acc[key][j] for key in ordered] for j in range(width)]
+
+    def group_first(self, keys, order, columns: list) -> tuple[list[int], list[list[float]]]:
+        """Значения колонок из строки с наименьшим order в каждой группе (ключи < 0 отбрасываются)."""
+        best = {}
+        for row_id, (key, rank) in enumerate(zip(keys, order)):
+            if key < 0:
+                continue
+            current = best.get(key)
+            if current is None or rank < order[current]:
+                best[key] = row_id
+        ordered = sorted(best)
+        return ordered, [[column[best[key]] for key in ordered] for column in columns]
+
+
+class NumpyBackend:
+    name = "numpy"
+
+    def take(self, column: array, row_ids) -> array:
+        ids = np.asarray(row_ids, dtype=np.int64)
+        result = array(column.typecode)
+        result.frombytes(np.asarray(column)[ids].tobytes())
+        return result
+
+    def filter_range(self, column: array, lo, hi):
+        values = np.asarray(column)
+        return np.flatnonzero((values >= lo) & (values <= hi))
+
+    def encode_warehouse_keys(self, warehouse_id, warehouse_name, article, id_to_index: dict,
+                              name_to_index: list, n_articles: int):
+        ids = np.asarray(warehouse_id, dtype=np.int64)
+        # Разных складов в наборе мало: сопоставляем уникальные ID, затем раскладываем по строкам
+        unique_ids, inverse = np.unique(ids, return_inverse=True)
+        by_id = np.array([id_to_index.get(int(u), -1) for u in unique_ids], dtype=np.int64)[inverse]
+        by_name = np.asarray(name_to_index, dtype=np.int64)[np.asarray(warehouse_name, dtype=np.int64)]
+        index = np.where(ids == NO_WAREHOUSE, by_name, by_id)
+        return np.where(index >= 0, index * n_articles + np.asarray(article, dtype=np.int64), -1)
+
+    def group_sum(self, keys, columns: list) -> tuple[list[int], list[list[float]]]:
+        keys = np.asarray(keys, dtype=np.int64)
+        mask = keys >= 0
+        unique_keys, inverse = np.unique(keys[mask], return_inverse=True)
+        sums = [
+            np.bincount(inverse, weights=np.asarray(column, dtype=np.float64)[mask], minlength=len(unique_keys))
+            for column in columns
+        ]
+        return unique_keys.tolist(), [s.tolist() for s in sums]
+
+    def group_first(self, keys, order, columns: list) -> tuple[list[int], list[list[float]]]:
+        keys = np.asarray(keys, dtype=np.int64)
+        row_ids = np.flatnonzero(keys >= 0)
+        # Сортировка по (ключ, order, номер строки) — первая строка каждой группы и есть искомая
+        ranked = row_ids[np.lexsort((row_ids, np.asarray(order, dtype=np.int64)[row_ids], keys[row_ids]))]
+        unique_keys, first = np.unique(keys[ranked], return_index=True)
+        chosen = ranked[first]
+        return unique_keys.tolist(), [np.asarray(column)[chosen].tolist() for column in columns]
+
+
+_python = PythonBackend()
+_numpy = NumpyBackend() if np is not None else None
+
+
+def get_aggregation_backend(rows: int = 0):
+    """Бэкенд для набора из rows строк с учётом AGGREGATION_BACKEND и наличия numpy."""
+    if _numpy is None or AGGREGATION_BACKEND == "python":
+        return _python
+    if AGGREGATION_BACKEND == "numpy" or rows >= AGGREGATION_NUMPY_MIN_ROWS:
+        return _numpy
+    return _python
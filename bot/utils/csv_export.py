@@ -1,23 +1,36 @@
+"""
+bot/utils/csv_export.py
+
+Запись CSV построчно — без сборки всего файла в памяти.
+Формат как у выгрузок бота: разделитель «;», UTF-8 с BOM (Excel сразу открывает кириллицу).
+Отправка файлов — через bot/utils/exporters.py (форматы csv / csv.gz / ndjson / xlsx).
+"""
+
 import csv
 import io
-from aiogram.types.input_file import BufferedInputFile
+from typing import BinaryIO, Iterable, Optional
+
+
+def row_values(row, columns: Optional[list] = None) -> list:
+    """Значения строки: словарь — по columns, StyledRow (xlsx_export) — его values, иначе как есть."""
+    if isinstance(row, dict):
+        return [row.get(col, "") for col in columns or row.keys()]
+    return list(getattr(row, "values", row))
+
 
-def export_to_csv(items: list, columns: list, filename: str = "report.csv"):
+def write_csv(binary_file: BinaryIO, rows: Iterable, columns: Optional[list] = None, delimiter: str = ";"):
     """
-    Генерирует BufferedInputFile с CSV по переданным данным.
-    :param items: список словарей или списков
-    :param columns: список названий колонок (и ключей для словаря)
-    :param filename: имя файла
-    :return: BufferedInputFile для Telegram (aiogram v3+)
+    Пишет CSV в открытый бинарный файл (обычный или gzip).
+    :param rows: итерируемое строк — словари (ключи = columns) или списки
+    :param columns: заголовок; None — без строки заголовка
     """
-    output = io.StringIO()
-    writer = csv.writer(output, delimiter=';')
-    writer.writerow(columns)
-    for row in items:
-        if isinstance(row, dict):
-            writer.writerow([row.get(col, "") for col in columns])
-        else:
-            writer.writerow(row)
-    output.seek(0)
-    csv_bytes = b'\xef\xbb\xbf' + output.getvalue().encode("utf-8")
-    return BufferedInputFile(csv_bytes, filename)
+    text = io.TextIOWrapper(binary_file, encoding="utf-8-sig", newline="")
+    try:
+        writer = csv.writer(text, delimiter=delimiter)
+        if columns:
+            writer.writerow(columns)
+        for row in rows:
+            writer.writerow(row_values(row, columns))
+        text.flush()
+    finally:
+        text.detach()  # файл закрывает вызывающий
@@ -0,0 +1,218 @@
+"""
+bot/utils/exporters.py
+
+Общий механизм выгрузки отчётов в файлы.
+- Экспортёр (EXPORTERS): csv, csv.gz (CSV в gzip), ndjson (JSON по строке на запись), xlsx.
+  Каждый пишет строки по мере генерации прямо в файл на диске — данные не собираются в памяти целиком.
+- rows — функция уровня модуля, возвращающая итерируемое строк (генератор), args — компактные данные
+  отчёта: сборка файла идёт в пуле процессов (bot/services/process_pool.py), всё передаётся через pickle.
+- Файл больше EXPORT_ZIP_MIN_SIZE упаковывается в ZIP, чтобы уложиться в лимит Telegram на документ (50 МБ).
+- Готовые файлы кэшируются на диске (bot/services/export_cache.py): повторная выгрузка того же отчёта
+  на тех же данных отправляется сразу, без пересборки, а если файл уже уходил в Telegram — по его file_id,
+  без повторной загрузки.
+
+Использование:
+    def _rows(data):
+        for ...:
+            yield [wh, art, qty]
+
+    await send_export(callback.message, "remains_report", "csv", _rows, (data,),
+                      columns=["Склад", "Артикул", "Остаток"], caption="...", version=(user_id, fetched_at))
+"""
+
+import asyncio
+import gzip
+import json
+import logging
+import os
+import tempfile
+import zipfile
+from typing import Callable, Iterable, Optional
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types.input_file import FSInputFile
+
+from bot.services.export_cache import get_export_cache
+from bot.services.process_pool import run_in_pool
+from bot.utils.csv_export import write_csv, row_values
+from bot.utils.xlsx_export import write_xlsx, bold
+from config import EXPORT_ZIP_MIN_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Лимит Bot API на отправку документа
+TELEGRAM_DOCUMENT_LIMIT = 50 * 1024 * 1024
+
+
+class ExportTooLarge(Exception):
+    pass
+
+
+class Exporter:
+    """rows() — новый итератор строк на каждый вызов; большинству форматов хватает одного прохода."""
+
+    extension = ""
+
+    def write(self, path: str, rows: Callable[[], Iterable], columns: Optional[list], title: str,
+              min_width: int = 0):
+        raise NotImplementedError
+
+
+class CsvExporter(Exporter):
+    extension = ".csv"
+
+    def write(self, path, rows, columns, title, min_width=0):
+        with open(path, "wb") as f:
+            write_csv(f, rows(), columns)
+
+
+class GzipCsvExporter(Exporter):
+    extension = ".csv.gz"
+
+    def write(self, path, rows, columns, title, min_width=0):
+        with gzip.open(path, "wb", compresslevel=6) as f:
+            write_csv(f, rows(), columns)
+
+
+class NdjsonExporter(Exporter):
+    """Строка-список — объект с ключами из columns; без названий колонок — col1, col2, ..."""
+
+    extension = ".ndjson"
+
+    def write(self, path, rows, columns, title, min_width=0):
+        columns = list(columns or ())
+        with open(path, "w", encoding="utf-8") as f:
+            for row in rows():
+                if isinstance(row, dict):
+                    record = row
+                else:
+                    values = row_values(row)
+                    keys = columns + [f"col{i + 1}" for i in range(len(columns), len(values))]
+                    record = dict(zip(keys, values))
+                f.write(json.dumps(record, ensure_ascii=False, default=str))
+                f.write("\n")
+
+
+class XlsxExporter(Exporter):
+    """Два прохода по строкам: ширина колонок, затем запись (см. xlsx_export.py)."""
+
+    extension = ".xlsx"
+
+    def write(self, path, rows, columns, title, min_width=0):
+        write_xlsx(path, title, _with_header, (rows, columns), min_width=min_width)
+
+
+def _with_header(rows: Callable[[], Iterable], columns: Optional[list]):
+    if columns:
+        yield bold(columns)
+    yield from rows()
+
+
+EXPORTERS: dict[str, Exporter] = {
+    "csv": CsvExporter(),
+    "csv.gz": GzipCsvExporter(),
+    "ndjson": NdjsonExporter(),
+    "xlsx": XlsxExporter(),
+}
+
+
+def _zip(path: str, arcname: str) -> str:
+    zip_path = path + ".zip"
+    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=6) as zf:
+        zf.write(path, arcname=arcname)
+    os.remove(path)
+    return zip_path
+
+
+async def _send_document(message, cache, key: str, path: str, filename: str, caption: Optional[str]):
+    sent = await message.answer_document(FSInputFile(path, filename=filename), caption=caption)
+    if sent.document is not None:
+        cache.remember_file_id(key, sent.document.file_id)
+
+
+def _discard_export(result: tuple[str, str]):
+    """Файл выгрузки, которую перестали ждать (таймаут/отмена) — удаляем, когда сборка всё же завершится."""
+    path, _ = result
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def build_export(name: str, fmt: str, rows: Callable[..., Iterable], args: tuple = (),
+                 columns: Optional[list] = None, title: str = "Отчёт", min_width: int = 0) -> tuple[str, str]:
+    """
+    Пишет выгрузку во временный файл. Возвращает (путь, имя файла для пользователя);
+    удалить файл — забота вызывающего (send_export удаляет сам).
+    """
+    exporter = EXPORTERS[fmt]
+    filename = name + exporter.extension
+    fd, path = tempfile.mkstemp(prefix="wb_export_", suffix=exporter.extension)
+    os.close(fd)
+    try:
+        exporter.write(path, lambda: rows(*args), columns, title, min_width)
+        if os.path.getsize(path) > EXPORT_ZIP_MIN_SIZE:
+            path = _zip(path, filename)
+            filename += ".zip"
+        if os.path.getsize(path) > TELEGRAM_DOCUMENT_LIMIT:
+            raise ExportTooLarge(f"{filename}: {os.path.getsize(path)} байт")
+        return path, filename
+    except Exception:
+        for candidate in (path, path + ".zip"):
+            if os.path.exists(candidate):
+                os.remove(candidate)
+        raise
+
+
+async def send_export(message, name: str, fmt: str, rows: Callable[..., Iterable], args: tuple = (),
+                      columns: Optional[list] = None, title: str = "Отчёт", caption: Optional[str] = None,
+                      min_width: int = 0, version: Optional[tuple] = None) -> bool:
+    """
+    Собирает выгрузку в пуле процессов и отправляет документом с диска (FSInputFile).
+    Такой же файл уже отправлялся — уходит ссылка на его file_id; уже собирался — берётся из дискового кэша.
+    version — компактная версия данных отчёта для ключа кэша (см. report_version); без неё ключ считается
+    по args в потоке, чтобы сериализация крупных данных не останавливала event loop.
+    Возвращает True, если документ отправлен; False — файл не собран (пользователю уже ушло сообщение о причине).
+    """
+    cache = get_export_cache()
+    if version is not None:
+        key = cache.make_key(name, fmt, rows, version, columns, title, min_width)
+    else:
+        key = await asyncio.to_thread(cache.make_key, name, fmt, rows, args, columns, title, min_width)
+    file_id = cache.get_file_id(key)
+    if file_id is not None:
+        try:
+            await message.answer_document(file_id, caption=caption)
+            return True
+        except TelegramBadRequest as e:
+            logger.info(f"[EXPORT] file_id не принят Telegram, загружаем файл заново: {e}")
+            cache.forget_file_id(key)
+
+    if cache.enabled:
+        with cache.pinned(key):
+            cached = cache.get(key)
+            if cached is not None:
+                await _send_document(message, cache, key, *cached, caption)
+                return True
+
+    try:
+        path, filename = await run_in_pool(build_export, name, fmt, rows, args, columns, title, min_width,
+                                           discard=_discard_export)
+    except asyncio.TimeoutError:
+        await message.answer("⏳ Файл формируется слишком долго. Попробуйте выгрузить период покороче.")
+        return False
+    except ExportTooLarge as e:
+        logger.warning(f"[EXPORT] Файл больше лимита Telegram: {e}")
+        await message.answer("❗ Файл получился больше 50 МБ даже в архиве. Выберите период покороче.")
+        return False
+    if cache.enabled:
+        with cache.pinned(key):
+            path, filename = cache.put(key, path, filename)
+            await _send_document(message, cache, key, path, filename, caption)
+        return True
+    try:
+        await _send_document(message, cache, key, path, filename, caption)
+        return True
+    finally:
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger.warning(f"[EXPORT] Не удалось удалить временный файл {path}: {e}")
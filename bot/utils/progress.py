@@ -0,0 +1,132 @@
+"""
+bot/utils/progress.py
+
+Сообщение о ходе формирования отчёта («⏳ Формируем отчёт...», ETA при лимите WB).
+- Обновления склеиваются: правка уходит не чаще раза в PROGRESS_MIN_INTERVAL секунд на чат
+  (интервал общий для всех индикаторов одного чата), промежуточные тексты отбрасываются — показывается последний.
+- Текст, совпадающий с уже показанным, не отправляется.
+- Анимация (frames) — те же правки по тому же интервалу; первое update() её останавливает.
+- Фоновая задача живёт ровно столько, сколько блок async with: любой выход из обработчика
+  (return, исключение) её отменяет.
+
+Использование:
+    msg = await callback.message.edit_text("⏳ Формируем отчёт", parse_mode="HTML")
+    async with ProgressReporter(msg, frames=DOTS) as progress:
+        ...
+        progress.update("⏳ Отчёт будет загружен через 30 сек.")
+        ...
+        await progress.finish(text, reply_markup=kb)   # итоговая правка — сразу после остановки
+"""
+
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from config import PROGRESS_MIN_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+DOTS = ["⏳ Формируем отчёт.", "⏳ Формируем отчёт..", "⏳ Формируем отчёт..."]
+
+# chat_id -> время (monotonic), раньше которого в чат не правим
+_next_edit_at: dict[int, float] = {}
+_MAX_TRACKED_CHATS = 10000
+
+
+def _reserve_slot(chat_id: int, min_interval: float) -> float:
+    """Занимает ближайшее окно правки в чате. Возвращает, сколько секунд до него ждать."""
+    now = time.monotonic()
+    if len(_next_edit_at) > _MAX_TRACKED_CHATS:
+        for stale in [cid for cid, at in _next_edit_at.items() if at < now]:
+            del _next_edit_at[stale]
+    at = max(now, _next_edit_at.get(chat_id, 0.0))
+    _next_edit_at[chat_id] = at + min_interval
+    return at - now
+
+
+class ProgressReporter:
+    def __init__(self, message, frames: Optional[list[str]] = None, min_interval: float = PROGRESS_MIN_INTERVAL,
+                 parse_mode: str = "HTML"):
+        self.message = message
+        self.frames = frames
+        self.min_interval = min_interval
+        self.parse_mode = parse_mode
+        self._shown: Optional[str] = None
+        self._pending: Optional[str] = None
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+    def update(self, text: str):
+        """Новый текст индикатора; отправится с ближайшим окном правки, если его не сменит более новый."""
+        self.frames = None
+        self._pending = text
+        self._wake.set()
+
+    async def stop(self):
+        if self._task is not None:
+            task, self._task = self._task, None
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def finish(self, text: str, reply_markup=None):
+        """Останавливает индикатор и показывает итог в том же сообщении (с учётом интервала чата)."""
+        await self.stop()
+        if text != self._shown or reply_markup is not None:
+            await self._send(text, reply_markup)
+
+    async def _run(self):
+        chat_id = self.message.chat.id
+        frame = 0
+        while True:
+            timeout = self.min_interval if self.frames and self._pending is None else None
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                if self.frames:
+                    self._pending = self.frames[frame % len(self.frames)]
+                    frame += 1
+            self._wake.clear()
+            # Ждём окно правки чата, потом берём самый свежий текст — промежуточные отбрасываются
+            wait = _next_edit_at.get(chat_id, 0.0) - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            text, self._pending = self._pending, None
+            if text is None or text == self._shown:
+                continue
+            try:
+                await self._send(text)
+            except Exception as e:
+                # Сообщение удалено/недоступно — индикатор больше не нужен, обработчик продолжает работу
+                logger.info(f"[PROGRESS] Индикатор остановлен: {e}")
+                return
+
+    async def _send(self, text: str, reply_markup=None):
+        """Одна правка с соблюдением интервала чата; при TelegramRetryAfter — ждём и повторяем."""
+        chat_id = self.message.chat.id
+        while True:
+            wait = _reserve_slot(chat_id, self.min_interval)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                await self.message.edit_text(text, reply_markup=reply_markup, parse_mode=self.parse_mode)
+            except TelegramRetryAfter as e:
+                _next_edit_at[chat_id] = time.monotonic() + e.retry_after
+                continue
+            except TelegramBadRequest as e:
+                if "message is not modified" not in str(e):
+                    raise
+            self._shown = text
+            return
@@ -0,0 +1,159 @@
+"""
+bot/utils/sales_dataset.py
+
+Продажи за период в колоночном виде — строится один раз при загрузке и используется всеми отчётами по продажам.
+- Строка — дневной агрегат день × склад × артикул (storage/sales.py, sales_daily_rollup).
+- Колонки — array: day (номер дня от 1970-01-01), warehouse_id (NO_WAREHOUSE — склад не определён),
+  warehouse_name и article (коды словарей warehouse_names / articles), qty и суммы по типам цен (prices),
+  время первой продажи строки (first_at, секунды от 1970-01-01) и её цены (first_prices) — цена в отчётах
+  берётся по первой продаже периода, как при подсчёте по строкам WB.
+  Строки не хранят повторяющихся строк и неиспользуемых полей WB: ~50 байт на строку вместо словаря.
+- Обратные индексы артикул -> номера строк и склад -> номера строк строятся при первом обращении:
+  переход к артикулу или складу стоит O(его строк), а не O(всех продаж).
+- take/between/rows_for_* возвращают поднабор с общими словарями; выборка и фильтр по дням —
+  через бэкенд агрегации (bot/utils/aggregation.py, векторно при numpy).
+"""
+
+from array import array
+from datetime import date, datetime
+
+from bot.utils.aggregation import NO_WAREHOUSE, get_aggregation_backend
+
+# Типы цен WB, по которым строятся отчёты (настройка пользователя, см. price_type_human)
+PRICE_TYPES = ("totalPrice", "priceWithDisc", "finishedPrice", "forPay")
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def epoch_day(value) -> int:
+    if isinstance(value, datetime):
+        value = value.date()
+    return value.toordinal() - _EPOCH_ORDINAL
+
+
+def from_epoch_day(day: int) -> date:
+    return date.fromordinal(day + _EPOCH_ORDINAL)
+
+
+def epoch_seconds(value: datetime) -> int:
+    return (value.toordinal() - _EPOCH_ORDINAL) * 86400 + value.hour * 3600 + value.minute * 60 + value.second
+
+
+def _article_key(value) -> str:
+    return str(value) if value is not None else ""
+
+
+class SalesDataset:
+    def __init__(self, day, warehouse_id, warehouse_name, article, qty, prices, first_at, first_prices,
+                 warehouse_names, articles):
+        self.day = day
+        self.warehouse_id = warehouse_id
+        self.warehouse_name = warehouse_name
+        self.article = article
+        self.qty = qty
+        self.prices = prices
+        self.first_at = first_at
+        self.first_prices = first_prices
+        self.warehouse_names = warehouse_names
+        self.articles = articles
+        self._by_article = None
+        self._by_warehouse = None
+        self._article_codes = None
+
+    @classmethod
+    def from_rows(cls, rows: list[dict]) -> "SalesDataset":
+        """
+        rows — агрегаты с полями day, warehouseId, warehouseName, supplierArticle, qty, суммами по PRICE_TYPES
+        и первой продажей (firstSaleAt, <тип цены>First). Без первой продажи — начало дня и средняя цена.
+        """
+        warehouse_codes, article_codes = {}, {}
+        day, warehouse_id, warehouse_name, article, qty = (array("i") for _ in range(5))
+        prices = {pt: array("d") for pt in PRICE_TYPES}
+        first_at = array("q")
+        first_prices = {pt: array("d") for pt in PRICE_TYPES}
+        for row in rows:
+            day.append(epoch_day(row["day"]))
+            wh_id = row.get("warehouseId")
+            warehouse_id.append(NO_WAREHOUSE if wh_id is None else int(wh_id))
+            warehouse_name.append(warehouse_codes.setdefault(row.get("warehouseName") or "", len(warehouse_codes)))
+            article.append(article_codes.setdefault(_article_key(row.get("supplierArticle")), len(article_codes)))
+            qty.append(int(row["qty"]))
+            first_sale_at = row.get("firstSaleAt")
+            first_at.append(epoch_seconds(first_sale_at) if first_sale_at is not None else day[-1] * 86400)
+            for pt in PRICE_TYPES:
+                prices[pt].append(float(row.get(pt) or 0))
+                first_price = row.get(f"{pt}First")
+                if first_price is None:
+                    first_price = prices[pt][-1] / qty[-1] if qty[-1] else 0.0
+                first_prices[pt].append(float(first_price))
+        return cls(day, warehouse_id, warehouse_name, article, qty, prices, first_at, first_prices,
+                   list(warehouse_codes), list(article_codes))
+
+    def __len__(self):
+        return len(self.day)
+
+    def __getstate__(self):
+        # Индексы не сохраняем (Redis-кэш) — после загрузки они построятся заново при обращении
+        state = self.__dict__.copy()
+        state["_by_article"] = state["_by_warehouse"] = state["_article_codes"] = None
+        return state
+
+    def _build_indexes(self):
+        by_article, by_warehouse = {}, {}
+        for row_id, (art, wh_id) in enumerate(zip(self.article, self.warehouse_id)):
+            ids = by_article.get(art)
+            if ids is None:
+                ids = by_article[art] = array("I")
+            ids.append(row_id)
+            ids = by_warehouse.get(wh_id)
+            if ids is None:
+                ids = by_warehouse[wh_id] = array("I")
+            ids.append(row_id)
+        self._by_article, self._by_warehouse = by_article, by_warehouse
+
+    @property
+    def by_article(self) -> dict:
+        """Код артикула -> номера строк."""
+        if self._by_article is None:
+            self._build_indexes()
+        return self._by_article
+
+    @property
+    def by_warehouse(self) -> dict:
+        """ID склада (или NO_WAREHOUSE) -> номера строк."""
+        if self._by_warehouse is None:
+            self._build_indexes()
+        return self._by_warehouse
+
+    def take(self, row_ids) -> "SalesDataset":
+        backend = get_aggregation_backend(len(self))
+
+        def pick(column):
+            return backend.take(column, row_ids)
+
+        return SalesDataset(
+            pick(self.day), pick(self.warehouse_id), pick(self.warehouse_name), pick(self.article), pick(self.qty),
+            {pt: pick(col) for pt, col in self.prices.items()},
+            pick(self.first_at), {pt: pick(col) for pt, col in self.first_prices.items()},
+            self.warehouse_names, self.articles,
+        )
+
+    def between(self, date_from, date_to) -> "SalesDataset":
+        backend = get_aggregation_backend(len(self))
+        return self.take(backend.filter_range(self.day, epoch_day(date_from), epoch_day(date_to)))
+
+    def rows_for_article(self, art) -> "SalesDataset":
+        if self._article_codes is None:
+            self._article_codes = {a: code for code, a in enumerate(self.articles)}
+        code = self._article_codes.get(_article_key(art))
+        return self.take(self.by_article.get(code, ()))
+
+    def rows_for_warehouse(self, warehouse_id) -> "SalesDataset":
+        """
+        Строки склада по ID. Строки без склада (не найден в индексе при загрузке) добавляются
+        как кандидаты — группировка сопоставит их со складом по названию.
+        """
+        ids = list(self.by_warehouse.get(int(warehouse_id), ()))
+        ids += self.by_warehouse.get(NO_WAREHOUSE, ())
+        ids.sort()
+        return self.take(ids)
@@ -0,0 +1,120 @@
+"""
+bot/utils/sales_grouping.py
+
+Группировка продаж для отчётов по складам — за один проход по данным (бэкенд агрегации: bot/utils/aggregation.py).
+Склад -> артикул -> {"qty", "sums", "first"} + итоги по складу и по всем складам.
+Суммы копятся сразу по всем типам цен (PRICE_TYPES): смена типа цены в настройках меняет только
+отрисовку (select_price), без повторной группировки и запросов.
+Цена в отчёте — цена первой продажи группы за период ("first"), как при подсчёте по строкам WB.
+Результат строится один раз на набор данных и переиспользуется страницами, итогами и экспортом.
+"""
+
+from bot.utils.aggregation import get_aggregation_backend
+from bot.utils.sales_dataset import PRICE_TYPES, SalesDataset
+from bot.utils.text_utils import normalize_warehouse_name
+
+
+def empty_sums() -> dict:
+    return dict.fromkeys(PRICE_TYPES, 0.0)
+
+
+def group_sales_by_warehouse(dataset: SalesDataset, warehouses: list[dict], backend=None) -> dict:
+    """
+    dataset — продажи за период (SalesDataset).
+    Склад определяется по warehouse_id (проставлен при загрузке), для строк без него — по названию.
+    warehouses — справочник складов [{"id", "name"}]; склады без продаж в результат не попадают,
+    порядок складов — как в справочнике, артикулов — по первому появлению в наборе.
+    backend — бэкенд агрегации; по умолчанию выбирается по размеру набора.
+
+    Возвращает:
+    {
+        "warehouses": {имя склада: {"id", "articles": {артикул: {"qty", "sums", "first"}}, "qty", "sums"}},
+        "qty": всего шт, "sums": всего ₽ по каждому типу цены,
+    }
+    """
+    id_to_index = {}
+    # Нормализованное имя -> индекс склада в справочнике (первый при совпадении)
+    by_norm = {}
+    for index, wh in enumerate(warehouses):
+        id_to_index.setdefault(wh["id"], index)
+        by_norm.setdefault(normalize_warehouse_name(wh["name"]), index)
+    # Склад для каждого кода названия — нормализация один раз на название, а не на строку
+    name_to_index = [by_norm.get(normalize_warehouse_name(name), -1) for name in dataset.warehouse_names]
+
+    backend = backend or get_aggregation_backend(len(dataset))
+    n_articles = max(1, len(dataset.articles))
+    keys = backend.encode_warehouse_keys(
+        dataset.warehouse_id, dataset.warehouse_name, dataset.article, id_to_index, name_to_index, n_articles,
+    )
+    group_keys, (qty_sums, *price_sums) = backend.group_sum(
+        keys, [dataset.qty, *(dataset.prices[pt] for pt in PRICE_TYPES)],
+    )
+    _, first_prices = backend.group_first(keys, dataset.first_at, [dataset.first_prices[pt] for pt in PRICE_TYPES])
+
+    groups = {}
+    for position, key in enumerate(group_keys):
+        index, art_code = divmod(key, n_articles)
+        wh = warehouses[index]
+        group = groups.get(index)
+        if group is None:
+            group = groups[index] = {"id": wh["id"], "articles": {}, "qty": 0, "sums": empty_sums()}
+        qty = int(qty_sums[position])
+        sums = {pt: column[position] for pt, column in zip(PRICE_TYPES, price_sums)}
+        first = {pt: column[position] for pt, column in zip(PRICE_TYPES, first_prices)}
+        group["articles"][dataset.articles[art_code] or "—"] = {"qty": qty, "sums": sums, "first": first}
+        group["qty"] += qty
+        for price_type in PRICE_TYPES:
+            group["sums"][price_type] += sums[price_type]
+
+    ordered = {warehouses[index]["name"]: groups[index] for index in sorted(groups)}
+    totals = empty_sums()
+    for group in ordered.values():
+        for price_type in PRICE_TYPES:
+            totals[price_type] += group["sums"][price_type]
+    return {
+        "warehouses": ordered,
+        "qty": sum(g["qty"] for g in ordered.values()),
+        "sums": totals,
+    }
+
+
+def group_sales_by_warehouse_name(dataset: SalesDataset, backend=None) -> dict:
+    """Итоги по названиям складов (отчёт по артикулу): {название: {"qty", "sums", "first"}}."""
+    backend = backend or get_aggregation_backend(len(dataset))
+    name_codes, (qty_sums, *price_sums) = backend.group_sum(
+        dataset.warehouse_name, [dataset.qty, *(dataset.prices[pt] for pt in PRICE_TYPES)],
+    )
+    _, first_prices = backend.group_first(
+        dataset.warehouse_name, dataset.first_at, [dataset.first_prices[pt] for pt in PRICE_TYPES],
+    )
+    groups = {}
+    for position, name_code in enumerate(name_codes):
+        name = dataset.warehouse_names[name_code] or "—"
+        group = groups.get(name)
+        if group is None:
+            # Первая продажа — из первого кода с этим названием (коды названий уникальны, кроме "" -> "—")
+            group = groups[name] = {
+                "qty": 0, "sums": empty_sums(),
+                "first": {pt: column[position] for pt, column in zip(PRICE_TYPES, first_prices)},
+            }
+        group["qty"] += int(qty_sums[position])
+        for price_type, column in zip(PRICE_TYPES, price_sums):
+            group["sums"][price_type] += column[position]
+    return groups
+
+
+def select_price(grouping: dict, price_type: str) -> dict:
+    """
+    Вид группировки для одного типа цены — то, что рисуют страницы и экспорт:
+    {"warehouses": {имя: {"id", "articles": {артикул: {"qty", "sum", "price"}}, "qty", "sum"}}, "qty", "sum"}.
+    Проход только по готовым группам, строки продаж не перебираются.
+    """
+    warehouses = {}
+    for wh_name, group in grouping["warehouses"].items():
+        articles = {}
+        for art, st in group["articles"].items():
+            articles[art] = {"qty": st["qty"], "sum": st["sums"][price_type], "price": st["first"][price_type]}
+        warehouses[wh_name] = {
+            "id": group["id"], "articles": articles, "qty": group["qty"], "sum": group["sums"][price_type],
+        }
+    return {"warehouses": warehouses, "qty": grouping["qty"], "sum": grouping["sums"][price_type]}
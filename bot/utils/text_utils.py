@@ -1,26 +1,30 @@
-# utils/text_utils.py
+# bot/utils/text_utils.py
 
 import re
+from functools import lru_cache
 
+# "Мусорные" слова в названиях складов (порядок важен: длинные варианты раньше коротких)
+_WAREHOUSE_NOISE_WORDS = (
+    "склад продавца", "склад", "центр обработки", "центр", "wb", "wildberries",
+    "логистический", "комплекс", "отделение",
+)
+# Одно регулярное выражение за один проход: мусорные слова + всё, кроме букв и цифр
+_WAREHOUSE_NORMALIZE_RE = re.compile(
+    "|".join(re.escape(word) for word in _WAREHOUSE_NOISE_WORDS) + r"|[^a-zа-я0-9]"
+)
+_YO_TABLE = str.maketrans("ё", "е")
+
+@lru_cache(maxsize=4096)
 def normalize_warehouse_name(name: str) -> str:
     """
     Приводит название склада к унифицированному виду для корректного сравнения.
     Удаляет лишние слова, приводит к нижнему регистру, убирает спецсимволы и пробелы.
+    Результат кэшируется: названий складов немного, а вызовов — на каждую строку продаж.
     """
     if not name:
         return ""
-    name = name.lower()
-    name = name.replace("ё", "е")
-    # Удаляем часто встречающиеся "мусорные" слова
-    remove_words = [
-        "склад продавца", "склад", "центр обработки", "центр", "wb", "wildberries",
-        "логистический", "комплекс", "отделение", " ", "-", "_"
-    ]
-    for word in remove_words:
-        name = name.replace(word, "")
-    # Оставляем только буквы и цифры
-    name = re.sub(r'[^a-zа-я0-9]', '', name)
-    return name.strip()
+    name = name.lower().translate(_YO_TABLE)
+    return _WAREHOUSE_NORMALIZE_RE.sub("", name)
 
 def is_positive_float(d: dict, key: str) -> bool:
     """
@@ -0,0 +1,78 @@
+"""
+bot/utils/xlsx_export.py
+
+Потоковый экспорт XLSX для отчётов.
+- openpyxl в режиме write_only: строки сразу уходят в файл, рабочая книга целиком в памяти не строится.
+- Ширина колонок считается по мере перебора строк; в write_only её нужно задать до первой строки,
+  поэтому строки перебираются дважды — rows() вызывается на каждый проход (генератор по готовым агрегатам).
+- Отправка (временный файл, пул процессов, FSInputFile) — общая для всех форматов: bot/utils/exporters.py,
+  формат "xlsx".
+
+Использование:
+    def _rows(price_type_name, stat):
+        yield [f"Цена: {price_type_name}"]
+        yield bold(["Склад", "Артикул", "Кол-во"])
+        for ...:
+            yield [wh_name, art, qty]
+
+    await send_export(callback.message, "report", "xlsx", _rows, (price_type_name, stat), title="Продажи")
+"""
+
+from typing import Callable, Iterable, NamedTuple
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font
+from openpyxl.utils import get_column_letter
+
+_BOLD = Font(bold=True)
+_CENTER = Alignment(horizontal="center", vertical="center")
+
+
+class StyledRow(NamedTuple):
+    values: list
+    bold: bool = False
+    center: bool = False
+
+
+def bold(values: list, center: bool = False) -> StyledRow:
+    """Строка жирным шрифтом (заголовки, итоги)."""
+    return StyledRow(list(values), bold=True, center=center)
+
+
+def _values(row) -> list:
+    return row.values if isinstance(row, StyledRow) else row
+
+
+def measure_widths(rows: Iterable, min_width: int = 0, padding: int = 2) -> dict[int, int]:
+    """Ширина колонок по содержимому: номер колонки (с 1) -> max(min_width, длина + padding)."""
+    lengths: dict[int, int] = {}
+    for row in rows:
+        for column, value in enumerate(_values(row), 1):
+            if value:
+                lengths[column] = max(lengths.get(column, 0), len(str(value)))
+    return {column: max(min_width, length + padding) for column, length in lengths.items()}
+
+
+def write_xlsx(path: str, title: str, rows: Callable[..., Iterable], args: tuple = (), min_width: int = 0) -> str:
+    """Записывает лист title из строк rows(*args) в файл path (write_only). Возвращает path."""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title)
+    for column, width in measure_widths(rows(*args), min_width).items():
+        ws.column_dimensions[get_column_letter(column)].width = width
+
+    for row in rows(*args):
+        if isinstance(row, StyledRow) and (row.bold or row.center):
+            cells = []
+            for value in row.values:
+                cell = WriteOnlyCell(ws, value=value)
+                if row.bold:
+                    cell.font = _BOLD
+                if row.center:
+                    cell.alignment = _CENTER
+                cells.append(cell)
+            ws.append(cells)
+        else:
+            ws.append(list(_values(row)))
+    wb.save(path)
+    return path
@@ -5,11 +5,27 @@ config.py — загрузка и хранение основных параме
 - Загружает переменные среды из файла .env с помощью dotenv.
 - BOT_TOKEN: Telegram Bot API Token (для запуска и авторизации бота).
 - POSTGRES_DSN: строка подключения к базе данных PostgreSQL (используется SQLAlchemy).
-- Можно добавить дополнительные параметры (например, REDIS_DSN), если потребуется.
+- WB_POOL_*, WB_DNS_CACHE_TTL, WB_KEEPALIVE_TIMEOUT, WB_REQUEST_TIMEOUT: настройки общего
+  пула HTTP-соединений к API Wildberries (bot/services/wb_client.py).
+- REDIS_DSN: строка подключения к Redis (общие лимиты WB API между процессами бота и т.п.).
+- WB_RATE_LIMITS, RATE_LIMIT_BACKEND: квоты WB API и бэкенд лимитера (bot/services/rate_limiter.py).
+- SALES_SYNC_*: инкрементальная синхронизация продаж в локальную базу (bot/services/sales_sync.py).
+- STOCK_SYNC_*, STOCK_HISTORY_*: синхронизация остатков в локальную базу и их история (bot/services/stock_sync.py).
+- REPORT_STORE_*: серверное хранилище данных отчётов вместо FSM (bot/services/report_store.py).
+- REPORT_CACHE_*: кэш готовых результатов отчётов по параметрам запроса (bot/services/report_cache.py).
+- AGGREGATION_*: бэкенд группировок отчётов — чистый Python или numpy (bot/utils/aggregation.py).
+- PROCESS_POOL_*: пул процессов для тяжёлых группировок и сборки XLSX (bot/services/process_pool.py).
+- EXPORT_*: выгрузка отчётов в файлы — CSV/CSV.gz/NDJSON/XLSX, автоупаковка в ZIP (bot/utils/exporters.py),
+  дисковый кэш готовых файлов и их file_id в Telegram (bot/services/export_cache.py).
+- STOCKS_CACHE_*: снимок остатков пользователя для отчёта «Остатки» (bot/services/stocks_cache.py).
+- PROGRESS_*: индикатор хода формирования отчёта — склейка правок сообщения по чату (bot/utils/progress.py).
+- FSM_*: хранилище состояний aiogram — память или Redis с msgpack/zstd и TTL (bot/services/fsm_storage.py).
+- PREFETCH_*: ночная предзагрузка продаж/остатков активных пользователей (bot/services/prefetch.py).
 
 Все параметры доступны из других частей проекта через импорт этого файла.
 """
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()  # Загружает переменные из .env
@@ -17,3 +33,81 @@ load_dotenv()  # Загружает переменные из .env
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 POSTGRES_DSN = os.getenv("POSTGRES_DSN")
 ADMINS = [699875303]  # сюда твой Telegram user_id, и других админов, если есть
+
+# --- Пул HTTP-соединений к API Wildberries ---
+WB_POOL_LIMIT = int(os.getenv("WB_POOL_LIMIT", "100"))                  # всего соединений на хост-пул
+WB_POOL_LIMIT_PER_HOST = int(os.getenv("WB_POOL_LIMIT_PER_HOST", "20"))  # одновременных соединений к одному хосту
+WB_DNS_CACHE_TTL = int(os.getenv("WB_DNS_CACHE_TTL", "300"))            # секунд
+WB_KEEPALIVE_TIMEOUT = float(os.getenv("WB_KEEPALIVE_TIMEOUT", "60"))   # секунд
+WB_REQUEST_TIMEOUT = float(os.getenv("WB_REQUEST_TIMEOUT", "30"))       # секунд
+
+REDIS_DSN = os.getenv("REDIS_DSN")  # например: redis://redis:6379/0
+
+# --- Лимиты запросов к API Wildberries (token bucket на пару API-ключ + семейство методов) ---
+# семейство: (ёмкость корзины, за сколько секунд она полностью восполняется)
+WB_RATE_LIMITS = {
+    "sales": (1, 60.0),      # statistics-api: /supplier/sales — 1 запрос в минуту
+    "stocks": (1, 60.0),     # statistics-api: /supplier/stocks — 1 запрос в минуту
+    "supplies": (6, 60.0),   # supplies-api: склады
+    "common": (10, 60.0),    # common-api: seller-info
+}
+# "memory" — лимиты в памяти процесса; "redis" — общий бюджет для всех процессов (нужен REDIS_DSN)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "redis" if REDIS_DSN else "memory")
+
+# --- Инкрементальная синхронизация продаж (lastChangeDate) ---
+SALES_SYNC_MIN_INTERVAL = int(os.getenv("SALES_SYNC_MIN_INTERVAL", "300"))  # сек. между дельта-запросами к WB
+SALES_SYNC_INITIAL_DAYS = int(os.getenv("SALES_SYNC_INITIAL_DAYS", "90"))   # глубина первой загрузки без периода
+
+# --- Синхронизация остатков (таблица stocks, дельты по lastChangeDate) ---
+STOCK_SYNC_MIN_INTERVAL = int(os.getenv("STOCK_SYNC_MIN_INTERVAL", "300"))  # сек. между дельта-запросами к WB
+STOCK_HISTORY_CHECKPOINT_DAYS = int(os.getenv("STOCK_HISTORY_CHECKPOINT_DAYS", "7"))  # дней между полными снимками истории
+
+# --- Фоновая предзагрузка данных WB (ночью, до первых отчётов) ---
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "1") == "1"          # запускать задачу в процессе бота
+PREFETCH_HOUR = int(os.getenv("PREFETCH_HOUR", "5"))                 # час запуска (Europe/Berlin, как и планировщик)
+PREFETCH_SHARD_COUNT = int(os.getenv("PREFETCH_SHARD_COUNT", "1"))   # сколько воркеров делят пользователей
+PREFETCH_SHARD_INDEX = int(os.getenv("PREFETCH_SHARD_INDEX", "0"))   # номер шарда этого процесса: 0..COUNT-1
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", "5"))   # пользователей одновременно в одном воркере
+PREFETCH_MAX_ATTEMPTS = int(os.getenv("PREFETCH_MAX_ATTEMPTS", "3"))  # попыток на пользователя при лимите WB
+
+# --- Хранилище данных отчётов (в FSM — только handle) ---
+REPORT_STORE_MAX_ITEMS = int(os.getenv("REPORT_STORE_MAX_ITEMS", "200"))  # отчётов в памяти процесса (LRU)
+REPORT_STORE_TTL = int(os.getenv("REPORT_STORE_TTL", "3600"))            # сек. жизни отчёта
+REPORT_STORE_REDIS = os.getenv("REPORT_STORE_REDIS", "1" if REDIS_DSN else "0") == "1"  # второй уровень в Redis
+
+# --- Кэш результатов отчётов (тот же период и параметры — без пересчёта) ---
+REPORT_CACHE_MAX_ITEMS = int(os.getenv("REPORT_CACHE_MAX_ITEMS", "500"))    # результатов в памяти процесса (LRU)
+REPORT_CACHE_TTL_TODAY = int(os.getenv("REPORT_CACHE_TTL_TODAY", "300"))    # сек., если период включает сегодня
+REPORT_CACHE_TTL_PAST = int(os.getenv("REPORT_CACHE_TTL_PAST", "21600"))    # сек. для закрытого периода
+REPORT_CACHE_DATASET_MAX_ITEMS = int(os.getenv("REPORT_CACHE_DATASET_MAX_ITEMS", "50"))  # наборов продаж за период (отдельный LRU)
+
+# --- Бэкенд агрегации отчётов ---
+# "auto" — numpy (если установлен) для наборов от AGGREGATION_NUMPY_MIN_ROWS строк, иначе чистый Python;
+# "numpy" / "python" — принудительно. Точка перелома для своей машины: python benchmark_aggregation.py
+AGGREGATION_BACKEND = os.getenv("AGGREGATION_BACKEND", "auto")
+AGGREGATION_NUMPY_MIN_ROWS = int(os.getenv("AGGREGATION_NUMPY_MIN_ROWS", "200"))
+
+# --- Пул процессов для CPU-задач отчётов (0 — без пула, задачи в потоке) ---
+PROCESS_POOL_SIZE = int(os.getenv("PROCESS_POOL_SIZE", str(min(4, os.cpu_count() or 1))))
+PROCESS_POOL_TIMEOUT = float(os.getenv("PROCESS_POOL_TIMEOUT", "120"))   # сек. на одну задачу
+PROCESS_POOL_MIN_ROWS = int(os.getenv("PROCESS_POOL_MIN_ROWS", "20000"))  # меньшие наборы считаются сразу
+
+# --- Выгрузка отчётов в файлы: больше порога — в ZIP (лимит Telegram на документ 50 МБ) ---
+EXPORT_ZIP_MIN_SIZE = int(os.getenv("EXPORT_ZIP_MIN_SIZE", str(45 * 1024 * 1024)))
+EXPORT_CACHE_DIR = os.getenv("EXPORT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "wb_export_cache"))
+EXPORT_CACHE_MAX_BYTES = int(os.getenv("EXPORT_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))  # 0 — без кэша
+EXPORT_FILE_ID_MAX_ITEMS = int(os.getenv("EXPORT_FILE_ID_MAX_ITEMS", "5000"))  # file_id отправленных файлов (LRU)
+
+# --- Снимок остатков для отчёта «Остатки»: /supplier/stocks не чаще раза в TTL на пользователя ---
+STOCKS_CACHE_TTL = int(os.getenv("STOCKS_CACHE_TTL", "300"))            # сек.
+STOCKS_CACHE_MAX_ITEMS = int(os.getenv("STOCKS_CACHE_MAX_ITEMS", "500"))  # снимков в памяти процесса (LRU)
+
+# --- Индикатор хода отчёта: правки сообщения не чаще раза в интервал на чат (лимиты Telegram) ---
+PROGRESS_MIN_INTERVAL = float(os.getenv("PROGRESS_MIN_INTERVAL", "1.5"))  # сек.
+
+# --- Хранилище FSM (состояния и данные диалогов) ---
+# "memory" — в памяти процесса (один процесс бота); "redis" — общее для процессов, переживает перезапуск
+FSM_STORAGE = os.getenv("FSM_STORAGE", "redis" if REDIS_DSN else "memory")
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", str(2 * 24 * 3600)))  # сек. хранения состояния неактивного пользователя
+FSM_DATA_TTL = int(os.getenv("FSM_DATA_TTL", str(2 * 24 * 3600)))    # сек. хранения данных неактивного пользователя
+FSM_COMPRESS_MIN_SIZE = int(os.getenv("FSM_COMPRESS_MIN_SIZE", "1024"))  # байт; данные крупнее сжимаются zstd
@@ -4,10 +4,22 @@ models.py — SQLAlchemy ORM-модели для хранения данных 
 UserAccess — основная модель, расширенная для хранения seller_name и trade_mark.
 Warehouse — модель для кэширования складов Wildberries.
 WarehouseCacheInfo — модель для хранения информации о последнем обновлении кеша складов.
+WarehouseNameIndex — индекс «нормализованное название склада -> ID склада» (обновляется с кэшем складов).
 Article — модель для хранения кэша артикулов.
+Sale — факт-таблица продаж WB (строки /supplier/sales): партиции по месяцам даты продажи,
+       BRIN-индекс по дате, b-tree по (user_id, артикул) и (user_id, склад).
+SalesDailyRollup — дневные агрегаты продаж (пользователь, день, склад, артикул): кол-во, суммы и цены первой
+                   продажи дня по всем типам цен.
+SalesSyncState — состояние синхронизации продаж пользователя (high-water mark по lastChangeDate).
+Stock — текущие остатки пользователя (строки /supplier/stocks) по (nmId, баркод, склад), обновляются дельтами.
+StockSyncState — состояние синхронизации остатков пользователя (high-water mark по lastChangeDate).
+StockHistoryDelta — история остатков: изменение за день по (артикул, склад), только ненулевые.
+StockHistoryCheckpoint — история остатков: полный снимок на начало дня (сжатый), раз в несколько дней.
 """
 
-from sqlalchemy import Column, BigInteger, DateTime, Boolean, String, Integer, func
+from sqlalchemy import (
+    Column, BigInteger, Date, DateTime, Boolean, String, Integer, Float, LargeBinary, Index, DDL, event, func,
+)
 from .db import Base
 
 class UserAccess(Base):
@@ -51,6 +63,12 @@ class WarehouseCacheInfo(Base):
     updated_at = Column(DateTime, default=func.now(), nullable=False)
     updated_by = Column(BigInteger, nullable=True)  # user_id, который обновил кэш
 
+class WarehouseNameIndex(Base):
+    __tablename__ = "warehouse_name_index"
+
+    name_norm = Column(String, primary_key=True)  # normalize_warehouse_name(name)
+    warehouse_id = Column(Integer, nullable=False)
+
 class Article(Base):
     __tablename__ = "articles"
 
@@ -67,4 +85,104 @@ class BillingHistory(Base):
     user_id = Column(BigInteger, nullable=False)
     amount_spent = Column(Integer, default=0)
     days_spent = Column(Integer, default=0)
-    timestamp = Column(DateTime, default=func.now())
\ No newline at end of file
+    timestamp = Column(DateTime, default=func.now())
+
+class Sale(Base):
+    __tablename__ = "sales"
+    __table_args__ = (
+        Index("ix_sales_sale_date_brin", "sale_date", postgresql_using="brin"),
+        Index("ix_sales_user_article", "user_id", "supplier_article"),
+        Index("ix_sales_user_warehouse", "user_id", "warehouse_name"),
+        # Партиции по месяцам создаются при загрузке (storage/sales.py: ensure_sales_partitions)
+        {"postgresql_partition_by": "RANGE (sale_date)"},
+    )
+
+    user_id = Column(BigInteger, primary_key=True)
+    srid = Column(String, primary_key=True)            # уникальный идентификатор строки продажи WB
+    sale_date = Column(DateTime, primary_key=True)     # date; ключ партиционирования входит в PK
+    last_change_date = Column(DateTime, nullable=False)       # lastChangeDate
+    warehouse_name = Column(String)                    # warehouseName
+    warehouse_id = Column(Integer)                     # ID склада по индексу названий, при загрузке
+    supplier_article = Column(String)                  # supplierArticle
+    nm_id = Column(BigInteger)                         # nmId
+    barcode = Column(String)
+    subject = Column(String)
+    total_price = Column(Float, default=0)             # totalPrice
+    price_with_disc = Column(Float, default=0)         # priceWithDisc
+    finished_price = Column(Float, default=0)          # finishedPrice
+    for_pay = Column(Float, default=0)                 # forPay
+    sale_id = Column(String)                           # saleID (S — продажа, R — возврат)
+
+# Партиция по умолчанию — для строк вне созданных месячных партиций
+event.listen(
+    Sale.__table__,
+    "after_create",
+    DDL("CREATE TABLE IF NOT EXISTS sales_default PARTITION OF sales DEFAULT"),
+)
+
+class SalesDailyRollup(Base):
+    """Пересчитывается по затронутым дням при каждой загрузке продаж (storage/sales.py)."""
+    __tablename__ = "sales_daily_rollup"
+
+    user_id = Column(BigInteger, primary_key=True)
+    day = Column(Date, primary_key=True)
+    warehouse_name = Column(String, primary_key=True)
+    supplier_article = Column(String, primary_key=True)
+    warehouse_id = Column(Integer, nullable=True)
+    qty = Column(Integer, default=0, nullable=False)
+    total_price = Column(Float, default=0)      # сумма totalPrice
+    price_with_disc = Column(Float, default=0)  # сумма priceWithDisc
+    finished_price = Column(Float, default=0)   # сумма finishedPrice
+    for_pay = Column(Float, default=0)          # сумма forPay
+    # Первая продажа дня в группе — цена в отчётах берётся по первой продаже периода
+    first_sale_at = Column(DateTime, nullable=True)
+    first_total_price = Column(Float, nullable=True)
+    first_price_with_disc = Column(Float, nullable=True)
+    first_finished_price = Column(Float, nullable=True)
+    first_for_pay = Column(Float, nullable=True)
+
+class SalesSyncState(Base):
+    __tablename__ = "sales_sync_state"
+
+    user_id = Column(BigInteger, primary_key=True)
+    synced_from = Column(DateTime, nullable=True)       # с какой даты продаж локальные данные полные
+    last_change_date = Column(DateTime, nullable=True)  # максимальный lastChangeDate среди загруженных строк
+    synced_at = Column(DateTime, nullable=True)         # когда была последняя успешная синхронизация
+
+class Stock(Base):
+    __tablename__ = "stocks"
+
+    user_id = Column(BigInteger, primary_key=True)
+    nm_id = Column(BigInteger, primary_key=True)               # nmId
+    barcode = Column(String, primary_key=True)                 # barcode ("" — если WB не прислал)
+    warehouse_name = Column(String, primary_key=True)          # warehouseName
+    supplier_article = Column(String)                          # supplierArticle
+    subject = Column(String)
+    quantity = Column(Integer, default=0, nullable=False)      # доступно к продаже
+    quantity_full = Column(Integer, default=0)                 # quantityFull (с учётом в пути)
+    in_way_to_client = Column(Integer, default=0)              # inWayToClient
+    in_way_from_client = Column(Integer, default=0)            # inWayFromClient
+    last_change_date = Column(DateTime, nullable=False)        # lastChangeDate
+
+class StockSyncState(Base):
+    __tablename__ = "stock_sync_state"
+
+    user_id = Column(BigInteger, primary_key=True)
+    last_change_date = Column(DateTime, nullable=True)  # максимальный lastChangeDate среди загруженных строк
+    synced_at = Column(DateTime, nullable=True)         # когда была последняя успешная синхронизация
+
+class StockHistoryDelta(Base):
+    __tablename__ = "stock_history_deltas"
+
+    user_id = Column(BigInteger, primary_key=True)
+    day = Column(Date, primary_key=True)
+    supplier_article = Column(String, primary_key=True)
+    warehouse_name = Column(String, primary_key=True)
+    delta = Column(Integer, nullable=False)  # сумма изменений quantity за день
+
+class StockHistoryCheckpoint(Base):
+    __tablename__ = "stock_history_checkpoints"
+
+    user_id = Column(BigInteger, primary_key=True)
+    day = Column(Date, primary_key=True)          # снимок на начало этого дня
+    payload = Column(LargeBinary, nullable=False)  # zlib(JSON [[артикул, склад, остаток], ...])
@@ -0,0 +1,304 @@
+"""
+storage/sales.py
+
+Локальное хранилище продаж Wildberries (таблица sales) и состояние их синхронизации.
+- upsert_sales: массовая загрузка строк /supplier/sales через asyncpg COPY во временную таблицу
+  и один INSERT ... ON CONFLICT (повторная загрузка той же строки по srid — обновление).
+- ensure_sales_partitions: месячные партиции таблицы sales создаются до загрузки.
+- При загрузке строке проставляется warehouse_id по индексу названий складов (storage/warehouses.py).
+- Дневные агрегаты (sales_daily_rollup) пересчитываются по затронутым дням в той же транзакции;
+  кроме сумм в них хранится первая продажа дня (время и цены) — цена в отчётах по первой продаже.
+- query_sales_rollup: GROUP BY по агрегатам за любой период — отчёты получают готовые суммы
+  и цены первой продажи периода.
+- migrate_sales_rollup: колонки первой продажи в существующей таблице и их однократное заполнение.
+- load_sales: продажи за период из базы в формате строк WB API (как их ждут отчёты).
+- get/set_sales_sync_state: high-water mark по lastChangeDate для инкрементальной синхронизации.
+"""
+
+from datetime import datetime, timedelta
+
+import logging
+
+from sqlalchemy import text, func
+from sqlalchemy.future import select
+from sqlalchemy.dialects.postgresql import insert, array_agg, aggregate_order_by
+
+from .db import AsyncSessionLocal, engine
+from .models import Sale, SalesSyncState, SalesDailyRollup
+from .warehouses import get_warehouse_name_index
+from bot.utils.text_utils import normalize_warehouse_name
+
+logger = logging.getLogger(__name__)
+
+COPY_BATCH_SIZE = 50000
+
+# Поля строки WB API -> колонки таблицы sales
+WB_SALE_FIELDS = {
+    "srid": "srid",
+    "date": "sale_date",
+    "lastChangeDate": "last_change_date",
+    "warehouseName": "warehouse_name",
+    "supplierArticle": "supplier_article",
+    "nmId": "nm_id",
+    "barcode": "barcode",
+    "subject": "subject",
+    "totalPrice": "total_price",
+    "priceWithDisc": "price_with_disc",
+    "finishedPrice": "finished_price",
+    "forPay": "for_pay",
+    "saleID": "sale_id",
+}
+SALE_COLUMNS = ["user_id"] + list(WB_SALE_FIELDS.values()) + ["warehouse_id"]
+SALE_KEY_COLUMNS = ("user_id", "srid", "sale_date")
+DATETIME_COLUMNS = ("sale_date", "last_change_date")
+PRICE_COLUMNS = ("total_price", "price_with_disc", "finished_price", "for_pay")
+
+# Типы цен (как в настройках отчётов) -> колонки сумм в sales_daily_rollup
+ROLLUP_PRICE_FIELDS = {
+    "totalPrice": "total_price",
+    "priceWithDisc": "price_with_disc",
+    "finishedPrice": "finished_price",
+    "forPay": "for_pay",
+}
+# Типы цен -> колонки цены первой продажи дня в sales_daily_rollup
+ROLLUP_FIRST_PRICE_FIELDS = {wb: f"first_{column}" for wb, column in ROLLUP_PRICE_FIELDS.items()}
+ROLLUP_GROUP_COLUMNS = {
+    "day": SalesDailyRollup.day,
+    "warehouseId": SalesDailyRollup.warehouse_id,
+    "warehouseName": SalesDailyRollup.warehouse_name,
+    "supplierArticle": SalesDailyRollup.supplier_article,
+}
+
+
+def parse_wb_datetime(value) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value)[:19])
+
+
+def as_datetime(value) -> datetime:
+    """date/datetime -> datetime начала дня (календарь отдаёт datetime, быстрые периоды — date)."""
+    if isinstance(value, datetime):
+        return value.replace(hour=0, minute=0, second=0, microsecond=0)
+    return datetime(value.year, value.month, value.day)
+
+
+def sale_row_from_wb(user_id: int, item: dict) -> dict:
+    row = {"user_id": user_id}
+    for wb_key, column in WB_SALE_FIELDS.items():
+        row[column] = item.get(wb_key)
+    for column in DATETIME_COLUMNS:
+        row[column] = parse_wb_datetime(row[column])
+    for column in PRICE_COLUMNS:
+        row[column] = float(row[column] or 0)
+    if row["srid"] is not None:
+        row["srid"] = str(row["srid"])
+    if row["nm_id"] is not None:
+        row["nm_id"] = int(row["nm_id"])
+    return row
+
+
+def sale_to_wb(sale: Sale) -> dict:
+    item = {wb_key: getattr(sale, column) for wb_key, column in WB_SALE_FIELDS.items()}
+    for wb_key in ("date", "lastChangeDate"):
+        item[wb_key] = item[wb_key].isoformat()
+    item["warehouseId"] = sale.warehouse_id
+    return item
+
+
+def _month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+
+def _next_month(value: datetime) -> datetime:
+    return datetime(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+_known_partitions: set[str] = set()
+
+
+async def ensure_sales_partitions(date_min: datetime, date_max: datetime):
+    """Создаёт месячные партиции sales, покрывающие [date_min, date_max]."""
+    month = _month_start(date_min)
+    async with engine.begin() as conn:
+        while month <= date_max:
+            name = f"sales_{month:%Y_%m}"
+            if name not in _known_partitions:
+                await conn.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF sales "
+                    f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{_next_month(month):%Y-%m-%d}')"
+                ))
+                _known_partitions.add(name)
+            month = _next_month(month)
+
+
+_COPY_UPSERT_SQL = (
+    f"INSERT INTO sales ({', '.join(SALE_COLUMNS)}) "
+    f"SELECT DISTINCT ON ({', '.join(SALE_KEY_COLUMNS)}) {', '.join(SALE_COLUMNS)} FROM sales_stage "
+    f"ORDER BY {', '.join(SALE_KEY_COLUMNS)}, last_change_date DESC "
+    f"ON CONFLICT ({', '.join(SALE_KEY_COLUMNS)}) DO UPDATE SET "
+    + ", ".join(f"{c} = EXCLUDED.{c}" for c in SALE_COLUMNS if c not in SALE_KEY_COLUMNS)
+)
+
+# Пересчёт дневных агрегатов только по дням, попавшим в загрузку (в транзакции с COPY)
+_ROLLUP_REFRESH_SQL = (
+    "CREATE TEMP TABLE sales_stage_days ON COMMIT DROP AS "
+    "SELECT DISTINCT user_id, sale_date::date AS day FROM sales_stage",
+    "DELETE FROM sales_daily_rollup r USING sales_stage_days d "
+    "WHERE r.user_id = d.user_id AND r.day = d.day",
+    "INSERT INTO sales_daily_rollup "
+    "(user_id, day, warehouse_name, supplier_article, warehouse_id, "
+    "qty, total_price, price_with_disc, finished_price, for_pay, first_sale_at, "
+    f"{', '.join(ROLLUP_FIRST_PRICE_FIELDS.values())}) "
+    "SELECT s.user_id, s.sale_date::date, COALESCE(s.warehouse_name, ''), COALESCE(s.supplier_article, ''), "
+    "max(s.warehouse_id), count(*), sum(s.total_price), sum(s.price_with_disc), sum(s.finished_price), sum(s.for_pay), "
+    "min(s.sale_date), "
+    + ", ".join(f"(array_agg(s.{c} ORDER BY s.sale_date, s.srid))[1]" for c in ROLLUP_PRICE_FIELDS.values()) + " "
+    "FROM sales s JOIN sales_stage_days d "
+    "ON s.user_id = d.user_id AND s.sale_date >= d.day AND s.sale_date < d.day + 1 "
+    "GROUP BY 1, 2, 3, 4",
+)
+
+
+# Колонки первой продажи для таблицы, созданной до их появления (create_all новые колонки не добавляет)
+_ROLLUP_FIRST_PRICE_DDL = [
+    "ALTER TABLE sales_daily_rollup ADD COLUMN IF NOT EXISTS first_sale_at TIMESTAMP WITHOUT TIME ZONE",
+    *[f"ALTER TABLE sales_daily_rollup ADD COLUMN IF NOT EXISTS {c} DOUBLE PRECISION"
+      for c in ROLLUP_FIRST_PRICE_FIELDS.values()],
+]
+_ROLLUP_FIRST_PRICE_BACKFILL_SQL = (
+    "UPDATE sales_daily_rollup r SET first_sale_at = f.sale_date, "
+    + ", ".join(f"{first} = f.{c}" for c, first in zip(ROLLUP_PRICE_FIELDS.values(), ROLLUP_FIRST_PRICE_FIELDS.values()))
+    + " FROM (SELECT DISTINCT ON (1, 2, 3, 4) s.user_id, s.sale_date::date AS day, "
+    "COALESCE(s.warehouse_name, '') AS warehouse_name, COALESCE(s.supplier_article, '') AS supplier_article, "
+    f"s.sale_date, {', '.join(f's.{c}' for c in ROLLUP_PRICE_FIELDS.values())} "
+    "FROM sales s ORDER BY 1, 2, 3, 4, s.sale_date, s.srid) f "
+    "WHERE r.first_sale_at IS NULL AND r.user_id = f.user_id AND r.day = f.day "
+    "AND r.warehouse_name = f.warehouse_name AND r.supplier_article = f.supplier_article"
+)
+
+
+async def migrate_sales_rollup():
+    """Добавляет колонки первой продажи в sales_daily_rollup и один раз заполняет их по таблице sales."""
+    async with engine.begin() as conn:
+        for sql in _ROLLUP_FIRST_PRICE_DDL:
+            await conn.execute(text(sql))
+        pending = await conn.execute(text("SELECT 1 FROM sales_daily_rollup WHERE first_sale_at IS NULL LIMIT 1"))
+        if pending.first() is None:
+            return
+        logger.info("[SALES] Заполнение цен первой продажи в sales_daily_rollup...")
+        await conn.execute(text(_ROLLUP_FIRST_PRICE_BACKFILL_SQL))
+
+
+async def upsert_sales(user_id: int, items: list[dict]) -> int:
+    """
+    Массовая загрузка продаж: COPY во временную таблицу + один INSERT ... ON CONFLICT DO UPDATE.
+    Без ORM (session.add) — бэкфилл в сотни тысяч строк укладывается в секунды.
+    """
+    rows = [sale_row_from_wb(user_id, item) for item in items if item.get("srid")]
+    if not rows:
+        return 0
+    # Склад определяется один раз здесь — отчёты группируют по warehouse_id без работы со строками
+    index = await get_warehouse_name_index()
+    for row in rows:
+        row["warehouse_id"] = index.get(normalize_warehouse_name(row["warehouse_name"]))
+    await ensure_sales_partitions(
+        min(r["sale_date"] for r in rows),
+        max(r["sale_date"] for r in rows),
+    )
+    records = [tuple(r[c] for c in SALE_COLUMNS) for r in rows]
+
+    async with engine.connect() as conn:
+        raw = await conn.get_raw_connection()
+        driver = raw.driver_connection  # asyncpg.Connection
+        async with driver.transaction():
+            await driver.execute(
+                "CREATE TEMP TABLE sales_stage (LIKE sales INCLUDING DEFAULTS) ON COMMIT DROP"
+            )
+            for i in range(0, len(records), COPY_BATCH_SIZE):
+                await driver.copy_records_to_table(
+                    "sales_stage", records=records[i:i + COPY_BATCH_SIZE], columns=SALE_COLUMNS
+                )
+            await driver.execute(_COPY_UPSERT_SQL)
+            for sql in _ROLLUP_REFRESH_SQL:
+                await driver.execute(sql)
+    logger.info(f"[SALES] user_id={user_id}: загружено {len(records)} строк (COPY)")
+    return len(records)
+
+
+async def load_sales(user_id: int, date_from, date_to) -> list[dict]:
+    """Продажи пользователя с date_from по date_to включительно (по дате продажи)."""
+    start = as_datetime(date_from)
+    end = as_datetime(date_to) + timedelta(days=1)
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(Sale)
+            .where(Sale.user_id == user_id, Sale.sale_date >= start, Sale.sale_date < end)
+            .order_by(Sale.sale_date)
+        )
+        return [sale_to_wb(sale) for sale in result.scalars().all()]
+
+
+async def query_sales_rollup(
+        user_id: int,
+        date_from,
+        date_to,
+        group_by=("warehouseId", "warehouseName", "supplierArticle"),
+        supplier_article=None,
+) -> list[dict]:
+    """
+    Агрегаты продаж за период (GROUP BY по дневным агрегатам на стороне PostgreSQL).
+    Строка результата: поля из group_by + qty и суммы по всем типам цен (totalPrice, priceWithDisc, ...),
+    время первой продажи группы (firstSaleAt) и её цены (totalPriceFirst, priceWithDiscFirst, ...).
+    """
+    group_columns = [ROLLUP_GROUP_COLUMNS[g] for g in group_by]
+    first_sale_at = SalesDailyRollup.first_sale_at
+    stmt = (
+        select(
+            *[col.label(g) for g, col in zip(group_by, group_columns)],
+            func.sum(SalesDailyRollup.qty).label("qty"),
+            *[func.sum(getattr(SalesDailyRollup, c)).label(wb) for wb, c in ROLLUP_PRICE_FIELDS.items()],
+            func.min(first_sale_at).label("firstSaleAt"),
+            *[
+                array_agg(aggregate_order_by(getattr(SalesDailyRollup, c), first_sale_at))[1].label(f"{wb}First")
+                for wb, c in ROLLUP_FIRST_PRICE_FIELDS.items()
+            ],
+        )
+        .where(
+            SalesDailyRollup.user_id == user_id,
+            SalesDailyRollup.day >= as_datetime(date_from).date(),
+            SalesDailyRollup.day <= as_datetime(date_to).date(),
+        )
+        .group_by(*group_columns)
+        .order_by(*group_columns)
+    )
+    if supplier_article is not None:
+        stmt = stmt.where(SalesDailyRollup.supplier_article == str(supplier_article))
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(stmt)
+        return [dict(row) for row in result.mappings().all()]
+
+
+async def get_sales_sync_state(user_id: int):
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(SalesSyncState).where(SalesSyncState.user_id == user_id)
+        )
+        return result.scalar_one_or_none()
+
+
+async def set_sales_sync_state(user_id: int, synced_from: datetime, last_change_date: datetime):
+    values = {
+        "user_id": user_id,
+        "synced_from": synced_from,
+        "last_change_date": last_change_date,
+        "synced_at": datetime.utcnow(),
+    }
+    async with AsyncSessionLocal() as session:
+        stmt = insert(SalesSyncState).values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[SalesSyncState.user_id],
+            set_={k: v for k, v in values.items() if k != "user_id"},
+        )
+        await session.execute(stmt)
+        await session.commit()
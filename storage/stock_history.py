@@ -0,0 +1,117 @@
+"""
+storage/stock_history.py
+
+История остатков: WB её не хранит, поэтому фиксируем изменения при каждой синхронизации (bot/services/stock_sync.py).
+- Дельты (stock_history_deltas): на (пользователь, день, артикул, склад) — сумма изменений quantity за день,
+  только ненулевые; повторная синхронизация в тот же день складывается с уже записанной дельтой.
+- Контрольные точки (stock_history_checkpoints): полный снимок на начало дня, zlib(JSON), не чаще
+  раза в STOCK_HISTORY_CHECKPOINT_DAYS дней.
+- Снимок на конец дня D = последняя контрольная точка не позже D + сумма дельт с её дня по D
+  (одна строка снимка и один GROUP BY по дельтам).
+"""
+
+import json
+import zlib
+from datetime import date, timedelta
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.future import select
+from sqlalchemy.dialects.postgresql import insert
+
+from .db import AsyncSessionLocal
+from .models import StockHistoryDelta, StockHistoryCheckpoint
+
+# ~5 параметров на строку, лимит asyncpg — 32767 параметров на запрос
+DELTA_BATCH_SIZE = 5000
+
+
+def _pack(quantities: dict[tuple, int]) -> bytes:
+    merged: dict[tuple, int] = {}
+    for (art, wh), qty in quantities.items():
+        merged[(art or "", wh or "")] = merged.get((art or "", wh or ""), 0) + qty
+    rows = [[art, wh, qty] for (art, wh), qty in sorted(merged.items()) if qty]
+    return zlib.compress(json.dumps(rows, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def _unpack(payload: bytes) -> dict[tuple, int]:
+    return {(art, wh): qty for art, wh, qty in json.loads(zlib.decompress(payload))}
+
+
+async def record_stock_deltas(user_id: int, day: date, deltas: dict[tuple, int]):
+    """Добавляет изменения остатков за день: {(артикул, склад): delta}."""
+    rows = [
+        {"user_id": user_id, "day": day, "supplier_article": art or "", "warehouse_name": wh or "", "delta": delta}
+        for (art, wh), delta in deltas.items() if delta
+    ]
+    if not rows:
+        return
+    async with AsyncSessionLocal() as session:
+        for i in range(0, len(rows), DELTA_BATCH_SIZE):
+            stmt = insert(StockHistoryDelta).values(rows[i:i + DELTA_BATCH_SIZE])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["user_id", "day", "supplier_article", "warehouse_name"],
+                set_={"delta": StockHistoryDelta.delta + stmt.excluded.delta},
+            )
+            await session.execute(stmt)
+        await session.commit()
+
+
+async def get_last_checkpoint_day(user_id: int) -> Optional[date]:
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(func.max(StockHistoryCheckpoint.day)).where(StockHistoryCheckpoint.user_id == user_id)
+        )
+        return result.scalar()
+
+
+async def save_stock_checkpoint(user_id: int, day: date, quantities: dict[tuple, int]):
+    """Полный снимок остатков на начало дня day: {(артикул, склад): остаток}."""
+    values = {"user_id": user_id, "day": day, "payload": _pack(quantities)}
+    async with AsyncSessionLocal() as session:
+        stmt = insert(StockHistoryCheckpoint).values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[StockHistoryCheckpoint.user_id, StockHistoryCheckpoint.day],
+            set_={"payload": values["payload"]},
+        )
+        await session.execute(stmt)
+        await session.commit()
+
+
+async def load_stock_snapshot(user_id: int, day: date) -> Optional[dict[tuple, int]]:
+    """
+    Остатки на конец дня day: {(артикул, склад): остаток}, только ненулевые.
+    None — история на эту дату ещё не велась (нет контрольной точки не позже day).
+    """
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(StockHistoryCheckpoint.day, StockHistoryCheckpoint.payload)
+            .where(StockHistoryCheckpoint.user_id == user_id, StockHistoryCheckpoint.day <= day)
+            .order_by(StockHistoryCheckpoint.day.desc())
+            .limit(1)
+        )
+        checkpoint = result.first()
+        if checkpoint is None:
+            return None
+        quantities = _unpack(checkpoint.payload)
+
+        result = await session.execute(
+            select(
+                StockHistoryDelta.supplier_article,
+                StockHistoryDelta.warehouse_name,
+                func.sum(StockHistoryDelta.delta),
+            )
+            .where(
+                StockHistoryDelta.user_id == user_id,
+                StockHistoryDelta.day >= checkpoint.day,
+                StockHistoryDelta.day <= day,
+            )
+            .group_by(StockHistoryDelta.supplier_article, StockHistoryDelta.warehouse_name)
+        )
+        for art, wh, delta in result.all():
+            quantities[(art, wh)] = quantities.get((art, wh), 0) + int(delta)
+    return {key: qty for key, qty in quantities.items() if qty}
+
+
+def checkpoint_due(last_checkpoint: Optional[date], today: date, every_days: int) -> bool:
+    return last_checkpoint is None or last_checkpoint <= today - timedelta(days=every_days)
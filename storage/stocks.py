@@ -0,0 +1,155 @@
+"""
+storage/stocks.py
+
+Локальное состояние остатков Wildberries (таблица stocks) и состояние их синхронизации.
+- upsert_stocks: строки /supplier/stocks по ключу (user_id, nmId, баркод, склад) — INSERT ... ON CONFLICT,
+  изменённая строка перезаписывает прежнюю; возвращает изменения остатка по (артикул, склад) для истории
+  (storage/stock_history.py).
+- current_stock_quantities: текущие остатки по (артикул, склад) — для контрольных точек истории.
+- load_stocks: текущие остатки пользователя из базы в формате строк WB API (как их ждут отчёты).
+- get/set_stock_sync_state: high-water mark по lastChangeDate для инкрементальной синхронизации.
+"""
+
+from datetime import datetime
+
+import logging
+
+from sqlalchemy import func, tuple_
+from sqlalchemy.future import select
+from sqlalchemy.dialects.postgresql import insert
+
+from .db import AsyncSessionLocal
+from .models import Stock, StockSyncState
+from .sales import parse_wb_datetime
+
+logger = logging.getLogger(__name__)
+
+# ~10 параметров на строку, лимит asyncpg — 32767 параметров на запрос
+UPSERT_BATCH_SIZE = 2000
+
+# Поля строки WB API -> колонки таблицы stocks
+WB_STOCK_FIELDS = {
+    "nmId": "nm_id",
+    "barcode": "barcode",
+    "warehouseName": "warehouse_name",
+    "supplierArticle": "supplier_article",
+    "subject": "subject",
+    "quantity": "quantity",
+    "quantityFull": "quantity_full",
+    "inWayToClient": "in_way_to_client",
+    "inWayFromClient": "in_way_from_client",
+    "lastChangeDate": "last_change_date",
+}
+STOCK_KEY_COLUMNS = ("user_id", "nm_id", "barcode", "warehouse_name")
+QUANTITY_COLUMNS = ("quantity", "quantity_full", "in_way_to_client", "in_way_from_client")
+
+
+def stock_row_from_wb(user_id: int, item: dict) -> dict:
+    row = {"user_id": user_id}
+    for wb_key, column in WB_STOCK_FIELDS.items():
+        row[column] = item.get(wb_key)
+    row["nm_id"] = int(row["nm_id"])
+    row["barcode"] = str(row["barcode"] or "")
+    row["warehouse_name"] = row["warehouse_name"] or ""
+    row["last_change_date"] = parse_wb_datetime(row["last_change_date"])
+    for column in QUANTITY_COLUMNS:
+        row[column] = int(row[column] or 0)
+    return row
+
+
+def stock_to_wb(stock: Stock) -> dict:
+    item = {wb_key: getattr(stock, column) for wb_key, column in WB_STOCK_FIELDS.items()}
+    item["lastChangeDate"] = item["lastChangeDate"].isoformat()
+    return item
+
+
+async def upsert_stocks(user_id: int, items: list[dict]) -> dict[tuple, int]:
+    """
+    Применяет изменённые строки остатков. Строки без nmId пропускаются; повтор строки в выгрузке —
+    берётся самая поздняя по lastChangeDate.
+    Возвращает изменения quantity по (артикул, склад): {(supplier_article, warehouse_name): delta}, без нулевых.
+    """
+    latest: dict[tuple, dict] = {}
+    for item in items:
+        if item.get("nmId") is None:
+            continue
+        row = stock_row_from_wb(user_id, item)
+        key = tuple(row[c] for c in STOCK_KEY_COLUMNS)
+        if key not in latest or latest[key]["last_change_date"] <= row["last_change_date"]:
+            latest[key] = row
+    rows = list(latest.values())
+    if not rows:
+        return {}
+
+    deltas: dict[tuple, int] = {}
+    async with AsyncSessionLocal() as session:
+        for i in range(0, len(rows), UPSERT_BATCH_SIZE):
+            chunk = rows[i:i + UPSERT_BATCH_SIZE]
+            # Прежние остатки этих строк — до перезаписи, в той же транзакции
+            previous = await session.execute(
+                select(Stock.supplier_article, Stock.warehouse_name, Stock.quantity).where(
+                    Stock.user_id == user_id,
+                    tuple_(Stock.nm_id, Stock.barcode, Stock.warehouse_name).in_(
+                        [(r["nm_id"], r["barcode"], r["warehouse_name"]) for r in chunk]
+                    ),
+                )
+            )
+            for art, wh, qty in previous.all():
+                deltas[(art, wh)] = deltas.get((art, wh), 0) - qty
+            for r in chunk:
+                key = (r["supplier_article"], r["warehouse_name"])
+                deltas[key] = deltas.get(key, 0) + r["quantity"]
+
+            stmt = insert(Stock).values(chunk)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=list(STOCK_KEY_COLUMNS),
+                set_={c: stmt.excluded[c] for c in WB_STOCK_FIELDS.values() if c not in STOCK_KEY_COLUMNS},
+            )
+            await session.execute(stmt)
+        await session.commit()
+    logger.info(f"[STOCKS] user_id={user_id}: применено {len(rows)} изменённых строк")
+    return {key: delta for key, delta in deltas.items() if delta}
+
+
+async def load_stocks(user_id: int) -> list[dict]:
+    """Текущие остатки пользователя (все строки, включая нулевые) в формате /supplier/stocks."""
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(Stock).where(Stock.user_id == user_id).order_by(Stock.warehouse_name, Stock.supplier_article)
+        )
+        return [stock_to_wb(stock) for stock in result.scalars().all()]
+
+
+async def current_stock_quantities(user_id: int) -> dict[tuple, int]:
+    """Текущие ненулевые остатки пользователя по (артикул, склад)."""
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(Stock.supplier_article, Stock.warehouse_name, func.sum(Stock.quantity))
+            .where(Stock.user_id == user_id)
+            .group_by(Stock.supplier_article, Stock.warehouse_name)
+        )
+        return {(art, wh): int(qty) for art, wh, qty in result.all() if qty}
+
+
+async def get_stock_sync_state(user_id: int):
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(StockSyncState).where(StockSyncState.user_id == user_id)
+        )
+        return result.scalar_one_or_none()
+
+
+async def set_stock_sync_state(user_id: int, last_change_date: datetime):
+    values = {
+        "user_id": user_id,
+        "last_change_date": last_change_date,
+        "synced_at": datetime.utcnow(),
+    }
+    async with AsyncSessionLocal() as session:
+        stmt = insert(StockSyncState).values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[StockSyncState.user_id],
+            set_={k: v for k, v in values.items() if k != "user_id"},
+        )
+        await session.execute(stmt)
+        await session.commit()
@@ -89,6 +89,16 @@ async def daily_balance_update():
             logger.exception("daily_balance_update: failed for user_id=%s: %s", uid, e)
 
 
+# Пользователи для фоновой предзагрузки данных WB (активный доступ + API-ключ)
+async def get_active_users_with_api_key() -> List[tuple[int, str]]:
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(UserAccess).where(UserAccess.api_key.isnot(None))
+        )
+        users = result.scalars().all()
+    return [(u.user_id, u.api_key) for u in users if u.api_key and has_active_access(u)]
+
+
 # Пополнение баланса
 async def add_balance(user_id: int, amount: int):
     async with AsyncSessionLocal() as session:
@@ -6,14 +6,37 @@ storage/warehouses.py
 - Кэш обновляется не чаще, чем раз в 12 часов (по API любого пользователя).
 - Любой пользователь может инициировать обновление при входе, если кэш устарел.
 - Хранится информация о времени и пользователе, который обновил кэш.
+- Вместе с кэшем пересобирается индекс «нормализованное название -> ID склада» (warehouse_name_index):
+  продажи получают ID склада при загрузке, а не сравнением строк в отчётах.
+- При пересборке индекса продажам без ID склада (склад был неизвестен на момент загрузки) он проставляется.
+- Индекс в памяти процесса перечитывается из БД раз в NAME_INDEX_TTL: кэш складов могли обновить в другом процессе.
 """
 
+import time
+
 from sqlalchemy.future import select
 from sqlalchemy import delete, func
 from datetime import datetime, timedelta
 from .db import AsyncSessionLocal
-from .models import Warehouse, WarehouseCacheInfo
+from .models import Warehouse, WarehouseCacheInfo, WarehouseNameIndex
 from sqlalchemy import text
+from bot.utils.text_utils import normalize_warehouse_name
+
+NAME_INDEX_TTL = 600  # сек. жизни индекса названий в памяти процесса
+
+# Индекс названий в памяти процесса (загружается из БД при первом обращении и по истечении TTL)
+_name_index: dict[str, int] | None = None
+_name_index_loaded_at = 0.0
+
+# Продажи, загруженные до появления склада в индексе: ID проставляется при его пересборке
+_UNTAGGED_NAMES_SQL = text(
+    "SELECT DISTINCT warehouse_name FROM sales WHERE warehouse_id IS NULL AND warehouse_name IS NOT NULL"
+)
+_RETAG_SQL = [
+    text(f"UPDATE {table} SET warehouse_id = :warehouse_id "
+         "WHERE warehouse_id IS NULL AND warehouse_name = :warehouse_name")
+    for table in ("sales", "sales_daily_rollup")
+]
 
 async def get_last_warehouses_update():
     async with AsyncSessionLocal() as session:
@@ -37,10 +60,46 @@ async def cache_warehouses(warehouses: list, updated_by: int = None):
                 updated_at=now
             )
             session.add(wh)
+        index = build_warehouse_name_index(warehouses)
+        await session.execute(delete(WarehouseNameIndex))
+        for name_norm, warehouse_id in index.items():
+            session.add(WarehouseNameIndex(name_norm=name_norm, warehouse_id=warehouse_id))
+        await retag_untagged_sales(session, index)
         await session.commit()
+    global _name_index, _name_index_loaded_at
+    _name_index = index
+    _name_index_loaded_at = time.monotonic()
     if updated_by is not None:
         await set_cache_update_info(updated_by)
 
+def build_warehouse_name_index(warehouses: list) -> dict[str, int]:
+    """Склады из API WB ({"ID", "name"}) -> {нормализованное название: ID}; при совпадении — первый."""
+    index = {}
+    for w in warehouses:
+        name_norm = normalize_warehouse_name(w.get("name"))
+        if name_norm and w.get("ID") is not None:
+            index.setdefault(name_norm, w.get("ID"))
+    return index
+
+async def retag_untagged_sales(session, index: dict[str, int]):
+    """Проставляет warehouse_id продажам (и их дневным агрегатам), у которых его нет, по новому индексу."""
+    result = await session.execute(_UNTAGGED_NAMES_SQL)
+    for name in result.scalars().all():
+        warehouse_id = index.get(normalize_warehouse_name(name))
+        if warehouse_id is None:
+            continue
+        for sql in _RETAG_SQL:
+            await session.execute(sql, {"warehouse_id": warehouse_id, "warehouse_name": name})
+
+async def get_warehouse_name_index() -> dict[str, int]:
+    global _name_index, _name_index_loaded_at
+    if _name_index is None or time.monotonic() - _name_index_loaded_at > NAME_INDEX_TTL:
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(select(WarehouseNameIndex))
+            _name_index = {row.name_norm: row.warehouse_id for row in result.scalars().all()}
+        _name_index_loaded_at = time.monotonic()
+    return _name_index
+
 async def get_cached_warehouses():
     async with AsyncSessionLocal() as session:
         result = await session.execute(select(Warehouse))